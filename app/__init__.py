@@ -13,6 +13,20 @@ def create_app():
     db.init_app(app)
     migrate.init_app(app, db)
     
+    # 文档写入flush前同步标签关联表，提交后把增量同步到各个索引
+    from app.services.index_sync import index_sync
+    from app.services.search_service import search_service
+    from app.services.count_cache import count_cache
+    from app.services.tag_sync import tag_sync
+    from app.services.ai.semantic_service import semantic_service
+    from app.services.ai.recommendation_service import recommendation_service
+    tag_sync.install(db.session)
+    index_sync.install(db.session)
+    index_sync.register(search_service)
+    index_sync.register(count_cache)
+    index_sync.register(semantic_service)
+    index_sync.register(recommendation_service)
+    
     # 注册蓝图 - 清晰的分离
     from app.routes_home import home_bp          # 主页/看板
     from app.routes import main_bp               # 主要API
@@ -25,6 +39,10 @@ def create_app():
     app.register_blueprint(ai_bp, url_prefix='/api/ai')     # AI API
     app.register_blueprint(document_ai_bp, url_prefix='/api/ai')  # 文档AI API
     
+    # 命令行任务（flask recommendations ...）
+    from app.cli import recommendations_cli
+    app.cli.add_command(recommendations_cli)
+    
     # 使用应用上下文进行AI服务初始化
     with app.app_context():
         try:
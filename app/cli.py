@@ -0,0 +1,32 @@
+"""
+命令行任务
+flask recommendations build-neighbors   全量计算相似文档表
+flask recommendations refresh-neighbors 只重算变化的文档（可由cron定时执行，同一时间只应运行一个实例）
+"""
+import time
+
+import click
+from flask.cli import AppGroup
+
+recommendations_cli = AppGroup('recommendations', help='内容推荐的维护任务')
+
+def _update_neighbors(full):
+    from app.services.ai.recommendation_service import recommendation_service
+    
+    neighbors = recommendation_service.neighbors
+    if not neighbors.tables_exist():
+        raise click.ClickException('相似文档表不存在，请先执行 flask db upgrade')
+    
+    started = time.time()
+    count = recommendation_service.update_neighbor_table(full=full)
+    click.echo(f"相似文档表{'全量计算' if full else '刷新'}完成: 重算 {count} 个文档，耗时 {time.time() - started:.1f} 秒")
+
+@recommendations_cli.command('build-neighbors')
+def build_neighbors():
+    """重算全部文档的相似文档（逐块替换，期间推荐仍可查表）"""
+    _update_neighbors(full=True)
+
+@recommendations_cli.command('refresh-neighbors')
+def refresh_neighbors():
+    """只重算变化过的文档及受其影响的文档"""
+    _update_neighbors(full=False)
@@ -12,9 +12,39 @@ class Config:
     MYSQL_PASSWORD = os.environ.get('MYSQL_PASSWORD') or '2022fjm'
     MYSQL_DB = os.environ.get('MYSQL_DB') or 'knowledge_mgmt'
     
-    SQLALCHEMY_DATABASE_URI = f'mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}'
+    # 设置 DATABASE_URL 可切换数据库（如单机运行和压测使用 sqlite:///knowledge.db）
+    SQLALCHEMY_DATABASE_URI = (
+        os.environ.get('DATABASE_URL') or
+        f'mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}'
+    )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # 搜索后端: like - 数据库LIKE匹配, index - 进程内倒排索引,
+    #          mysql_fulltext - MySQL全文索引, sqlite_fts5 - SQLite FTS5（trigram）
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND') or 'index'
+    
+    # 计数缓存：文档数超过阈值时LIKE检索的总数改为抽样估算（标记approximate）
+    COUNT_EXACT_THRESHOLD = int(os.environ.get('COUNT_EXACT_THRESHOLD') or 50000)
+    COUNT_CACHE_TTL = 300  # 秒
+    
+    # 倒排索引段目录：设置后 index 后端把索引持久化为段文件，启动时映射加载并与数据库对齐，
+    # 不再全量重建。多个工作进程可共享同一目录：持有目录锁的进程落盘和合并，其余进程只读映射，
+    # 清单变化时重新载入，两次载入之间只把本进程提交的变更留在内存中
+    SEARCH_INDEX_DIR = os.environ.get('SEARCH_INDEX_DIR') or None
+    SEARCH_INDEX_FLUSH_INTERVAL = 60  # 秒，内存段定期落盘（写入者落盘前从数据库补齐其他进程的变更）
+    SEARCH_INDEX_RELOAD_INTERVAL = 5  # 秒，只读进程检查清单是否变化的最短间隔
+    SEARCH_INDEX_FLUSH_DOCS = 1000  # 内存段达到该文档数时提前落盘
+    SEARCH_INDEX_MERGE_FACTOR = 4  # 连续的同层段达到该数量时合并
+    
+    # 相似文档表：为每个文档预先计算的相似文档数。表由命令行任务维护（迁移之后执行）：
+    # flask recommendations build-neighbors 全量计算，refresh-neighbors 只重算变化的文档（可由cron定时执行）
+    RECOMMENDATION_NEIGHBORS = 20
+    
+    # 内容推荐的近似最近邻索引：文档数达到该值才建立（否则精确计算），
+    # 每张哈希表额外查看的相邻桶数（越大召回率越高、越慢）
+    RECOMMENDATION_ANN_MIN_DOCUMENTS = 5000
+    RECOMMENDATION_ANN_PROBES = 4
+    
     # Redis配置 - 修复密码问题
     REDIS_PASSWORD = os.environ.get('REDIS_PASSWORD') or 'yourpassword'
     REDIS_URL = f'redis://:{REDIS_PASSWORD}@localhost:6379/0'
@@ -2,6 +2,14 @@ from app import db
 from datetime import datetime
 import json
 
+# 文档-标签关联表，tags JSON 列的规范化副本，用于按标签过滤和统计（见 services/tag_sync.py）
+document_tags = db.Table(
+    'document_tags',
+    db.Column('document_id', db.Integer, db.ForeignKey('documents.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('idx_document_tags_tag', 'tag_id')
+)
+
 class Document(db.Model):
     __tablename__ = 'documents'
     
@@ -10,7 +18,7 @@ class Document(db.Model):
     content = db.Column(db.Text, nullable=False)
     file_type = db.Column(db.String(50), default='text')
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'))
-    tags = db.Column(db.JSON)  # 存储标签列表
+    tags = db.Column(db.JSON)  # 存储标签列表（接口返回的标签以此为准）
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -18,6 +26,11 @@ class Document(db.Model):
     __table_args__ = (
         db.Index('idx_document_created', 'created_at'),
         db.Index('idx_document_category', 'category_id'),
+        # 全文索引（ngram分词器）仅在MySQL上创建，见迁移 0e991c142a0e
+        db.Index(
+            'idx_document_fulltext', 'title', 'content',
+            mysql_prefix='FULLTEXT', mysql_with_parser='ngram'
+        ).ddl_if(dialect='mysql'),
     )
     
     def to_dict(self):
@@ -39,9 +52,55 @@ class Document(db.Model):
         
         return data
     
+    # 规范化的标签关联，随 tags 列在flush前同步
+    tag_items = db.relationship('Tag', secondary=document_tags, lazy='select', backref='documents')
+    
     def __repr__(self):
         return f'<Document {self.id}: {self.title}>'
 
+class DocumentNeighbor(db.Model):
+    """文档的相似文档（预先计算的top-k，见 services/ai/neighbor_job.py）"""
+    __tablename__ = 'document_neighbors'
+    
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)  # 0为最相似
+    neighbor_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='CASCADE'), nullable=False)
+    similarity = db.Column(db.Float, nullable=False)
+    
+    __table_args__ = (
+        # 文档变化时查找把它列为邻居的文档
+        db.Index('idx_document_neighbors_neighbor', 'neighbor_id'),
+    )
+    
+    def __repr__(self):
+        return f'<DocumentNeighbor {self.document_id}#{self.rank}: {self.neighbor_id}>'
+
+class DocumentNeighborState(db.Model):
+    """文档邻居的计算状态：document_updated_at 与文档当前的 updated_at 相同时表中的邻居可用"""
+    __tablename__ = 'document_neighbor_states'
+    
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='CASCADE'), primary_key=True)
+    document_updated_at = db.Column(db.DateTime)  # 计算时文档的 updated_at
+    computed_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<DocumentNeighborState {self.document_id}: {self.document_updated_at}>'
+
+class Tag(db.Model):
+    __tablename__ = 'tags'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)  # 首次出现时的写法
+    normalized = db.Column(db.String(100), unique=True, nullable=False)  # 去空白、小写
+    
+    @staticmethod
+    def normalize(name):
+        """标签的规范化形式，大小写不同的标签视为同一个"""
+        return str(name).strip().lower()[:100]
+    
+    def __repr__(self):
+        return f'<Tag {self.id}: {self.name}>'
+
 class Category(db.Model):
     __tablename__ = 'categories'
     
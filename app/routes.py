@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify
 from app import db
 from app.models import Document, Category
-from app.utils.helpers import validate_document_data, validate_ids, format_response
+from app.utils.helpers import validate_document_data, validate_ids, format_response, encode_cursor, decode_cursor
+from app.services.count_cache import count_cache
+from app.services.search import QuerySyntaxError
 from datetime import datetime
 import json
 
@@ -37,9 +39,16 @@ def get_documents():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
     
+    # 游标分页：传入cursor参数（首页传空值）时按 (created_at, id) 翻页，不再使用OFFSET
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        return _get_documents_by_cursor(cursor, per_page)
+    
+    # 总数走计数缓存，分页本身不再执行 COUNT(*)
     documents = Document.query.order_by(Document.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
+        page=page, per_page=per_page, error_out=False, count=False
     )
+    documents.total = count_cache.document_total()
     
     return jsonify({
         'documents': [doc.to_dict() for doc in documents.items],
@@ -48,6 +57,31 @@ def get_documents():
         'current_page': page
     })
 
+def _get_documents_by_cursor(cursor, per_page):
+    """按游标获取文档列表，total仅在 include_total=true 时计算"""
+    from app.services.search.backends.base import keyset_page
+    
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if after is None:
+            return jsonify({'error': '无效的分页游标'}), 400
+    
+    if per_page < 1 or per_page > 100:
+        per_page = 10
+    
+    documents, has_more = keyset_page(Document.query, after, per_page, 'date_desc')
+    
+    response = {
+        'documents': [doc.to_dict() for doc in documents],
+        'next_cursor': encode_cursor(documents[-1].created_at, documents[-1].id) if has_more else None,
+        'has_more': has_more
+    }
+    if request.args.get('include_total', 'false').lower() in ('1', 'true'):
+        response['total'] = count_cache.document_total()
+    
+    return jsonify(response)
+
 @main_bp.route('/api/documents', methods=['POST'])
 def create_document():
     """创建新文档（原有接口，保持兼容）"""
@@ -79,7 +113,7 @@ def create_document():
             'message': '文档创建成功',
             'document': document.to_dict()
         }), 201
-        
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'创建文档失败: {str(e)}'}), 500
@@ -153,7 +187,7 @@ def update_document(doc_id):
                 'message': '文档内容未变化',
                 'document': document.to_dict()
             })
-        
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'更新文档失败: {str(e)}'}), 500
@@ -171,7 +205,7 @@ def delete_document(doc_id):
             'message': '文档删除成功',
             'deleted_id': doc_id
         })
-        
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'删除文档失败: {str(e)}'}), 500
@@ -213,7 +247,7 @@ def batch_delete_documents():
             response_data['warning'] = f'以下ID未找到: {list(not_found_ids)}'
         
         return jsonify(response_data)
-        
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'批量删除失败: {str(e)}'}), 500
@@ -225,7 +259,8 @@ def advanced_search():
         query = request.args.get('q', '')
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
-        sort_by = request.args.get('sort_by', 'relevance')
+        # 未指定时页码分页按相关度排序，游标分页按时间倒序
+        sort_by = request.args.get('sort_by')
         search_mode = request.args.get('search_mode', 'or')
         
         # 验证参数
@@ -236,17 +271,53 @@ def advanced_search():
         if search_mode not in ['or', 'and']:
             search_mode = 'or'
         
+        # 拼写容错默认开启，fuzzy=false 时只做精确匹配
+        fuzzy = request.args.get('fuzzy', 'true').lower() not in ('0', 'false')
+        
         from app.services.search_service import search_service
+        
+        # 游标分页：传入cursor参数（首页传空值）时按 (created_at, id) 翻页
+        cursor = request.args.get('cursor')
+        if cursor is not None:
+            from app.services.search import KEYSET_SORTS
+            
+            sort_by = sort_by or 'date_desc'
+            if sort_by not in KEYSET_SORTS:
+                return jsonify({'error': f'游标分页仅支持以下排序方式: {", ".join(KEYSET_SORTS)}'}), 400
+            
+            after = None
+            if cursor:
+                after = decode_cursor(cursor)
+                if after is None:
+                    return jsonify({'error': '无效的分页游标'}), 400
+            
+            search_result = search_service.search_by_cursor(
+                query=query,
+                after=after,
+                per_page=per_page,
+                sort_by=sort_by,
+                search_mode=search_mode,
+                include_total=request.args.get('include_total', 'false').lower() in ('1', 'true'),
+                fuzzy=fuzzy
+            )
+            return jsonify(search_result)
+        
         search_result = search_service.advanced_search(
             query=query,
             page=page,
             per_page=per_page,
-            sort_by=sort_by,
-            search_mode=search_mode
+            sort_by=sort_by or 'relevance',
+            search_mode=search_mode,
+            explain=request.args.get('explain', 'false').lower() in ('1', 'true'),
+            facets=request.args.get('facets', 'false').lower() in ('1', 'true'),
+            fuzzy=fuzzy
         )
         
         return jsonify(search_result)
-        
+    
+    except QuerySyntaxError as e:
+        return jsonify({'error': f'查询语法错误: {str(e)}', 'query': request.args.get('q', '')}), 400
+    
     except Exception as e:
         return jsonify({
             'error': f'搜索失败: {str(e)}',
@@ -274,7 +345,7 @@ def search_suggestions():
             'query': query,
             'suggestions': suggestions
         })
-        
+    
     except Exception as e:
         return jsonify({
             'error': f'获取搜索建议失败: {str(e)}',
@@ -287,15 +358,16 @@ def search_stats():
     try:
         from app.models import Document, Category
         
-        total_documents = Document.query.count()
+        total_documents = count_cache.document_total()
         total_categories = Category.query.count()
         
-        # 最近7天创建的文档（示例）
+        # 最近7天创建的文档（示例），缓存有效期内时间窗口的漂移可以忽略
         from datetime import datetime, timedelta
         week_ago = datetime.utcnow() - timedelta(days=7)
-        recent_documents = Document.query.filter(
-            Document.created_at >= week_ago
-        ).count()
+        recent_documents, _ = count_cache.get_or_count(
+            ('recent_documents', 7),
+            Document.query.filter(Document.created_at >= week_ago).count
+        )
         
         return jsonify({
             'total_documents': total_documents,
@@ -303,7 +375,7 @@ def search_stats():
             'recent_documents_7d': recent_documents,
             'last_updated': datetime.utcnow().isoformat()
         })
-        
+    
     except Exception as e:
         return jsonify({
             'error': f'获取统计信息失败: {str(e)}'
@@ -336,11 +408,33 @@ def create_category():
             'message': '分类创建成功',
             'category': category.to_dict()
         }), 201
-        
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'创建分类失败: {str(e)}'}), 500
 
+@main_bp.route('/api/tags', methods=['GET'])
+def get_tags():
+    """标签使用频率（按 document_tags 关联表的 tag_id 索引分组计数）"""
+    from sqlalchemy import func
+    from app.models import Tag, document_tags
+    
+    limit = request.args.get('limit', 50, type=int)
+    if limit < 1 or limit > 500:
+        limit = 50
+    
+    document_count = func.count(document_tags.c.document_id).label('document_count')
+    rows = db.session.query(Tag.id, Tag.name, document_count).join(
+        document_tags, document_tags.c.tag_id == Tag.id
+    ).group_by(Tag.id, Tag.name).order_by(document_count.desc(), Tag.id).limit(limit).all()
+    
+    return jsonify({
+        'tags': [
+            {'id': row.id, 'name': row.name, 'document_count': row.document_count}
+            for row in rows
+        ]
+    })
+
 @main_bp.route('/api/search')
 def search_documents():
     """简单搜索文档"""
@@ -8,6 +8,7 @@ from app.services.ai import (
     recommendation_service,
     ai_management
 )
+from app.services.ai.ann_index import MAX_PROBES
 from datetime import datetime
 import logging
 
@@ -107,7 +108,7 @@ def create_document_with_ai():
             'document': document.to_dict(),
             'ai_processing': ai_results
         }), 201
-        
+    
     except Exception as e:
         db.session.rollback()
         logger.error(f"AI辅助创建文档失败: {e}")
@@ -156,7 +157,7 @@ def get_ai_suggestions(doc_id):
                 'tagging_count': tagging_result.get('tags_count', 0)
             }
         })
-        
+    
     except Exception as e:
         logger.error(f"获取AI建议失败: {e}")
         return jsonify({'error': f'获取AI建议失败: {str(e)}'}), 500
@@ -226,7 +227,7 @@ def apply_ai_suggestions(doc_id):
                 'tags': tagging_result.get('tags', [])
             }
         })
-        
+    
     except Exception as e:
         db.session.rollback()
         logger.error(f"应用AI建议失败: {e}")
@@ -247,11 +248,22 @@ def get_document_recommendations(doc_id):
             'document_id': doc_id,
             'recommendations': recommendation_result
         })
-        
+    
     except Exception as e:
         logger.error(f"获取文档推荐失败: {e}")
         return jsonify({'error': f'获取推荐失败: {str(e)}'}), 500
 
+def _valid_probes(value):
+    """probes 须为 0 到 MAX_PROBES 之间的整数"""
+    return isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= MAX_PROBES
+
+# 语义搜索单次返回的最大结果数
+MAX_SEMANTIC_TOP_K = 100
+
+def _valid_top_k(value):
+    """top_k 须为 1 到 MAX_SEMANTIC_TOP_K 之间的整数"""
+    return isinstance(value, int) and not isinstance(value, bool) and 1 <= value <= MAX_SEMANTIC_TOP_K
+
 @ai_bp.route('/api/ai/recommend/by-content', methods=['POST'])
 def recommend_by_content():
     """基于内容推荐文档"""
@@ -262,21 +274,44 @@ def recommend_by_content():
         
         content = data['content']
         top_k = data.get('top_k', 5)
+        probes = data.get('probes')
+        if probes is not None and not _valid_probes(probes):
+            return jsonify({'error': f'probes 应为 0 到 {MAX_PROBES} 之间的整数'}), 400
         
         recommendation_result = recommendation_service.recommend_by_content(
             content=content,
-            top_k=top_k
+            top_k=top_k,
+            probes=probes
         )
         
         return jsonify({
             'query_content': content[:100] + '...' if len(content) > 100 else content,
             'recommendations': recommendation_result
         })
-        
+    
     except Exception as e:
         logger.error(f"基于内容推荐失败: {e}")
         return jsonify({'error': f'推荐失败: {str(e)}'}), 500
 
+@ai_bp.route('/api/ai/recommend/ann-report', methods=['GET'])
+def recommendation_ann_report():
+    """近似最近邻索引的召回率与耗时报告（与精确计算对比）"""
+    try:
+        sample = min(request.args.get('sample', 100, type=int), 1000)
+        top_k = request.args.get('top_k', 10, type=int)
+        probes = request.args.get('probes')
+        probes = tuple(int(value) for value in probes.split(',')) if probes else (0, 1, 2, 4, 8)
+        if not probes or len(probes) > 10 or not all(_valid_probes(value) for value in probes):
+            raise ValueError(probes)
+        
+        return jsonify(recommendation_service.ann_report(sample=sample, top_k=top_k, probes=probes))
+    
+    except ValueError:
+        return jsonify({'error': f'probes 应为逗号分隔的整数（0 到 {MAX_PROBES}，最多10个）'}), 400
+    except Exception as e:
+        logger.error(f"生成近似索引报告失败: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @ai_bp.route('/api/ai/semantic/similarity', methods=['POST'])
 def calculate_semantic_similarity():
     """计算两个文本的语义相似度"""
@@ -295,11 +330,49 @@ def calculate_semantic_similarity():
             'text2': text2[:100] + '...' if len(text2) > 100 else text2,
             'similarity': similarity_result
         })
-        
+    
     except Exception as e:
         logger.error(f"计算语义相似度失败: {e}")
         return jsonify({'error': f'计算相似度失败: {str(e)}'}), 500
 
+def _similarity_items(values):
+    """批量相似度的输入项：文本、文档ID，或 {"text": ...} / {"document_id": ...}
+    
+    Returns:
+        文本和文档ID组成的列表，存在无法识别的项时返回None
+    """
+    items = []
+    for value in values:
+        if isinstance(value, dict):
+            value = value.get('text', value.get('document_id'))
+        if isinstance(value, str) and value.strip():
+            items.append(value)
+        elif isinstance(value, int) and not isinstance(value, bool):
+            items.append(value)
+        else:
+            return None
+    return items
+
+@ai_bp.route('/api/ai/semantic/similarity/batch', methods=['POST'])
+def calculate_batch_similarity():
+    """批量计算 N 个查询 × M 个候选的语义相似度矩阵"""
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('queries'), list) or not isinstance(data.get('candidates'), list):
+            return jsonify({'error': '需要提供queries和candidates列表'}), 400
+        
+        queries = _similarity_items(data['queries'])
+        candidates = _similarity_items(data['candidates'])
+        if not queries or not candidates:
+            return jsonify({'error': 'queries和candidates的元素须为非空文本或文档ID，且不能为空列表'}), 400
+        
+        result = semantic_service.batch_similarity(queries, candidates)
+        return jsonify(result)
+    
+    except Exception as e:
+        logger.error(f"批量计算语义相似度失败: {e}")
+        return jsonify({'error': f'计算相似度失败: {str(e)}'}), 500
+
 @ai_bp.route('/api/ai/analyze/text', methods=['POST'])
 def analyze_text():
     """综合分析文本（分类 + 标签）"""
@@ -326,7 +399,7 @@ def analyze_text():
             },
             'text_preview': text[:200] + '...' if len(text) > 200 else text
         })
-        
+    
     except Exception as e:
         logger.error(f"文本分析失败: {e}")
         return jsonify({'error': f'分析失败: {str(e)}'}), 500
@@ -341,36 +414,18 @@ def semantic_search():
         
         query = data['query']
         top_k = data.get('top_k', 10)
+        if not _valid_top_k(top_k):
+            return jsonify({'error': f'top_k 应为 1 到 {MAX_SEMANTIC_TOP_K} 之间的整数'}), 400
         
-        # 获取候选文档
-        documents = Document.query.filter(
-            Document.content.isnot(None)
-        ).limit(50).all()
-        
-        # 准备文档数据
-        doc_data = []
-        for doc in documents:
-            doc_data.append({
-                'id': doc.id,
-                'title': doc.title,
-                'content': doc.content,
-                'category_id': doc.category_id,
-                'tags': doc.tags or []
-            })
-        
-        # 执行语义搜索
-        search_result = semantic_service.semantic_search(
-            query=query,
-            documents=doc_data,
-            top_k=top_k
-        )
+        # 在全部文档的语料向量上检索
+        search_result = semantic_service.semantic_search(query=query, top_k=top_k)
         
         return jsonify({
             'query': query,
             'search_results': search_result,
-            'candidate_count': len(doc_data)
+            'candidate_count': search_result.get('corpus_size', 0)
         })
-        
+    
     except Exception as e:
         logger.error(f"语义搜索失败: {e}")
         return jsonify({'error': f'搜索失败: {str(e)}'}), 500
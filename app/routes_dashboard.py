@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, jsonify
 from app.models import Document, Category
 from app import db
+from app.services.count_cache import count_cache
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
@@ -13,7 +14,7 @@ def dashboard():
 def get_dashboard_stats():
     """获取看板统计信息"""
     try:
-        doc_count = Document.query.count()
+        doc_count = count_cache.document_total()
         category_count = Category.query.count()
         
         return jsonify({
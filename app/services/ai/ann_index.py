@@ -0,0 +1,295 @@
+"""
+近似最近邻索引
+文档的 TF-IDF 向量先用 TruncatedSVD 降到几十维的稠密向量，再用多张随机超平面哈希表（LSH）分桶：
+每张表取若干个随机超平面，向量落在每个超平面哪一侧组成一个二进制桶号，方向相近的向量大概率同桶。
+查询只取各表中同桶（以及翻转最不确定的几位得到的相邻桶，multi-probe）的文档作为候选，
+候选再用原始稀疏向量精确打分。probes 越大候选越多，召回率越高、耗时越长。
+文档数少于 min_documents 时不建索引，调用方直接精确计算
+"""
+import time
+
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+
+from app.services.ai.vector_index import COMPACT_RATIO
+
+# 拟合降维时最多使用的文档数（随机抽样），其余文档只做变换
+SVD_SAMPLE_ROWS = 50000
+# 降维变换每块的文档数
+TRANSFORM_CHUNK_ROWS = 10000
+# 自动确定桶号位数时每个桶的目标文档数
+TARGET_BUCKET_SIZE = 64
+# 桶号最多的位数，也是每张表最多可查看的相邻桶数
+MAX_BITS = 24
+MAX_PROBES = MAX_BITS
+# 新增的行超过基础行数的该比例（且不超过 MAX_PENDING 行）时重新排序合并
+MERGE_RATIO = 0.1
+MAX_PENDING = 10000
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+class LSHIndex:
+    """随机超平面 LSH 索引（只保存桶号，不保存向量）
+    
+    codes: 每行每张表的桶号；每张表按桶号排序（order/sorted_codes），查桶用二分查找
+    建立后新增的行先放入 pending（线性匹配），累积到一定数量再合并排序；
+    删除和更新只把旧行标记为失效，失效行超过 COMPACT_RATIO 时压缩（与 CorpusVectors 相同）
+    不自带锁，由持有它的 CorpusVectors 在自己的锁内调用
+    """
+    
+    def __init__(self, dimensions=64, tables=8, bits=None, probes=4, min_documents=5000, seed=0):
+        self.dimensions = dimensions
+        self.tables = tables
+        self.bits = bits
+        self.probes = probes
+        self.min_documents = min_documents
+        self.seed = seed
+        self.clear()
+    
+    def clear(self):
+        self.svd = None
+        self.components = None
+        self.mean = None
+        self.planes = None
+        self.active_bits = 0
+        self.codes = np.zeros((0, self.tables), dtype=np.int64)
+        self.order = []
+        self.sorted_codes = []
+        self.doc_ids = np.zeros(0, dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+        self.rows = {}
+        self.pending_codes = []
+        self.pending_ids = []
+        self.pending_alive = []
+        self._pending_array = None
+        self.dead = 0
+        self.built_at = None
+        self.build_seconds = 0.0
+    
+    @property
+    def built(self):
+        return self.svd is not None
+    
+    def build(self, matrix, doc_ids):
+        """在文档向量（L2归一化的CSR）上拟合降维和超平面，并为全部文档分桶
+        
+        文档数少于 min_documents 或词表太小时不建索引
+        """
+        started = time.time()
+        self.clear()
+        count, features = matrix.shape
+        components = min(self.dimensions, features - 1, count - 1)
+        if count < max(self.min_documents, 2) or components < 1:
+            return
+        
+        rng = np.random.RandomState(self.seed)
+        sample = matrix
+        if count > SVD_SAMPLE_ROWS:
+            sample = matrix[np.sort(rng.choice(count, SVD_SAMPLE_ROWS, replace=False))]
+        svd = TruncatedSVD(n_components=components, random_state=self.seed)
+        svd.fit(sample)
+        # 降维即乘以 components_ 的转置；存成连续数组，避免每次变换都复制一遍
+        self.components = np.ascontiguousarray(svd.components_.T, dtype=np.float32)
+        
+        reduced = np.vstack([
+            self._reduce(matrix[start:start + TRANSFORM_CHUNK_ROWS])
+            for start in range(0, count, TRANSFORM_CHUNK_ROWS)
+        ])
+        # 中心化后超平面才能把文档分得比较均匀（TF-IDF 降维后大多落在同一个方向上）
+        self.mean = reduced.mean(axis=0)
+        bits = self.bits or int(np.clip(np.round(np.log2(count / TARGET_BUCKET_SIZE)), 4, MAX_BITS))
+        self.active_bits = bits
+        self.planes = rng.standard_normal((components, self.tables * bits)).astype(np.float32)
+        self.svd = svd
+        
+        self.codes = np.vstack([
+            self._codes(reduced[start:start + TRANSFORM_CHUNK_ROWS])[0]
+            for start in range(0, count, TRANSFORM_CHUNK_ROWS)
+        ])
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int64).copy()
+        self.alive = np.ones(count, dtype=bool)
+        self.rows = {int(doc_id): row for row, doc_id in enumerate(self.doc_ids)}
+        self._sort()
+        self.built_at = time.time()
+        self.build_seconds = self.built_at - started
+    
+    def _reduce(self, vectors):
+        return _normalize(np.asarray(vectors @ self.components, dtype=np.float32))
+    
+    def _codes(self, reduced):
+        """降维向量 -> (每张表的桶号, 每个超平面上的投影)"""
+        projections = ((reduced - self.mean) @ self.planes).reshape(len(reduced), self.tables, self.active_bits)
+        weights = np.left_shift(1, np.arange(self.active_bits, dtype=np.int64))
+        return (projections > 0).astype(np.int64) @ weights, projections
+    
+    def _sort(self):
+        self.order = []
+        self.sorted_codes = []
+        for table in range(self.tables):
+            order = np.argsort(self.codes[:, table], kind='stable').astype(np.int32)
+            self.order.append(order)
+            self.sorted_codes.append(self.codes[order, table])
+    
+    def _append_pending(self):
+        if self.pending_codes:
+            self.codes = np.vstack([self.codes] + self.pending_codes)
+            self.doc_ids = np.concatenate([self.doc_ids, np.array(self.pending_ids, dtype=np.int64)])
+            self.alive = np.concatenate([self.alive, np.array(self.pending_alive, dtype=bool)])
+            self.pending_codes = []
+            self.pending_ids = []
+            self.pending_alive = []
+            self._pending_array = None
+    
+    def _merge(self):
+        if self.pending_codes:
+            self._append_pending()
+            self._sort()
+    
+    def _compact(self):
+        """合并 pending 并丢弃失效行，重建行号和排序"""
+        self._append_pending()
+        keep = np.flatnonzero(self.alive)
+        self.codes = self.codes[keep]
+        self.doc_ids = self.doc_ids[keep]
+        self.alive = np.ones(len(keep), dtype=bool)
+        self.rows = {int(doc_id): row for row, doc_id in enumerate(self.doc_ids)}
+        self.dead = 0
+        self._sort()
+    
+    def add(self, doc_id, vector):
+        """新增或更新一个文档（1行CSR），未建索引时忽略"""
+        if not self.built:
+            return
+        self.remove(doc_id)
+        codes, _ = self._codes(self._reduce(vector))
+        self.rows[doc_id] = len(self.doc_ids) + len(self.pending_ids)
+        self.pending_codes.append(codes)
+        self.pending_ids.append(doc_id)
+        self.pending_alive.append(True)
+        self._pending_array = None
+        if len(self.pending_ids) > min(MERGE_RATIO * len(self.doc_ids), MAX_PENDING):
+            self._merge()
+    
+    def remove(self, doc_id):
+        row = self.rows.pop(doc_id, None)
+        if row is None:
+            return
+        if row < len(self.alive):
+            self.alive[row] = False
+        else:
+            self.pending_alive[row - len(self.alive)] = False
+        self.dead += 1
+        if self.dead > COMPACT_RATIO * (len(self.doc_ids) + len(self.pending_ids)):
+            self._compact()
+    
+    def _probe_codes(self, codes, projections, probes):
+        """每张表要查的桶：自身的桶，加上依次翻转投影绝对值最小（最靠近超平面）的位得到的相邻桶"""
+        probes = max(0, min(probes, self.active_bits))
+        flips = np.argsort(np.abs(projections), axis=1)[:, :probes]
+        return [
+            np.concatenate([[codes[table]], codes[table] ^ np.left_shift(1, flips[table].astype(np.int64))])
+            for table in range(self.tables)
+        ]
+    
+    def candidates(self, query, probes=None):
+        """与查询向量（1行CSR）同桶或相邻桶的文档ID
+        
+        Args:
+            probes: 每张表额外查看的相邻桶数，默认使用构建时的设置
+        """
+        if not self.built:
+            return None
+        probes = self.probes if probes is None else probes
+        codes, projections = self._codes(self._reduce(query))
+        probe_codes = self._probe_codes(codes[0], projections[0], probes)
+        if self.pending_codes and self._pending_array is None:
+            self._pending_array = np.vstack(self.pending_codes)
+        pending = self._pending_array if self.pending_codes else None
+        base_count = len(self.doc_ids)
+        
+        rows = []
+        for table, table_codes in enumerate(probe_codes):
+            sorted_codes = self.sorted_codes[table]
+            lows = np.searchsorted(sorted_codes, table_codes, side='left')
+            highs = np.searchsorted(sorted_codes, table_codes, side='right')
+            rows.extend(self.order[table][low:high] for low, high in zip(lows, highs) if high > low)
+            if pending is not None:
+                rows.append(base_count + np.flatnonzero(np.isin(pending[:, table], table_codes)))
+        
+        if not rows:
+            return np.zeros(0, dtype=np.int64)
+        rows = np.unique(np.concatenate(rows).astype(np.int64))
+        base = rows[rows < base_count]
+        found = self.doc_ids[base[self.alive[base]]]
+        extra = rows[rows >= base_count] - base_count
+        if len(extra):
+            found = np.concatenate([found, [
+                self.pending_ids[row] for row in extra if self.pending_alive[row]
+            ]]).astype(np.int64)
+        return found
+    
+    def __len__(self):
+        return len(self.rows)
+    
+    def stats(self):
+        return {
+            'built': self.built,
+            'documents': len(self.rows),
+            'dimensions': self.svd.n_components if self.built else 0,
+            'tables': self.tables,
+            'bits': self.active_bits,
+            'probes': self.probes,
+            'min_documents': self.min_documents,
+            'pending': len(self.pending_ids),
+            'dead': self.dead,
+            'build_seconds': round(self.build_seconds, 3)
+        }
+
+def recall_report(corpus, queries, top_k=10, probes=(0, 1, 2, 4, 8)):
+    """近似查询与精确查询的对比：每个 probes 设置下的平均召回率、候选数和耗时
+    
+    Args:
+        corpus: 带 LSH 索引的 CorpusVectors
+        queries: [(查询文档ID或None, 1行CSR查询向量)]，文档ID用于从结果中排除查询文档自身
+    
+    Returns:
+        {'queries', 'top_k', 'exact_ms', 'settings': [{'probes', 'recall', 'candidates', 'ms'}, ...]}
+    """
+    exact = []
+    started = time.perf_counter()
+    for doc_id, query in queries:
+        exclude = () if doc_id is None else (doc_id,)
+        exact.append({match for match, _ in corpus.search_vector(query, top_k, exclude, exact=True)})
+    exact_ms = (time.perf_counter() - started) * 1000 / max(len(queries), 1)
+    
+    settings = []
+    for probe in probes:
+        recalls = []
+        candidates = []
+        started = time.perf_counter()
+        for (doc_id, query), expected in zip(queries, exact):
+            exclude = () if doc_id is None else (doc_id,)
+            found = {match for match, _ in corpus.search_vector(query, top_k, exclude, probes=probe)}
+            if expected:
+                recalls.append(len(found & expected) / len(expected))
+        elapsed = (time.perf_counter() - started) * 1000 / max(len(queries), 1)
+        with corpus.lock:
+            for _, query in queries:
+                found = corpus.ann.candidates(query, probe)
+                candidates.append(0 if found is None else len(found))
+        settings.append({
+            'probes': probe,
+            'recall': round(float(np.mean(recalls)), 4) if recalls else 1.0,
+            'candidates': int(np.mean(candidates)) if candidates else 0,
+            'ms': round(elapsed, 3)
+        })
+    
+    return {
+        'queries': len(queries),
+        'top_k': top_k,
+        'exact_ms': round(exact_ms, 3),
+        'settings': settings
+    }
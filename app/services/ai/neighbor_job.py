@@ -0,0 +1,225 @@
+"""
+相似文档表维护
+把每个文档最相似的k个文档写入 document_neighbors 表，文档推荐只需一次按主键前缀的查询。
+维护由命令行任务执行（flask recommendations build-neighbors / refresh-neighbors），Web 进程只读表，
+定时任务只应有一个实例在运行。
+
+每块文档的邻居行和计算状态在同一个事务中替换，读者看到的总是某个文档完整的旧结果或新结果，
+不会在重建期间看到空表。document_neighbor_states 记录计算时文档的 updated_at，
+与文档当前的 updated_at 相同时表中的结果可用，判断只依赖数据库，与哪个进程写入无关。
+增量刷新只重算受影响的文档：变化的文档自身、原来把它列为邻居的文档，
+以及它现在可能挤进其top-k的文档（与它的相似度超过该文档当前第k个邻居的相似度）
+"""
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import inspect, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.models import Document, DocumentNeighbor, DocumentNeighborState
+from app.services.ai.vector_index import max_similarity, nearest_neighbors
+
+# IN 查询每批的ID数
+ID_BATCH_SIZE = 500
+
+def _batches(values, size=ID_BATCH_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+class NeighborTable:
+    """document_neighbors 表的读写
+    
+    k: 每个文档保存的邻居数, min_similarity: 只保存相似度大于该值的邻居
+    build/refresh 的 vectors 是已拟合的文档向量索引（CorpusVectors），
+    versions 是读取文档文本之前取得的 {文档ID: updated_at}：读取之后又被修改的文档记为旧版本，下次刷新时重算
+    """
+    
+    TABLES = (DocumentNeighbor.__tablename__, DocumentNeighborState.__tablename__)
+    
+    def __init__(self, k=20, min_similarity=0.1):
+        self.k = k
+        self.min_similarity = min_similarity
+    
+    def tables_exist(self):
+        """迁移是否已创建相似文档表"""
+        inspector = inspect(db.engine)
+        return all(inspector.has_table(name) for name in self.TABLES)
+    
+    def is_current(self, doc_id):
+        """表中该文档的邻居是否按文档当前版本计算过
+        
+        使用单独的连接查询，表尚未迁移时返回False（走实时计算），不影响请求的会话
+        """
+        statement = select(DocumentNeighborState.document_updated_at, Document.updated_at).join(
+            Document, Document.id == DocumentNeighborState.document_id
+        ).where(DocumentNeighborState.document_id == doc_id)
+        try:
+            with db.engine.connect() as conn:
+                row = conn.execute(statement).first()
+        except SQLAlchemyError:
+            return False
+        return row is not None and row[0] == row[1]
+    
+    @staticmethod
+    def document_versions():
+        return dict(db.session.query(Document.id, Document.updated_at))
+    
+    def stale_documents(self):
+        """需要重算的文档：没有计算状态或状态版本与文档不同的文档，以及状态仍在但文档已删除的文档"""
+        changed = {
+            doc_id for doc_id, in db.session.query(Document.id).outerjoin(
+                DocumentNeighborState, DocumentNeighborState.document_id == Document.id
+            ).filter(db.or_(
+                DocumentNeighborState.document_id.is_(None),
+                DocumentNeighborState.document_updated_at != Document.updated_at,
+                DocumentNeighborState.document_updated_at.is_(None) != Document.updated_at.is_(None)
+            ))
+        }
+        removed = {
+            doc_id for doc_id, in db.session.query(DocumentNeighborState.document_id).outerjoin(
+                Document, Document.id == DocumentNeighborState.document_id
+            ).filter(Document.id.is_(None))
+        }
+        return changed | removed
+    
+    def build(self, vectors, versions):
+        """全量重算：逐块替换全部文档的邻居，最后清除已删除文档的行
+        
+        Returns:
+            重算的文档数
+        """
+        matrix, doc_ids = vectors.snapshot()
+        self._recompute(matrix, doc_ids, versions, versions)
+        
+        table = DocumentNeighbor.__table__
+        states = DocumentNeighborState.__table__
+        existing = set(versions)
+        stale = {
+            doc_id for doc_id, in db.session.query(DocumentNeighborState.document_id)
+            if doc_id not in existing
+        }
+        for batch in _batches(stale):
+            db.session.execute(table.delete().where(table.c.document_id.in_(batch)))
+            db.session.execute(states.delete().where(states.c.document_id.in_(batch)))
+        db.session.commit()
+        return len(versions)
+    
+    def refresh(self, vectors, versions, changed=None):
+        """只重算受变化影响的文档
+        
+        Args:
+            changed: 变化的文档ID，默认按计算状态查找
+        
+        Returns:
+            重算的文档数
+        """
+        if changed is None:
+            changed = self.stale_documents()
+        if not changed:
+            return 0
+        
+        matrix, doc_ids = vectors.snapshot()
+        positions = {int(doc_id): row for row, doc_id in enumerate(doc_ids)} if matrix is not None else {}
+        present = [doc_id for doc_id in changed if doc_id in positions]
+        
+        affected = set(changed)
+        # 原来把变化的文档列为邻居的文档
+        for batch in _batches(changed):
+            affected.update(
+                row[0] for row in db.session.query(DocumentNeighbor.document_id).filter(
+                    DocumentNeighbor.neighbor_id.in_(batch)
+                )
+            )
+        # 变化的文档现在可能进入其top-k的文档
+        if present:
+            rows = [positions[doc_id] for doc_id in present]
+            best = max_similarity(matrix[rows], present, matrix, doc_ids)
+            affected.update(self._displaced(best, doc_ids))
+        
+        targets = {doc_id: versions[doc_id] for doc_id in affected if doc_id in versions}
+        self._recompute(matrix, doc_ids, targets, versions)
+        
+        # 已删除的文档
+        table = DocumentNeighbor.__table__
+        states = DocumentNeighborState.__table__
+        for batch in _batches(doc_id for doc_id in affected if doc_id not in versions):
+            db.session.execute(table.delete().where(table.c.document_id.in_(batch)))
+            db.session.execute(states.delete().where(states.c.document_id.in_(batch)))
+        db.session.commit()
+        return len(affected)
+    
+    def _recompute(self, matrix, doc_ids, targets, versions):
+        """按块重算 targets 中文档的邻居，每块一个事务
+        
+        没有向量的文档（如正文为空）写入空的邻居和计算状态，不会在每次刷新时被重新找出
+        """
+        if matrix is not None:
+            positions = {int(doc_id): row for row, doc_id in enumerate(doc_ids)}
+        else:
+            positions = {}
+        with_vectors = [doc_id for doc_id in targets if doc_id in positions]
+        without_vectors = [doc_id for doc_id in targets if doc_id not in positions]
+        
+        if with_vectors:
+            rows = [positions[doc_id] for doc_id in with_vectors]
+            for chunk in nearest_neighbors(matrix[rows], with_vectors, matrix, doc_ids, self.k, self.min_similarity):
+                self._write(chunk, versions)
+                db.session.commit()
+        for batch in _batches(without_vectors):
+            self._write([(doc_id, []) for doc_id in batch], versions)
+            db.session.commit()
+    
+    def _displaced(self, best, doc_ids):
+        """与变化文档的最大相似度 best 超过自己当前第k个邻居（或邻居不足k个）的文档
+        
+        逐批读取候选文档已保存的邻居数和最低相似度，按数组比较，只返回文档ID
+        """
+        displaced = set()
+        candidates = np.flatnonzero(best > self.min_similarity)
+        for batch in _batches(candidates):
+            ids = doc_ids[batch]
+            slots = {int(doc_id): slot for slot, doc_id in enumerate(ids)}
+            counts = np.zeros(len(batch), dtype=np.int64)
+            lowest = np.zeros(len(batch))
+            for doc_id, count, similarity in db.session.query(
+                DocumentNeighbor.document_id,
+                db.func.count(DocumentNeighbor.rank),
+                db.func.min(DocumentNeighbor.similarity)
+            ).filter(DocumentNeighbor.document_id.in_(slots)).group_by(DocumentNeighbor.document_id):
+                counts[slots[doc_id]] = count
+                lowest[slots[doc_id]] = similarity
+            mask = (counts < self.k) | (best[batch] > lowest)
+            displaced.update(int(doc_id) for doc_id in ids[mask])
+        return displaced
+    
+    def _write(self, chunk, versions):
+        """替换一块文档的邻居行和计算状态（由调用方提交）"""
+        table = DocumentNeighbor.__table__
+        states = DocumentNeighborState.__table__
+        ids = [doc_id for doc_id, _ in chunk]
+        db.session.execute(table.delete().where(table.c.document_id.in_(ids)))
+        db.session.execute(states.delete().where(states.c.document_id.in_(ids)))
+        rows = [
+            {'document_id': doc_id, 'rank': rank, 'neighbor_id': neighbor_id, 'similarity': similarity}
+            for doc_id, neighbors in chunk
+            for rank, (neighbor_id, similarity) in enumerate(neighbors)
+        ]
+        if rows:
+            db.session.execute(table.insert(), rows)
+        computed_at = datetime.utcnow()
+        db.session.execute(states.insert(), [
+            {'document_id': doc_id, 'document_updated_at': versions.get(doc_id), 'computed_at': computed_at}
+            for doc_id in ids
+        ])
+    
+    def get_stats(self):
+        """表中已计算的文档数（待重算的文档数需要扫描全部文档，由命令行任务输出）"""
+        if not self.tables_exist():
+            return {'k': self.k, 'available': False}
+        return {
+            'k': self.k,
+            'available': True,
+            'documents': db.session.query(db.func.count(DocumentNeighborState.document_id)).scalar()
+        }
@@ -1,21 +1,53 @@
-import jieba
+import threading
 import numpy as np
+import jieba
 from collections import Counter, defaultdict
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from app.services.ai.base_service import BaseAIService, ai_service_exception_handler
-from app.models import Document
+from app.services.ai.vector_index import CorpusVectors, document_text
+from app.services.ai.ann_index import LSHIndex, recall_report
+from app.services.ai.neighbor_job import NeighborTable
+from app.models import Document, DocumentNeighbor
 from app import db
 
 class RecommendationService(BaseAIService):
-    """内容推荐服务"""
+    """内容推荐服务
+    
+    index: 文档向量索引（词表拟合后固定），文档的增删改由 index_sync 逐个更新向量；
+    新文本中词表外的词明显增多（漂移）或拟合后写入的文档过多时，在后台用全部文档重新拟合，
+    构建完成后回放构建期间的写入，再整体替换 index。
+    neighbors: document_neighbors 表（由命令行任务维护），文档的邻居按当前版本计算过时相似文档推荐直接查表
+    文档数较多时 index 带近似最近邻索引（LSH），实时推荐只对候选文档打分
+    """
+    
+    # 词表外词的比例比拟合时高出该值即认为词表漂移
+    DRIFT_THRESHOLD = 0.1
+    # 拟合后写入的文档数达到拟合时文档数的该比例也重新拟合
+    CHANGE_THRESHOLD = 0.5
+    # 至少写入这么多文档后才判断漂移，避免个别文档触发重新拟合
+    DRIFT_MIN_DOCUMENTS = 20
+    # 推荐结果的最低相似度
+    MIN_SIMILARITY = 0.1
     
     def __init__(self):
         super().__init__('内容推荐')
-        self.vectorizer = None
-        self.document_vectors = None
-        self.document_ids = []
+        # 近似最近邻索引的参数，初始化时从配置读取
+        self.ann_settings = {'min_documents': 5000, 'probes': 4}
+        self.index = self._new_index()
         self.similarity_cache = {}
+        self.lock = threading.RLock()
+        # 后台重新拟合期间的写入：[(文档ID, 文本或None)]，不在重新拟合时为None
+        self.refit_log = None
+        self.refit_count = 0
+        # 重新拟合时读取全部文档的函数，返回 [(文档ID, 文本)]；初始化时绑定到当前应用
+        self.loader = None
+        self.neighbors = NeighborTable(min_similarity=self.MIN_SIMILARITY)
+        # 索引尚未拟合（如启动时还没有文档）期间的写入数
+        self.unfitted_changes = 0
+    
+    def _new_index(self, ann=True):
+        return CorpusVectors(
+            max_features=1000, min_df=1, max_df=0.8, ann=LSHIndex(**self.ann_settings) if ann else None
+        )
     
     def initialize(self):
         """初始化推荐服务"""
@@ -25,58 +57,154 @@ class RecommendationService(BaseAIService):
             # 初始化jieba
             jieba.initialize()
             
-            # 初始化TF-IDF向量化器
-            self.vectorizer = TfidfVectorizer(
-                tokenizer=jieba.lcut,
-                max_features=1000,
-                min_df=1,
-                max_df=0.8
-            )
+            # 后台线程没有应用上下文，重新拟合时在绑定的应用中读取文档
+            from flask import current_app
+            app = current_app._get_current_object()
+            
+            def loader():
+                with app.app_context():
+                    return self._document_rows()
+            self.loader = loader
+            self.ann_settings = {
+                'min_documents': app.config.get('RECOMMENDATION_ANN_MIN_DOCUMENTS', 5000),
+                'probes': app.config.get('RECOMMENDATION_ANN_PROBES', 4)
+            }
+            self.neighbors.k = app.config.get('RECOMMENDATION_NEIGHBORS', 20)
             
             # 预加载文档数据
             self._load_documents()
             
             self.initialized = True
-            print(f"推荐服务初始化完成，共加载 {len(self.document_ids)} 个文档")
-            
+            print(f"推荐服务初始化完成，共加载 {len(self.index)} 个文档")
+        
         except Exception as e:
             print(f"推荐服务初始化失败: {e}")
             self.initialized = False
     
+    @staticmethod
+    def _document_rows():
+        """全部有内容的文档：(文档ID, 标题+正文)"""
+        rows = db.session.query(Document.id, Document.title, Document.content).filter(
+            Document.content.isnot(None),
+            Document.content != ''
+        ).yield_per(1000)
+        return [(doc_id, document_text(title, content)) for doc_id, title, content in rows]
+    
     def _load_documents(self):
         """加载文档数据并构建向量空间"""
         try:
-            documents = Document.query.filter(
-                Document.content.isnot(None),
-                Document.content != ''
-            ).all()
-            
-            if not documents:
+            index = self._new_index()
+            index.fit(self._document_rows())
+            if not len(index):
                 print("没有找到可用的文档数据")
-                return
-            
-            self.document_ids = [doc.id for doc in documents]
-            document_texts = [
-                f"{doc.title} {doc.content}" for doc in documents
-            ]
-            
-            # 构建TF-IDF向量
-            if document_texts:
-                self.document_vectors = self.vectorizer.fit_transform(document_texts)
-            else:
-                self.document_vectors = None
-                
+            self._swap(index)
         except Exception as e:
             print(f"加载文档数据失败: {e}")
-            self.document_vectors = None
+            db.session.rollback()
+    
+    def _swap(self, index):
+        """替换向量索引：先回放重新拟合期间的写入，再整体替换"""
+        with self.lock:
+            for doc_id, text in self.refit_log or ():
+                if text is None:
+                    index.remove(doc_id)
+                else:
+                    index.upsert(doc_id, text)
+            self.refit_log = None
+            self.index = index
+            self.similarity_cache = {}
+            self.unfitted_changes = 0
+    
+    def on_documents_changed(self, upserts, deleted_ids):
+        """索引同步回调：用固定词表更新变化的文档向量，漂移超过阈值时安排后台重新拟合"""
+        if not self.initialized:
+            return
+        
+        changes = [(doc_id, None) for doc_id in deleted_ids]
+        for snapshot in upserts:
+            text = document_text(snapshot.title, snapshot.content) if snapshot.content else None
+            changes.append((snapshot.id, text))
+        
+        with self.lock:
+            index = self.index
+            if self.refit_log is not None:
+                self.refit_log.extend(changes)
+            if not index.fitted:
+                self.unfitted_changes += len(changes)
+            self.similarity_cache = {}
+        
+        for doc_id, text in changes:
+            if text is None:
+                index.remove(doc_id)
+            else:
+                index.upsert(doc_id, text)
+        
+        self.refresh()
+    
+    def needs_refit(self):
+        """词表是否需要重新拟合：尚未拟合但已有文档写入，或写入的文档足够多且漂移超过阈值"""
+        index = self.index
+        if not index.fitted:
+            return self.unfitted_changes > 0
+        if index.drift['documents'] < self.DRIFT_MIN_DOCUMENTS:
+            return False
+        return index.drift_score() > self.DRIFT_THRESHOLD or index.changed_ratio() > self.CHANGE_THRESHOLD
+    
+    def refresh(self):
+        """写入后调用：文档向量已由 index_sync 增量更新，这里只在词表漂移时安排后台重新拟合
+        
+        Returns:
+            是否启动了重新拟合
+        """
+        if not self.initialized or not self.needs_refit():
+            return False
+        return self.refit()
+    
+    def refit(self, background=True):
+        """用全部文档重新拟合词表和文档向量，完成后原子替换索引
+        
+        Args:
+            background: 是否在后台线程中执行
+        
+        Returns:
+            是否启动了重新拟合（已有重新拟合在进行或尚未初始化时返回False）
+        """
+        loader = self.loader
+        if loader is None:
+            return False
+        
+        with self.lock:
+            if self.refit_log is not None:
+                return False
+            # 先开始记录写入再读取文档，读取之后的写入都会被回放
+            self.refit_log = []
+        
+        if background:
+            threading.Thread(target=self._refit, args=(loader,), daemon=True, name='recommendation-refit').start()
+        else:
+            self._refit(loader)
+        return True
+    
+    def _refit(self, loader):
+        try:
+            index = self._new_index()
+            index.fit(loader())
+            self._swap(index)
+            self.refit_count += 1
+            print(f"推荐向量重新拟合完成: {index.stats()}")
+        except Exception as e:
+            print(f"推荐向量重新拟合失败: {e}")
+            with self.lock:
+                self.refit_log = None
     
     @ai_service_exception_handler
     def recommend_similar_documents(self, document_id, top_k=5):
         """推荐相似文档"""
         self.ensure_initialized()
         
+        index = self.index
         # 检查是否有足够的文档数据
-        if self.document_vectors is None or len(self.document_ids) < 2:
+        if len(index) < 2:
             return {
                 'success': True,
                 'recommendations': [],
@@ -84,84 +212,128 @@ class RecommendationService(BaseAIService):
                 'count': 0
             }
         
+        # 相似文档表中已有该文档的最新结果时直接查表
+        neighbors = self.neighbors
+        if top_k <= neighbors.k and document_id in index and neighbors.is_current(document_id):
+            recommendations = self._table_recommendations(document_id, top_k)
+            return {
+                'success': True,
+                'recommendations': recommendations,
+                'method': 'neighbor_table',
+                'count': len(recommendations),
+                'target_document_id': document_id
+            }
+        
         # 检查缓存
         cache_key = f"{document_id}_{top_k}"
         if cache_key in self.similarity_cache:
             return self.similarity_cache[cache_key]
         
         try:
-            # 查找目标文档的索引
-            if document_id not in self.document_ids:
+            # 查找目标文档的向量
+            if document_id not in index:
                 return {
                     'success': False,
                     'error': '文档不存在',
                     'recommendations': []
                 }
             
-            target_idx = self.document_ids.index(document_id)
-            
-            # 计算相似度 - 修复numpy数组比较问题
-            if hasattr(self.document_vectors, 'shape') and self.document_vectors.shape[0] > 1:
-                similarities = cosine_similarity(
-                    self.document_vectors[target_idx:target_idx+1],
-                    self.document_vectors
-                ).flatten()
-            else:
-                return {
-                    'success': True,
-                    'recommendations': [],
-                    'method': 'insufficient_vectors',
-                    'count': 0
-                }
-            
-            # 排除自己，获取最相似的文档
-            similar_indices = np.argsort(similarities)[::-1]
-            recommendations = []
-            
-            for idx in similar_indices:
-                if idx == target_idx:  # 跳过自己
-                    continue
-                
-                if len(recommendations) >= top_k:
-                    break
-                
-                doc_id = self.document_ids[idx]
-                similarity_score = float(similarities[idx])
-                
-                # 只保留相似度较高的推荐
-                if similarity_score > 0.1:
-                    document = Document.query.get(doc_id)
-                    if document:
-                        recommendations.append({
-                            'document_id': doc_id,
-                            'title': document.title,
-                            'similarity': round(similarity_score, 3),
-                            'category_id': document.category_id,
-                            'tags': document.tags or []
-                        })
+            vectors, _ = index.document_vectors([document_id])
+            matches = index.search_vector(vectors, top_k, exclude=(document_id,))
             
             result = {
                 'success': True,
-                'recommendations': recommendations,
+                'recommendations': self._recommendations(matches),
                 'method': 'cosine_similarity',
-                'count': len(recommendations),
                 'target_document_id': document_id
             }
+            result['count'] = len(result['recommendations'])
             
             # 缓存结果
             self.similarity_cache[cache_key] = result
             return result
-            
+        
         except Exception as e:
             print(f"文档推荐失败: {e}")
             return self._fallback_recommendations(document_id, top_k)
     
-    def recommend_by_content(self, content, top_k=5):
-        """基于内容推荐文档"""
+    def update_neighbor_table(self, full=False):
+        """计算相似文档表（由命令行任务调用，不在Web进程中执行）
+        
+        先读取文档版本再读取文本并重新拟合向量，计算期间被修改的文档记为旧版本，下次刷新时重算
+        
+        Args:
+            full: 是否重算全部文档，否则只重算变化的文档及受其影响的文档
+        
+        Returns:
+            重算的文档数
+        """
+        versions = self.neighbors.document_versions()
+        index = self._new_index(ann=False)
+        index.fit(self._document_rows())
+        if full:
+            return self.neighbors.build(index, versions)
+        return self.neighbors.refresh(index, versions)
+    
+    @staticmethod
+    def _table_recommendations(document_id, top_k):
+        """从 document_neighbors 表读取推荐（按 (document_id, rank) 主键前缀查询）"""
+        rows = db.session.query(
+            DocumentNeighbor.neighbor_id,
+            DocumentNeighbor.similarity,
+            Document.title,
+            Document.category_id,
+            Document.tags
+        ).join(Document, Document.id == DocumentNeighbor.neighbor_id).filter(
+            DocumentNeighbor.document_id == document_id
+        ).order_by(DocumentNeighbor.rank).limit(top_k)
+        
+        return [
+            {
+                'document_id': neighbor_id,
+                'title': title,
+                'similarity': round(similarity, 3),
+                'category_id': category_id,
+                'tags': tags or []
+            }
+            for neighbor_id, similarity, title, category_id, tags in rows
+        ]
+    
+    @classmethod
+    def _recommendations(cls, matches):
+        """(文档ID, 相似度) -> 推荐结果，只保留相似度较高的文档，一次查询取出文档信息"""
+        matches = [(doc_id, score) for doc_id, score in matches if score > cls.MIN_SIMILARITY]
+        if not matches:
+            return []
+        
+        documents = {
+            doc.id: doc for doc in Document.query.filter(
+                Document.id.in_([doc_id for doc_id, _ in matches])
+            ).all()
+        }
+        recommendations = []
+        for doc_id, similarity_score in matches:
+            document = documents.get(doc_id)
+            if document:
+                recommendations.append({
+                    'document_id': doc_id,
+                    'title': document.title,
+                    'similarity': round(similarity_score, 3),
+                    'category_id': document.category_id,
+                    'tags': document.tags or []
+                })
+        return recommendations
+    
+    def recommend_by_content(self, content, top_k=5, probes=None):
+        """基于内容推荐文档
+        
+        Args:
+            probes: 近似最近邻索引每张表额外查看的相邻桶数，默认使用配置值；文档数较少时始终精确计算
+        """
         self.ensure_initialized()
         
         # 检查文档数据
-        if self.document_vectors is None or not self.document_ids:
+        if not len(self.index):
             return {
                 'success': True,
                 'recommendations': [],
@@ -170,41 +342,8 @@ class RecommendationService(BaseAIService):
             }
         
         try:
-            # 将查询内容向量化
-            query_vector = self.vectorizer.transform([content])
-            
-            # 计算相似度 - 修复numpy数组比较问题
-            if hasattr(self.document_vectors, 'shape') and self.document_vectors.shape[0] > 0:
-                similarities = cosine_similarity(query_vector, self.document_vectors).flatten()
-            else:
-                return {
-                    'success': True,
-                    'recommendations': [],
-                    'method': 'no_vector_data',
-                    'count': 0
-                }
-            
-            # 获取最相似的文档
-            similar_indices = np.argsort(similarities)[::-1]
-            recommendations = []
-            
-            for idx in similar_indices:
-                if len(recommendations) >= top_k:
-                    break
-                
-                doc_id = self.document_ids[idx]
-                similarity_score = float(similarities[idx])
-                
-                if similarity_score > 0.1:
-                    document = Document.query.get(doc_id)
-                    if document:
-                        recommendations.append({
-                            'document_id': doc_id,
-                            'title': document.title,
-                            'similarity': round(similarity_score, 3),
-                            'category_id': document.category_id,
-                            'tags': document.tags or []
-                        })
+            # 将查询内容向量化后与全部文档比较
+            recommendations = self._recommendations(self.index.search(content, top_k, probes=probes))
             
             return {
                 'success': True,
@@ -213,7 +352,7 @@ class RecommendationService(BaseAIService):
                 'count': len(recommendations),
                 'query_content_preview': content[:100] + '...' if len(content) > 100 else content
             }
-            
+        
         except Exception as e:
             print(f"基于内容推荐失败: {e}")
             return {
@@ -259,7 +398,7 @@ class RecommendationService(BaseAIService):
                 'count': len(recommendations),
                 'fallback': True
             }
-            
+        
         except Exception as e:
             print(f"降级推荐也失败了: {e}")
             return {
@@ -268,6 +407,37 @@ class RecommendationService(BaseAIService):
                 'method': 'fallback_failed'
             }
     
+    def ann_report(self, sample=100, top_k=10, probes=(0, 1, 2, 4, 8)):
+        """近似最近邻索引的召回率报告：随机抽取文档作为查询，对比近似结果与精确结果
+        
+        Returns:
+            recall_report 的结果，加上索引参数；索引未建立（文档数不足）时 built 为False
+        """
+        self.ensure_initialized()
+        index = self.index
+        if index.ann is None or not index.ann.built:
+            return {'built': False, 'documents': len(index), 'min_documents': self.ann_settings['min_documents']}
+        
+        matrix, doc_ids = index.snapshot()
+        rows = np.random.RandomState(0).choice(len(doc_ids), min(sample, len(doc_ids)), replace=False)
+        queries = [(int(doc_ids[row]), matrix[row]) for row in rows]
+        report = recall_report(index, queries, top_k=top_k, probes=probes)
+        report.update(built=True, index=index.ann.stats())
+        return report
+    
+    def health_check(self):
+        status = super().health_check()
+        status['index'] = dict(
+            self.index.stats(),
+            refitting=self.refit_log is not None,
+            refits=self.refit_count
+        )
+        try:
+            status['neighbors'] = self.neighbors.get_stats()
+        except Exception as e:
+            status['neighbors'] = {'error': str(e)}
+        return status
+    
     def process(self, text, **kwargs):
         """处理推荐请求"""
         document_id = kwargs.get('document_id')
@@ -1,17 +1,25 @@
 import jieba
 import numpy as np
-from collections import Counter
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
 from app.services.ai.base_service import BaseAIService, ai_service_exception_handler
+from app.services.ai.vector_index import CorpusVectors, document_text
 
 class SemanticService(BaseAIService):
-    """语义搜索服务"""
+    """语义搜索服务
+    
+    corpus: 全部文档的 TF-IDF 向量索引，初始化时拟合一次，之后由 index_sync 增量更新；
+            相似度计算也使用它的词表和IDF，而不是只在两段文本上临时拟合
+    """
+    
+    # 批量相似度一次最多计算的矩阵元素数
+    MAX_BATCH_CELLS = 1000000
     
     def __init__(self):
         super().__init__('语义搜索')
-        self.vectorizer = None
         self.semantic_cache = {}
+        self.corpus = CorpusVectors()
+        # 语料未拟合（如启动时还没有文档）期间有文档写入，下次使用时重新拟合
+        self.corpus_stale = False
     
     def initialize(self):
         """初始化语义搜索服务"""
@@ -21,25 +29,90 @@ class SemanticService(BaseAIService):
             # 初始化jieba
             jieba.initialize()
             
-            # 初始化TF-IDF向量化器
-            self.vectorizer = TfidfVectorizer(
-                tokenizer=jieba.lcut,
-                max_features=500,
-                min_df=1,
-                max_df=0.9
-            )
+            # 在全部文档上拟合TF-IDF向量空间
+            self._load_corpus()
             
             self.initialized = True
-            print("语义搜索服务初始化完成")
-            
+            print(f"语义搜索服务初始化完成，语料向量: {self.corpus.stats()}")
+        
         except Exception as e:
             print(f"语义搜索服务初始化失败: {e}")
             self.initialized = False
     
+    def _load_corpus(self):
+        """读取全部文档并拟合语料向量"""
+        from app import db
+        from app.models import Document
+        
+        self.corpus_stale = False
+        try:
+            rows = db.session.query(Document.id, Document.title, Document.content).yield_per(1000)
+            self.corpus.fit((doc_id, document_text(title, content)) for doc_id, title, content in rows)
+        except Exception as e:
+            print(f"加载语料向量失败: {e}")
+            db.session.rollback()
+    
+    def on_documents_changed(self, upserts, deleted_ids):
+        """索引同步回调：用固定词表更新变化的文档向量，不重新拟合"""
+        if not self.corpus.fitted:
+            self.corpus_stale = True
+            return
+        for doc_id in deleted_ids:
+            self.corpus.remove(doc_id)
+        for snapshot in upserts:
+            self.corpus.upsert(snapshot.id, document_text(snapshot.title, snapshot.content))
+    
+    def ensure_corpus(self):
+        """确保服务已初始化，且语料未拟合期间写入的文档已被拟合"""
+        self.ensure_initialized()
+        if self.corpus_stale and not self.corpus.fitted:
+            self._load_corpus()
+    
+    @ai_service_exception_handler
+    def semantic_search(self, query, top_k=10):
+        """语义搜索：查询与全部文档的 TF-IDF 余弦相似度，返回最相似的top_k篇"""
+        self.ensure_corpus()
+        
+        if not query or not query.strip():
+            return {
+                'success': False,
+                'error': '搜索查询不能为空',
+                'results': []
+            }
+        
+        matches = self.corpus.search(query, top_k)
+        
+        from app.models import Document
+        documents = {}
+        if matches:
+            ids = [doc_id for doc_id, _ in matches]
+            documents = {doc.id: doc for doc in Document.query.filter(Document.id.in_(ids)).all()}
+        
+        results = []
+        for doc_id, similarity in matches:
+            document = documents.get(doc_id)
+            if document is None:
+                continue
+            results.append({
+                'document_id': doc_id,
+                'title': document.title,
+                'similarity': round(similarity, 4),
+                'category_id': document.category_id,
+                'tags': document.tags or []
+            })
+        
+        return {
+            'success': True,
+            'results': results,
+            'method': 'tfidf_corpus',
+            'count': len(results),
+            'corpus_size': len(self.corpus)
+        }
+    
     @ai_service_exception_handler
     def semantic_similarity(self, text1, text2):
         """计算两个文本的语义相似度"""
-        self.ensure_initialized()
+        self.ensure_corpus()
         
         if not text1 or not text2:
             return {
@@ -53,10 +126,12 @@ class SemanticService(BaseAIService):
             return self.semantic_cache[cache_key]
         
         try:
-            # 使用TF-IDF计算相似度
-            texts = [text1, text2]
-            tfidf_matrix = self.vectorizer.fit_transform(texts)
-            similarity = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0]
+            # 在语料拟合的向量空间中计算余弦相似度（向量已L2归一化，点积即余弦）
+            vectors = self.corpus.transform([text1, text2])
+            if vectors is None or not vectors[0].nnz or not vectors[1].nnz:
+                # 语料尚未拟合，或文本中没有语料词表内的词
+                return self._fallback_similarity(text1, text2)
+            similarity = vectors[0].multiply(vectors[1]).sum()
             
             result = {
                 'success': True,
@@ -68,11 +143,65 @@ class SemanticService(BaseAIService):
             
             self.semantic_cache[cache_key] = result
             return result
-            
+        
         except Exception as e:
             print(f"语义相似度计算失败: {e}")
             return self._fallback_similarity(text1, text2)
     
+    @ai_service_exception_handler
+    def batch_similarity(self, queries, candidates):
+        """N×M 相似度矩阵，一次向量化、一次矩阵乘
+        
+        Args:
+            queries, candidates: 元素为文本或文档ID（文档ID使用索引中已有的向量，不再读库）
+        """
+        self.ensure_corpus()
+        
+        if not self.corpus.fitted:
+            return {
+                'success': False,
+                'error': '语料向量尚未构建',
+                'matrix': []
+            }
+        if len(queries) * len(candidates) > self.MAX_BATCH_CELLS:
+            return {
+                'success': False,
+                'error': f'矩阵过大，查询数×候选数不能超过{self.MAX_BATCH_CELLS}',
+                'matrix': []
+            }
+        
+        query_vectors, missing_queries = self._vectorize_items(queries)
+        candidate_vectors, missing_candidates = self._vectorize_items(candidates)
+        matrix = self.corpus.similarity(query_vectors, candidate_vectors)
+        
+        return {
+            'success': True,
+            'matrix': np.round(matrix, 4).tolist(),
+            'shape': [len(queries), len(candidates)],
+            'method': 'tfidf_corpus_cosine',
+            'missing_documents': sorted(set(missing_queries) | set(missing_candidates))
+        }
+    
+    def _vectorize_items(self, items):
+        """文本和文档ID混合的列表 -> 按原顺序排列的向量矩阵"""
+        text_positions = [i for i, item in enumerate(items) if isinstance(item, str)]
+        id_positions = [i for i, item in enumerate(items) if not isinstance(item, str)]
+        
+        parts = []
+        missing = []
+        if text_positions:
+            parts.append(self.corpus.transform([items[i] for i in text_positions]))
+        if id_positions:
+            vectors, missing = self.corpus.document_vectors([items[i] for i in id_positions])
+            parts.append(vectors)
+        
+        if not parts:
+            return sparse.csr_matrix((0, len(self.corpus.vectorizer.vocabulary_))), missing
+        matrix = sparse.vstack(parts, format='csr')
+        # vstack 按 文本、文档ID 的顺序堆叠，还原为输入顺序
+        order = np.argsort(np.array(text_positions + id_positions), kind='stable')
+        return matrix[order], missing
+    
     def _fallback_similarity(self, text1, text2):
         """语义相似度的降级方案"""
         try:
@@ -101,16 +230,17 @@ class SemanticService(BaseAIService):
             }
     
     def process(self, text, **kwargs):
-        """处理语义搜索请求"""
+        """处理语义搜索请求：提供comparison_text时计算相似度，否则在语料中搜索"""
         comparison_text = kwargs.get('comparison_text')
         
         if comparison_text:
             return self.semantic_similarity(text, comparison_text)
-        else:
-            return {
-                'success': False,
-                'error': '需要提供comparison_text参数'
-            }
+        return self.semantic_search(text, kwargs.get('top_k', 10))
+    
+    def health_check(self):
+        status = super().health_check()
+        status['corpus'] = self.corpus.stats()
+        return status
 
 # 创建全局实例
 semantic_service = SemanticService()
@@ -26,21 +26,25 @@ class AITaggingService(BaseAIService):
             print("开始初始化AI标签服务...")
             
             # 初始化jieba
-            jieba.initialize()
-            self._setup_custom_dictionary()
+            self.prepare_jieba()
             
             self.initialized = True
             print("AI标签服务初始化完成")
-            
+        
         except Exception as e:
             print(f"AI标签服务初始化失败: {e}")
             self.initialized = False
     
+    def prepare_jieba(self):
+        """初始化jieba并加载自定义词典，搜索分词与标签提取共用同一套词典"""
+        jieba.initialize()
+        self._setup_custom_dictionary()
+    
     def _setup_custom_dictionary(self):
         """设置自定义词典"""
         if self.custom_dict_initialized:
             return
-            
+        
         # 技术相关词汇
         tech_words = [
             'Python', 'Java', 'JavaScript', 'Vue', 'React', 'Flask', 'Django',
@@ -120,7 +124,7 @@ class AITaggingService(BaseAIService):
                 'tags_count': len(final_tags),
                 'algorithms_used': list(set([algo for algo, _ in all_keywords[:top_k]]))
             }
-            
+        
         except Exception as e:
             print(f"标签提取失败，使用词频兜底: {e}")
             return self._fallback_tag_extraction(text, top_k)
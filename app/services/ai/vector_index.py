@@ -0,0 +1,389 @@
+"""
+语料向量索引
+在全部文档上拟合一次 TF-IDF（词表和IDF随后固定），文档向量按 L2 归一化存放在稀疏矩阵中，
+余弦相似度即点积：查询向量化后与整个矩阵做一次稀疏矩阵-向量乘，再用 argpartition 取 top-k。
+文档的新增、更新、删除只变换单个文档，不重新拟合；同时统计新文本中词表外词的比例（词表漂移），
+由调用方决定何时重新拟合
+"""
+import threading
+import time
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from app.services.search.analyzer import tokenize
+
+# 失效行超过该比例时压缩矩阵
+COMPACT_RATIO = 0.25
+# 文档数少于该值时不按 max_df 过滤高频词（两三篇文档时几乎每个词都“高频”）
+MIN_DOCS_FOR_MAX_DF = 10
+# 批量近邻计算每块乘积的内存上限（字节），按文档数确定每块的查询行数
+NEIGHBOR_MEMORY_BUDGET = 64 * 1024 * 1024
+
+def analyze(text):
+    """与搜索索引相同的分词和归一化（去除标点、空白，转小写）"""
+    return tokenize(text, search_mode=False)
+
+def _tokens(tokens):
+    """向量化器的 analyzer：输入已经是分好的词（每段文本只分词一次）"""
+    return tokens
+
+def document_text(title, content):
+    return f"{title or ''} {content or ''}".strip()
+
+def top_k_indices(scores, k):
+    """得分最高的k个下标（降序）：先 argpartition 选出k个，只对这k个排序"""
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k >= len(scores):
+        return np.argsort(-scores, kind='stable')
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+def nearest_neighbors(queries, query_ids, matrix, doc_ids, k, min_similarity=0.0,
+                      memory_budget=NEIGHBOR_MEMORY_BUDGET):
+    """分块计算每个查询向量的k个最近邻（排除查询文档自身）
+    
+    每块与整个矩阵做一次稀疏矩阵乘，乘积最多 块行数×文档数 个元素，
+    块行数按 memory_budget 确定，内存占用随文档数线性增长而不是平方增长
+    
+    Args:
+        queries: 查询向量（CSR，L2归一化），query_ids: 对应的文档ID
+        matrix, doc_ids: 文档向量及其文档ID
+        min_similarity: 只保留相似度大于该值的邻居
+    
+    Yields:
+        每块一个列表 [(查询文档ID, [(邻居ID, 相似度), ...]), ...]，邻居按相似度降序
+    """
+    count = matrix.shape[0]
+    # 每个乘积元素约12字节（float64 值 + int32 列号）
+    chunk_size = max(1, memory_budget // max(count * 12, 1))
+    transposed = matrix.T.tocsr()
+    
+    for start in range(0, len(query_ids), chunk_size):
+        product = (queries[start:start + chunk_size] @ transposed).tocsr()
+        chunk = []
+        for offset in range(product.shape[0]):
+            query_id = query_ids[start + offset]
+            begin, end = product.indptr[offset], product.indptr[offset + 1]
+            scores = product.data[begin:end]
+            columns = product.indices[begin:end]
+            keep = (scores > min_similarity) & (doc_ids[columns] != query_id)
+            scores, columns = scores[keep], columns[keep]
+            order = top_k_indices(scores, k)
+            chunk.append((int(query_id), [(int(doc_ids[columns[i]]), float(scores[i])) for i in order]))
+        yield chunk
+
+def max_similarity(queries, query_ids, matrix, doc_ids, memory_budget=NEIGHBOR_MEMORY_BUDGET):
+    """分块计算每个文档与任一查询向量的最大相似度（排除查询文档自身）
+    
+    分块方式与 nearest_neighbors 相同，每块的乘积按列取最大值后即丢弃，
+    结果只有一个长度为文档数的数组
+    
+    Returns:
+        与 doc_ids 对齐的最大相似度数组
+    """
+    count = matrix.shape[0]
+    chunk_size = max(1, memory_budget // max(count * 12, 1))
+    transposed = matrix.T.tocsr()
+    query_ids = np.asarray(query_ids)
+    best = np.zeros(count)
+    
+    for start in range(0, len(query_ids), chunk_size):
+        product = (queries[start:start + chunk_size] @ transposed).tocsr()
+        rows = np.repeat(np.arange(product.shape[0]), np.diff(product.indptr))
+        product.data[doc_ids[product.indices] == query_ids[start + rows]] = 0.0
+        np.maximum(best, product.max(axis=0).toarray().ravel(), out=best)
+    return best
+
+class CorpusVectors:
+    """文档向量矩阵
+    
+    matrix: 每行是一个文档的 L2 归一化 TF-IDF 向量（CSR）
+    doc_ids: 行号 -> 文档ID, rows: 文档ID -> 行号, alive: 行是否有效
+    更新文档 = 旧行失效 + 追加新行；新行先放入 pending，查询前一次性合并，
+    失效行超过 COMPACT_RATIO 时压缩
+    drift: 拟合后写入的文档数、词数和其中词表外的词数；
+           baseline_unknown_ratio 为拟合语料自身的词表外比例（max_features/max_df 裁掉的词）
+    ann: 可选的近似最近邻索引（LSHIndex），拟合时构建、随文档增删同步；
+         构建后查询只对其候选文档精确打分
+    """
+    
+    def __init__(self, max_features=20000, min_df=1, max_df=0.9, ann=None):
+        self.max_features = max_features
+        self.min_df = min_df
+        self.max_df = max_df
+        self.ann = ann
+        self.lock = threading.RLock()
+        self.clear()
+    
+    def clear(self):
+        with self.lock:
+            self.vectorizer = None
+            self.matrix = None
+            self.doc_ids = np.zeros(0, dtype=np.int64)
+            self.alive = np.zeros(0, dtype=bool)
+            self.rows = {}
+            self.pending = []
+            self.pending_ids = []
+            self._lookup = None
+            self.fitted_at = None
+            self.fitted_documents = 0
+            self.baseline_unknown_ratio = 0.0
+            self.drift = {'documents': 0, 'tokens': 0, 'unknown_tokens': 0}
+            if self.ann is not None:
+                self.ann.clear()
+    
+    @property
+    def fitted(self):
+        return self.vectorizer is not None
+    
+    def fit(self, documents):
+        """在语料上拟合词表和IDF，并向量化全部文档
+        
+        Args:
+            documents: 可迭代的 (文档ID, 文本)，空文本被忽略
+        """
+        doc_ids = []
+        texts = []
+        for doc_id, text in documents:
+            if text:
+                doc_ids.append(doc_id)
+                texts.append(analyze(text))
+        
+        if not texts:
+            self.clear()
+            return
+        
+        vectorizer = TfidfVectorizer(
+            analyzer=_tokens,
+            max_features=self.max_features,
+            min_df=self.min_df,
+            max_df=self.max_df if len(texts) >= MIN_DOCS_FOR_MAX_DF else 1.0
+        )
+        try:
+            matrix = vectorizer.fit_transform(texts).tocsr()
+        except ValueError as e:
+            # 全部文本分词后为空
+            print(f"语料向量拟合失败: {e}")
+            self.clear()
+            return
+        
+        vocabulary = vectorizer.vocabulary_
+        total = sum(len(tokens) for tokens in texts)
+        unknown = sum(1 for tokens in texts for token in tokens if token not in vocabulary)
+        
+        with self.lock:
+            self.vectorizer = vectorizer
+            self.matrix = matrix
+            self.doc_ids = np.array(doc_ids, dtype=np.int64)
+            self.alive = np.ones(len(doc_ids), dtype=bool)
+            self.rows = {doc_id: row for row, doc_id in enumerate(doc_ids)}
+            self.pending = []
+            self.pending_ids = []
+            self._lookup = None
+            self.fitted_at = time.time()
+            self.fitted_documents = len(doc_ids)
+            self.baseline_unknown_ratio = unknown / total if total else 0.0
+            self.drift = {'documents': 0, 'tokens': 0, 'unknown_tokens': 0}
+            if self.ann is not None:
+                self.ann.build(matrix, doc_ids)
+    
+    def transform(self, texts):
+        """用固定的词表向量化（L2归一化），未拟合时返回None"""
+        vectorizer = self.vectorizer
+        if vectorizer is None:
+            return None
+        return vectorizer.transform([analyze(text) for text in texts])
+    
+    def upsert(self, doc_id, text):
+        """新增或更新单个文档（未拟合时忽略，首次拟合会读到它）"""
+        if not text:
+            self.remove(doc_id)
+            return
+        vectorizer = self.vectorizer
+        if vectorizer is None:
+            return
+        tokens = analyze(text)
+        vector = vectorizer.transform([tokens])
+        vocabulary = vectorizer.vocabulary_
+        with self.lock:
+            self.drift['documents'] += 1
+            self.drift['tokens'] += len(tokens)
+            self.drift['unknown_tokens'] += sum(1 for token in tokens if token not in vocabulary)
+            self._discard(doc_id)
+            self.rows[doc_id] = len(self.doc_ids) + len(self.pending)
+            self.pending.append(vector)
+            self.pending_ids.append(doc_id)
+            if self.ann is not None:
+                self.ann.add(doc_id, vector)
+    
+    def remove(self, doc_id):
+        with self.lock:
+            self._discard(doc_id)
+    
+    def _discard(self, doc_id):
+        row = self.rows.get(doc_id)
+        if row is None:
+            return
+        if row >= len(self.alive):
+            self._merge()
+            row = self.rows[doc_id]
+        del self.rows[doc_id]
+        self.alive[row] = False
+        if self.ann is not None:
+            self.ann.remove(doc_id)
+    
+    def _merge(self):
+        """把 pending 中的新行并入矩阵，失效行过多时压缩"""
+        if self.pending:
+            self.matrix = sparse.vstack([self.matrix] + self.pending, format='csr')
+            self.doc_ids = np.concatenate([self.doc_ids, np.array(self.pending_ids, dtype=np.int64)])
+            self.alive = np.concatenate([self.alive, np.ones(len(self.pending), dtype=bool)])
+            self.pending = []
+            self.pending_ids = []
+            self._lookup = None
+        
+        dead = len(self.alive) - len(self.rows)
+        if dead and dead > COMPACT_RATIO * len(self.alive):
+            keep = np.flatnonzero(self.alive)
+            self.matrix = self.matrix[keep]
+            self.doc_ids = self.doc_ids[keep]
+            self.alive = np.ones(len(keep), dtype=bool)
+            self.rows = {int(doc_id): row for row, doc_id in enumerate(self.doc_ids)}
+            self._lookup = None
+    
+    def _rows_of(self, doc_ids):
+        """一批文档ID对应的有效行号（向量化查找，不在索引中的ID被丢弃）
+        
+        按文档ID排序的有效行在矩阵变化（合并、压缩）后重建；只删除时行不变，按 alive 过滤
+        """
+        if self._lookup is None:
+            live = np.flatnonzero(self.alive)
+            order = np.argsort(self.doc_ids[live], kind='stable')
+            self._lookup = (self.doc_ids[live][order], live[order])
+        sorted_ids, sorted_rows = self._lookup
+        if not len(sorted_ids):
+            return np.zeros(0, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(sorted_ids, doc_ids), len(sorted_ids) - 1)
+        rows = sorted_rows[positions[sorted_ids[positions] == doc_ids]]
+        return rows[self.alive[rows]]
+    
+    def drift_score(self):
+        """拟合后写入的文本中词表外词的比例比拟合语料高出多少（0表示没有漂移）"""
+        with self.lock:
+            tokens = self.drift['tokens']
+            if not tokens:
+                return 0.0
+            return max(0.0, self.drift['unknown_tokens'] / tokens - self.baseline_unknown_ratio)
+    
+    def changed_ratio(self):
+        """拟合后写入的文档数相对拟合时文档数的比例"""
+        with self.lock:
+            return self.drift['documents'] / max(self.fitted_documents, 1)
+    
+    def search(self, text, top_k=10, exclude=(), probes=None):
+        """与文本最相似的文档
+        
+        Returns:
+            [(文档ID, 余弦相似度), ...]，按相似度降序，只包含相似度大于0的文档
+        """
+        query = self.transform([text])
+        if query is None:
+            return []
+        return self.search_vector(query, top_k, exclude, probes=probes)
+    
+    def search_vector(self, query, top_k=10, exclude=(), probes=None, exact=False):
+        """与一个已向量化的查询（1行CSR）最相似的文档，返回格式同 search
+        
+        构建了近似索引时只对其候选文档打分（候选不足top_k时退回精确计算）
+        
+        Args:
+            probes: 近似索引每张表额外查看的相邻桶数（越大召回率越高、越慢），默认使用索引的设置
+            exact: 强制精确计算
+        """
+        if not query.nnz:
+            return []
+        
+        with self.lock:
+            self._merge()
+            if not self.rows:
+                return []
+            candidates = None
+            if not exact and self.ann is not None and self.ann.built:
+                candidates = self.ann.candidates(query, probes)
+                if exclude:
+                    candidates = candidates[~np.isin(candidates, list(exclude))]
+                candidates = self._rows_of(candidates)
+                if len(candidates) < top_k:
+                    candidates = None
+            
+            if candidates is not None:
+                rows = candidates
+                scores = (self.matrix[rows] @ query.T).toarray().ravel()
+                doc_ids = self.doc_ids[rows]
+            else:
+                scores = (self.matrix @ query.T).toarray().ravel()
+                scores[~self.alive] = 0
+                for doc_id in exclude:
+                    row = self.rows.get(doc_id)
+                    if row is not None:
+                        scores[row] = 0
+                doc_ids = self.doc_ids
+        
+        return [
+            (int(doc_ids[row]), float(scores[row]))
+            for row in top_k_indices(scores, top_k) if scores[row] > 0
+        ]
+    
+    def snapshot(self):
+        """当前全部有效文档的 (向量矩阵, 文档ID数组)，之后的写入不影响返回值"""
+        with self.lock:
+            self._merge()
+            if self.matrix is None:
+                return None, np.zeros(0, dtype=np.int64)
+            keep = np.flatnonzero(self.alive)
+            return self.matrix[keep], self.doc_ids[keep]
+    
+    def document_vectors(self, doc_ids):
+        """文档在索引中的向量，每个ID一行
+        
+        Returns:
+            (CSR矩阵, 不在索引中的文档ID列表)，缺失文档对应零行
+        """
+        with self.lock:
+            self._merge()
+            rows = [self.rows.get(doc_id) for doc_id in doc_ids]
+            present = np.array([row is not None for row in rows], dtype=float)
+            matrix = self.matrix[[row or 0 for row in rows]]
+        missing = [doc_id for doc_id, row in zip(doc_ids, rows) if row is None]
+        if missing:
+            matrix = sparse.diags(present) @ matrix
+        return matrix.tocsr(), missing
+    
+    @staticmethod
+    def similarity(queries, candidates):
+        """两组 L2 归一化向量两两之间的余弦相似度（查询数 × 候选数，稠密数组）"""
+        return (queries @ candidates.T).toarray()
+    
+    def __len__(self):
+        return len(self.rows)
+    
+    def __contains__(self, doc_id):
+        return doc_id in self.rows
+    
+    def stats(self):
+        with self.lock:
+            return {
+                'documents': len(self.rows),
+                'vocabulary': len(self.vectorizer.vocabulary_) if self.vectorizer else 0,
+                'nnz': (self.matrix.nnz if self.matrix is not None else 0) + sum(v.nnz for v in self.pending),
+                'pending': len(self.pending),
+                'dead_rows': len(self.alive) + len(self.pending) - len(self.rows),
+                'fitted_at': self.fitted_at,
+                'fitted_documents': self.fitted_documents,
+                'changed_documents': self.drift['documents'],
+                'drift': round(self.drift_score(), 4),
+                'ann': self.ann.stats() if self.ann is not None else None
+            }
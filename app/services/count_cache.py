@@ -0,0 +1,107 @@
+"""
+计数缓存模块
+缓存搜索和列表接口的匹配总数，文档写入提交后整体失效；
+数据量较大、精确计数代价过高时改用抽样估算，并标记为近似值
+"""
+import threading
+import time
+
+from flask import current_app
+
+from app.models import Document
+
+# 精确计数的文档规模上限，超过后优先使用后端提供的估算
+DEFAULT_EXACT_THRESHOLD = 50000
+# 缓存有效期（秒），兜底覆盖不经过ORM会话的写入
+DEFAULT_TTL = 300
+
+_DOCUMENT_TOTAL_KEY = ('documents',)
+
+class CountCache:
+    """匹配总数缓存
+    
+    作为 index_sync 的监听器注册，任何文档新增、更新、删除提交后清空缓存。
+    缓存值为 (总数, 是否近似)；搜索的缓存键为 (后端名称, SearchQuery.cache_key())。
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'estimates': 0,
+            'invalidations': 0
+        }
+    
+    def _config(self, name, default):
+        try:
+            return current_app.config.get(name, default)
+        except RuntimeError:
+            # 不在应用上下文中（如单元测试）时使用默认值
+            return default
+    
+    def get(self, key):
+        """读取缓存，返回 (总数, 是否近似) 或 None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[2] < time.time():
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            return entry[0], entry[1]
+    
+    def set(self, key, total, approximate=False):
+        expires = time.time() + self._config('COUNT_CACHE_TTL', DEFAULT_TTL)
+        with self.lock:
+            self.entries[key] = (total, approximate, expires)
+    
+    def get_or_count(self, key, count, estimate=None):
+        """读取缓存，未命中时计数并写入缓存
+        
+        Args:
+            count: 精确计数函数
+            estimate: 估算函数，返回估算值或None（不支持估算）；
+                      仅在文档总数超过 COUNT_EXACT_THRESHOLD 时使用
+        
+        Returns:
+            (总数, 是否近似)
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        
+        if estimate is not None:
+            threshold = self._config('COUNT_EXACT_THRESHOLD', DEFAULT_EXACT_THRESHOLD)
+            if self.document_total() > threshold:
+                total = estimate()
+                if total is not None:
+                    self.stats['estimates'] += 1
+                    self.set(key, total, approximate=True)
+                    return total, True
+        
+        total = count()
+        self.set(key, total)
+        return total, False
+    
+    def document_total(self):
+        """文档总数（精确值）"""
+        total, _ = self.get_or_count(_DOCUMENT_TOTAL_KEY, Document.query.count)
+        return total
+    
+    def invalidate(self):
+        """清空全部缓存"""
+        with self.lock:
+            self.entries.clear()
+            self.stats['invalidations'] += 1
+    
+    def on_documents_changed(self, upserts, deleted_ids):
+        """索引同步回调：文档变化后所有匹配总数都可能改变"""
+        self.invalidate()
+    
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries))
+
+# 创建全局计数缓存实例
+count_cache = CountCache()
@@ -0,0 +1,113 @@
+"""
+索引同步模块
+监听 SQLAlchemy 会话事件，在事务提交后把文档的新增、更新、删除增量推送给各个索引，
+每次只处理本次提交中真正变化的文档，不再依赖全量重建
+"""
+from sqlalchemy import event, inspect
+
+from app.models import Document
+
+# 影响索引内容的字段，只修改其他字段（如 updated_at）时不推送增量
+INDEXED_FIELDS = ('title', 'content', 'tags', 'category_id', 'file_type', 'created_at')
+
+_PENDING_KEY = 'index_sync_pending'
+
+class DocumentSnapshot:
+    """文档快照
+    
+    提交后ORM实例会过期，再访问属性会触发新的查询，
+    因此在flush时记录索引需要的字段，监听器只使用快照
+    """
+    
+    __slots__ = ('id', 'title', 'content', 'tags', 'category_id', 'file_type', 'created_at', 'updated_at')
+    
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+    
+    @classmethod
+    def from_document(cls, document):
+        return cls(**{name: getattr(document, name) for name in cls.__slots__})
+
+class IndexSync:
+    """文档变更到索引的同步器
+    
+    监听器需要实现 on_documents_changed(upserts, deleted_ids)：
+        upserts: [DocumentSnapshot, ...] 新增或更新的文档
+        deleted_ids: [文档ID, ...] 已删除的文档
+    """
+    
+    def __init__(self):
+        self.listeners = []
+        self.installed = False
+        self.stats = {
+            'commits': 0,
+            'upserts': 0,
+            'deletes': 0,
+            'listener_errors': 0
+        }
+    
+    def register(self, listener):
+        """注册索引监听器"""
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+    
+    def install(self, session):
+        """在会话（或scoped_session）上挂载事件"""
+        if self.installed:
+            return
+        event.listen(session, 'after_flush', self._after_flush)
+        event.listen(session, 'after_commit', self._after_commit)
+        event.listen(session, 'after_rollback', self._after_rollback)
+        self.installed = True
+    
+    @staticmethod
+    def _indexed_fields_changed(document):
+        state = inspect(document)
+        return any(
+            state.attrs[name].history.has_changes() for name in INDEXED_FIELDS
+        )
+    
+    def _after_flush(self, session, flush_context):
+        """flush时收集文档变更（此时新文档已有ID，变更历史仍可读取）"""
+        pending = session.info.setdefault(_PENDING_KEY, {})
+        
+        for obj in session.new:
+            if isinstance(obj, Document):
+                pending[obj.id] = DocumentSnapshot.from_document(obj)
+        
+        for obj in session.dirty:
+            if isinstance(obj, Document) and self._indexed_fields_changed(obj):
+                pending[obj.id] = DocumentSnapshot.from_document(obj)
+        
+        for obj in session.deleted:
+            if isinstance(obj, Document):
+                pending[obj.id] = None
+    
+    def _after_commit(self, session):
+        """提交成功后推送增量"""
+        pending = session.info.pop(_PENDING_KEY, None)
+        if not pending:
+            return
+        
+        upserts = [snapshot for snapshot in pending.values() if snapshot is not None]
+        deleted_ids = [doc_id for doc_id, snapshot in pending.items() if snapshot is None]
+        
+        self.stats['commits'] += 1
+        self.stats['upserts'] += len(upserts)
+        self.stats['deletes'] += len(deleted_ids)
+        
+        for listener in self.listeners:
+            try:
+                listener.on_documents_changed(upserts, deleted_ids)
+            except Exception as e:
+                # 索引同步失败不影响已提交的写入
+                self.stats['listener_errors'] += 1
+                print(f"索引增量同步失败 ({type(listener).__name__}): {e}")
+    
+    def _after_rollback(self, session):
+        """回滚后丢弃未提交的变更"""
+        session.info.pop(_PENDING_KEY, None)
+
+# 创建全局同步器实例
+index_sync = IndexSync()
@@ -0,0 +1,40 @@
+"""
+搜索引擎模块
+提供分词、倒排索引、相关度排序以及可插拔的检索后端
+"""
+
+from .analyzer import tokenize, analyze_keyword, analyze_query, normalize_term
+from .inverted_index import InvertedIndex
+from .ranking import BM25FScorer
+from .suggester import SuggestionTrie
+from .query import SearchQuery, Phrase, QuerySyntaxError, parse_query
+from .backends import (
+    SearchBackend,
+    KEYSET_SORTS,
+    LikeBackend,
+    InvertedIndexBackend,
+    MySQLFulltextBackend,
+    SQLiteFTS5Backend,
+    create_backend
+)
+
+__all__ = [
+    'tokenize',
+    'analyze_keyword',
+    'analyze_query',
+    'normalize_term',
+    'InvertedIndex',
+    'BM25FScorer',
+    'SuggestionTrie',
+    'SearchQuery',
+    'Phrase',
+    'QuerySyntaxError',
+    'parse_query',
+    'SearchBackend',
+    'KEYSET_SORTS',
+    'LikeBackend',
+    'InvertedIndexBackend',
+    'MySQLFulltextBackend',
+    'SQLiteFTS5Backend',
+    'create_backend'
+]
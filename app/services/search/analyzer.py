@@ -0,0 +1,115 @@
+"""
+搜索分词模块
+为倒排索引和查询提供统一的jieba分词与词项归一化
+"""
+import re
+from functools import lru_cache
+
+import jieba
+
+# 只包含标点、空白或下划线的词元不进入索引
+_NOISE_PATTERN = re.compile(r'^[\W_]+$')
+_CJK_PATTERN = re.compile(r'[\u4e00-\u9fa5]')
+
+_dictionary_ready = False
+
+def ensure_dictionary():
+    """加载标签服务的自定义技术词典，保证索引和查询使用相同的切分方式"""
+    global _dictionary_ready
+    if _dictionary_ready:
+        return
+    
+    from app.services.ai.tagging_service import tagging_service
+    tagging_service.prepare_jieba()
+    _dictionary_ready = True
+
+def normalize_term(word):
+    """词项归一化：去除首尾空白并转为小写"""
+    return word.strip().lower() if word else ''
+
+def iter_tokens(text, search_mode=True):
+    """逐个输出 (词项, 位置, 字符偏移)
+    
+    Args:
+        search_mode: True时对长词额外输出词典中的子词（与jieba搜索引擎模式一致），
+                     子词与原词共享同一个位置，便于后续的短语匹配
+    """
+    if not text:
+        return
+    
+    ensure_dictionary()
+    freq = jieba.dt.FREQ
+    
+    position = 0
+    for word, start, _ in jieba.tokenize(text):
+        term = normalize_term(word)
+        if not term or _NOISE_PATTERN.match(term):
+            continue
+        
+        yield term, position, start
+        
+        if search_mode and len(word) > 2:
+            for n in (2, 3):
+                if len(word) <= n:
+                    continue
+                for i in range(len(word) - n + 1):
+                    gram = word[i:i + n]
+                    if freq.get(gram):
+                        yield normalize_term(gram), position, start + i
+        
+        position += 1
+
+def tokenize(text, search_mode=True):
+    """返回文本的词项列表"""
+    return [term for term, _, _ in iter_tokens(text, search_mode=search_mode)]
+
+def analyze_keyword(keyword):
+    """将单个查询关键词切分为词项（精确模式，不输出子词）"""
+    terms = []
+    for term in tokenize(keyword, search_mode=False):
+        if term not in terms:
+            terms.append(term)
+    return terms
+
+def _is_query_term(term, stop_words):
+    if term in stop_words or _NOISE_PATTERN.match(term):
+        return False
+    # 单个汉字保留，单个字母或数字仍视为噪声
+    return len(term) > 1 or bool(_CJK_PATTERN.match(term))
+
+@lru_cache(maxsize=2048)
+def analyze_query(query, search_mode='or'):
+    """查询分析：按空白拆分为短语，再用jieba切分并去除停用词
+    
+    OR模式输出原始短语和切分出的词项（短语本身用于整体命中和高亮）；
+    AND模式只输出词项，避免“所有关键词都必须命中”退化为整个短语的子串匹配。
+    结果按查询串缓存，重复查询不再分词。
+    
+    Returns:
+        关键词元组（大小写不敏感去重，保持出现顺序）
+    """
+    from app.services.ai.tagging_service import tagging_service
+    ensure_dictionary()
+    stop_words = tagging_service.stop_words
+    
+    keywords = []
+    seen = set()
+    
+    def emit(word):
+        key = normalize_term(word)
+        if key and key not in seen:
+            seen.add(key)
+            keywords.append(word)
+    
+    for phrase in query.split():
+        terms = [
+            word.strip() for word in jieba.cut(phrase)
+            if _is_query_term(normalize_term(word), stop_words)
+        ]
+        if search_mode != 'and' or not terms:
+            if _is_query_term(normalize_term(phrase), stop_words):
+                emit(phrase)
+        for term in terms:
+            emit(term)
+    
+    return tuple(keywords)
@@ -0,0 +1,34 @@
+"""
+搜索后端
+通过配置 SEARCH_BACKEND 选择具体的检索引擎
+"""
+
+from .base import SearchBackend, KEYSET_SORTS
+from .like_backend import LikeBackend
+from .index_backend import InvertedIndexBackend
+from .mysql_fulltext import MySQLFulltextBackend
+from .sqlite_fts import SQLiteFTS5Backend
+
+# 后端名称 -> 后端类
+BACKENDS = {
+    backend_class.name: backend_class
+    for backend_class in (LikeBackend, InvertedIndexBackend, MySQLFulltextBackend, SQLiteFTS5Backend)
+}
+
+def create_backend(name):
+    """按名称创建搜索后端实例"""
+    backend_class = BACKENDS.get(name)
+    if backend_class is None:
+        raise ValueError(f'未知的搜索后端: {name}')
+    return backend_class()
+
+__all__ = [
+    'SearchBackend',
+    'KEYSET_SORTS',
+    'LikeBackend',
+    'InvertedIndexBackend',
+    'MySQLFulltextBackend',
+    'SQLiteFTS5Backend',
+    'BACKENDS',
+    'create_backend'
+]
@@ -0,0 +1,216 @@
+"""
+搜索后端基类
+统一索引维护、检索、计数和搜索建议接口，具体引擎由配置 SEARCH_BACKEND 选择
+"""
+from abc import ABC, abstractmethod
+from sqlalchemy import or_, and_, select
+
+from app.models import Document, Tag, document_tags
+
+# 游标分页支持的排序方式：排序键为 (created_at, id)
+KEYSET_SORTS = ('date_desc', 'date_asc')
+
+def apply_sort(base_query, sort_by):
+    """为SQL查询附加非相关度的排序方式"""
+    if sort_by == 'date_asc':
+        return base_query.order_by(Document.created_at.asc())
+    if sort_by == 'title':
+        return base_query.order_by(Document.title.asc())
+    return base_query.order_by(Document.created_at.desc())
+
+def keyset_condition(after, ascending=False):
+    """游标分页条件：位于 (created_at, id) 之后的文档
+    
+    拆成 OR 形式以便使用 idx_document_created（二级索引隐含主键id）
+    """
+    created_at, doc_id = after
+    if ascending:
+        return or_(
+            Document.created_at > created_at,
+            and_(Document.created_at == created_at, Document.id > doc_id)
+        )
+    return or_(
+        Document.created_at < created_at,
+        and_(Document.created_at == created_at, Document.id < doc_id)
+    )
+
+def keyset_order(ascending=False):
+    """游标分页排序：(created_at, id)"""
+    if ascending:
+        return Document.created_at.asc(), Document.id.asc()
+    return Document.created_at.desc(), Document.id.desc()
+
+def keyset_page(base_query, after, per_page, sort_by):
+    """对SQL查询执行一次游标分页，多取一条用于判断是否还有下一页
+    
+    Returns:
+        (当前页文档, 是否还有更多)
+    """
+    ascending = sort_by == 'date_asc'
+    if after is not None:
+        base_query = base_query.filter(keyset_condition(after, ascending))
+    documents = base_query.order_by(*keyset_order(ascending)).limit(per_page + 1).all()
+    return documents[:per_page], len(documents) > per_page
+
+def tag_condition(tag):
+    """带有该标签（不区分大小写），经 document_tags 关联表走索引查找"""
+    tagged = select(document_tags.c.document_id).join(
+        Tag, Tag.id == document_tags.c.tag_id
+    ).where(Tag.normalized == Tag.normalize(tag))
+    return Document.id.in_(tagged)
+
+def keyword_condition(keyword):
+    """关键词在标题、正文中出现（LIKE）或是文档的标签"""
+    return (
+        Document.title.contains(keyword) |
+        Document.content.contains(keyword) |
+        tag_condition(keyword)
+    )
+
+def exclusion_condition(keyword):
+    """关键词不在标题、正文中出现，也不是文档的标签"""
+    return and_(
+        ~Document.title.contains(keyword),
+        ~Document.content.contains(keyword),
+        ~tag_condition(keyword)
+    )
+
+def filter_conditions(search_query):
+    """字段限定、排除和过滤条件对应的SQL条件
+    
+    分类和时间条件可以使用 idx_document_category / idx_document_created
+    """
+    # title:"A B" 要求其中每个词都出现在标题中
+    conditions = [
+        Document.title.contains(word) for term in search_query.title_terms for word in term.split()
+    ]
+    conditions.extend(tag_condition(tag) for tag in search_query.tags)
+    conditions.extend(exclusion_condition(keyword) for keyword in search_query.excluded)
+    # -title:"A B" 排除标题中同时出现其中每个词的文档
+    conditions.extend(
+        ~and_(*(Document.title.contains(word) for word in term.split()))
+        for term in search_query.excluded_title
+    )
+    conditions.extend(~tag_condition(tag) for tag in search_query.excluded_tags)
+    if search_query.category is not None:
+        conditions.append(Document.category_id == search_query.category_id)
+    if search_query.after:
+        conditions.append(Document.created_at >= search_query.after)
+    if search_query.before:
+        conditions.append(Document.created_at < search_query.before)
+    return conditions
+
+def fetch_documents(doc_ids):
+    """按ID回表并保持给定顺序"""
+    if not doc_ids:
+        return []
+    
+    documents = Document.query.filter(Document.id.in_(doc_ids)).all()
+    order = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+    documents.sort(key=lambda doc: order[doc.id])
+    return documents
+
+class SearchBackend(ABC):
+    """搜索后端基类
+    
+    没有位置信息的后端把短语/邻近查询退化为“短语中的词项全部出现”
+    """
+    
+    name = None
+    
+    def __init__(self):
+        self.initialized = False
+    
+    def initialize(self):
+        """准备后端需要的索引结构，默认无需处理"""
+        self.initialized = True
+    
+    def ensure_initialized(self):
+        """确保后端已初始化"""
+        if not self.initialized:
+            self.initialize()
+    
+    @abstractmethod
+    def index_document(self, doc):
+        """新增或更新单个文档的索引"""
+        pass
+    
+    @abstractmethod
+    def delete_document(self, doc_id):
+        """删除单个文档的索引"""
+        pass
+    
+    @abstractmethod
+    def query(self, search_query, page=1, per_page=10, sort_by='relevance', count=True):
+        """执行检索
+        
+        Args:
+            search_query: 解析后的查询（SearchQuery）
+            count: 是否同时计算总数；为False时需要额外查询才能得到总数的后端返回None
+        
+        Returns:
+            (当前页文档, 总数或None, 相关度分数字典或None)
+            分数字典为None时表示结果未按相关度全局排序
+        """
+        pass
+    
+    @abstractmethod
+    def query_after(self, search_query, after=None, per_page=10, sort_by='date_desc'):
+        """游标分页检索（按 (created_at, id) 排序，无OFFSET、不计数）
+        
+        Args:
+            after: 上一页最后一条的 (created_at, id)，None表示第一页
+            sort_by: KEYSET_SORTS 之一
+        
+        Returns:
+            (当前页文档, 是否还有更多)
+        """
+        pass
+    
+    @abstractmethod
+    def count(self, search_query):
+        """匹配文档总数"""
+        pass
+    
+    def expand(self, search_query):
+        """拼写容错：为词表中不存在的关键词填充 search_query.fuzzy，默认不支持"""
+        pass
+    
+    def estimate_count(self, search_query):
+        """估算匹配文档总数，默认不支持估算（返回None）"""
+        return None
+    
+    def score(self, search_query, doc_ids):
+        """给定文档的相关度分数（与 query 按相关度排序时返回的分数同一尺度）
+        
+        结果不是按相关度取出时（游标分页、按时间排序）用它补齐分数，
+        使同一查询的 relevance_score 不随分页和排序方式变化；默认不支持（返回None）
+        
+        Returns:
+            {文档ID: 分数}，未命中的文档可以缺省（视为0）
+        """
+        return None
+    
+    def facets(self, search_query, tag_limit=10):
+        """匹配集合的分面计数，默认不支持（返回None，由调用方改用倒排索引后端）
+        
+        Returns:
+            {'category': {分类ID: 数量}, 'file_type': {类型: 数量}, 'tags': [(标签, 数量), ...]}
+        """
+        return None
+    
+    def term_offsets(self, doc_id, terms):
+        """文档正文中词项的命中区间，默认不提供（由高亮自行查找）"""
+        return None
+    
+    @abstractmethod
+    def suggest(self, query, limit=5):
+        """搜索建议（文档标题列表）"""
+        pass
+    
+    def stats(self):
+        """后端状态信息"""
+        return {
+            'backend': self.name,
+            'initialized': self.initialized
+        }
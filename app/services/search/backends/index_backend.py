@@ -0,0 +1,422 @@
+"""
+进程内倒排索引后端
+OR/AND检索为倒排表并集/交集，短语/邻近查询为位置列表归并，相关度排序为全候选集BM25F打分；
+字段限定和过滤条件编译为执行计划，按估计命中数从小到大求交。
+配置 SEARCH_INDEX_DIR 后索引持久化为段文件：启动时映射已有的段，只对数据库中变化过的文档重新分词。
+多个工作进程共享段目录时，得到目录锁的进程是写入者（落盘、合并、记录删除标记），
+其他进程只读映射段，清单变化时重新载入，内存段只保存与数据库对齐时补进的文档
+"""
+import threading
+import time
+
+from flask import current_app
+
+from app import db
+from app.models import Document
+from app.services.search.analyzer import normalize_term
+from app.services.search.inverted_index import InvertedIndex, TITLE
+from app.services.search.ranking import BM25FScorer
+from app.services.search.segments import SegmentStore, SegmentMaintainer
+from app.services.search.backends.base import SearchBackend, fetch_documents
+
+class InvertedIndexBackend(SearchBackend):
+    """基于内存倒排索引的检索后端"""
+    
+    name = 'index'
+    
+    def __init__(self):
+        super().__init__()
+        self.index = InvertedIndex()
+        self.scorer = BM25FScorer(self.index)
+        self.store = None
+        self.maintainer = None
+        # 只读进程重新载入时替换索引，期间推送来的变更等替换完成后再写入
+        self.reload_lock = threading.RLock()
+        self.check_lock = threading.Lock()
+        self.reload_interval = 5
+        self.checked_at = 0.0
+        self.reloads = 0
+        self.app = None
+    
+    def initialize(self):
+        directory = current_app.config.get('SEARCH_INDEX_DIR')
+        if not directory:
+            self.rebuild()
+            return
+        
+        self.app = current_app._get_current_object()
+        self.reload_interval = current_app.config.get('SEARCH_INDEX_RELOAD_INTERVAL', 5)
+        self.store = SegmentStore(directory)
+        if self.store.writable:
+            segments = self.store.open_segments()
+            if segments:
+                self.index.attach_segments(segments)
+                self.initialized = True
+                changed = self.catch_up()
+                print(f"搜索索引从 {len(segments)} 个段加载完成，与数据库对齐 {changed} 个文档")
+            else:
+                self.rebuild()
+            self._start_maintainer()
+        else:
+            changed = self.reload()
+            print(f"索引段目录由其他进程写入，本进程只读映射 {len(self.index.segments)} 个段，"
+                  f"与数据库对齐 {changed} 个文档")
+    
+    def ensure_initialized(self):
+        super().ensure_initialized()
+        if self.store is not None and not self.store.writable:
+            self._follow_writer()
+    
+    def _start_maintainer(self):
+        """写入者：落盘当前内存段并启动维护线程"""
+        self.index.flush(self.store)
+        self.store.save_deletes(self.index.deleted_documents())
+        self.maintainer = SegmentMaintainer(
+            self.index, self.store,
+            interval=self.app.config.get('SEARCH_INDEX_FLUSH_INTERVAL', 60),
+            flush_docs=self.app.config.get('SEARCH_INDEX_FLUSH_DOCS', 1000),
+            merge_factor=self.app.config.get('SEARCH_INDEX_MERGE_FACTOR', 4),
+            catch_up=self._catch_up_in_context
+        )
+        self.maintainer.start()
+    
+    def _catch_up_in_context(self):
+        """维护线程中与数据库对齐（补进其他进程提交的变更）"""
+        with self.app.app_context():
+            self.catch_up()
+    
+    def _follow_writer(self):
+        """只读进程：写入者已退出时接替写入，否则清单变化时重新载入（按 reload_interval 限频）"""
+        if time.time() - self.checked_at < self.reload_interval:
+            return
+        # 同一时刻只有一个请求线程检查和载入，其他线程继续使用当前索引
+        if not self.check_lock.acquire(blocking=False):
+            return
+        try:
+            self.checked_at = time.time()
+            if self.store.acquire():
+                print(f"索引段目录的写入者已退出，本进程接替写入: {self.store.directory}")
+                self.reload()
+                self._start_maintainer()
+            elif self.store.changed():
+                self.reload()
+        finally:
+            self.check_lock.release()
+    
+    def reload(self):
+        """按清单重新映射段并与数据库对齐，完成后替换当前索引
+        
+        只读进程自己不落盘：数据库中比段更新的文档（包括本进程提交的变更）留在内存段中，
+        写入者落盘之后的下一次载入会改由段提供
+        
+        Returns:
+            与数据库对齐时重新索引和移除的文档数
+        """
+        with self.reload_lock:
+            index = InvertedIndex()
+            segments = self.store.open_segments()
+            if segments:
+                index.attach_segments(segments)
+                changed = self.catch_up(index=index)
+            else:
+                index.build(self._rows().yield_per(1000))
+                changed = len(index.documents)
+            self.index, self.scorer = index, BM25FScorer(index)
+            self.initialized = True
+            self.reloads += 1
+            return changed
+    
+    @staticmethod
+    def _rows():
+        return db.session.query(
+            Document.id,
+            Document.title,
+            Document.content,
+            Document.tags,
+            Document.category_id,
+            Document.file_type,
+            Document.created_at,
+            Document.updated_at
+        )
+    
+    def rebuild(self):
+        """从数据库全量重建倒排索引"""
+        self.index.build(self._rows().yield_per(1000))
+        self.initialized = True
+        print(f"搜索索引构建完成: {self.index.stats()}")
+    
+    def catch_up(self, batch_size=500, index=None):
+        """把从段载入的索引与数据库对齐：段落盘之后新增或修改的文档重新索引，已删除的移除
+        
+        只读取 (id, updated_at) 两列比较，没有变化的文档不重新分词
+        
+        Args:
+            index: 要对齐的索引，默认为当前索引
+        
+        Returns:
+            重新索引和移除的文档数
+        """
+        if index is None:
+            index = self.index
+        documents = index.documents
+        seen = set()
+        stale = []
+        for doc_id, updated_at in db.session.query(Document.id, Document.updated_at).yield_per(5000):
+            seen.add(doc_id)
+            entry = documents.get(doc_id)
+            if entry is None or entry.updated_at < index._timestamp(updated_at):
+                stale.append(doc_id)
+        
+        removed = index.all_ids() - seen
+        for doc_id in removed:
+            index.remove_document(doc_id)
+        for start in range(0, len(stale), batch_size):
+            for row in self._rows().filter(Document.id.in_(stale[start:start + batch_size])):
+                index.add_document(row)
+        return len(stale) + len(removed)
+    
+    def expand(self, search_query):
+        search_query.fuzzy = self.index.fuzzy_alternatives(search_query.keywords)
+    
+    def index_document(self, doc):
+        with self.reload_lock:
+            self.index.add_document(doc)
+        if self.maintainer is not None and self.index.memory_size() >= self.maintainer.flush_docs:
+            self.maintainer.wakeup()
+    
+    def delete_document(self, doc_id):
+        with self.reload_lock:
+            self.index.remove_document(doc_id)
+    
+    def _plan(self, search_query):
+        """执行计划：产生候选集的步骤，按估计命中数升序
+        
+        每个步骤为 (名称, 估计命中数, 取候选集函数, 逐文档检查函数)；
+        检查函数为None的步骤只能通过求交执行
+        """
+        index = self.index
+        steps = []
+        
+        if search_query.keywords:
+            fuzzy = search_query.fuzzy
+            estimates = [
+                index.estimate_keyword(keyword) +
+                sum(index.estimate_keyword(alternative) for alternative in fuzzy.get(keyword, ()))
+                for keyword in search_query.keywords
+            ]
+            estimate = min(estimates) if search_query.search_mode == 'and' else sum(estimates)
+            steps.append((
+                'keywords', estimate,
+                lambda: index.match(search_query.keywords, search_query.search_mode, fuzzy), None
+            ))
+        
+        for term in search_query.title_terms:
+            steps.append((
+                f'title:{term}', index.estimate_keyword(term),
+                lambda term=term: index.match_field(term, TITLE), None
+            ))
+        
+        for tag in search_query.tags:
+            tag_ids = index.docs_with_tag(tag)
+            normalized = normalize_term(tag)
+            steps.append((
+                f'tag:{tag}', len(tag_ids),
+                lambda tag_ids=tag_ids: tag_ids,
+                lambda entry, normalized=normalized: normalized in entry.tags
+            ))
+        
+        if search_query.category is not None:
+            category_id = search_query.category_id
+            category_ids = index.docs_in_category(category_id)
+            steps.append((
+                f'category:{search_query.category}', len(category_ids),
+                lambda: category_ids,
+                lambda entry: entry.category_id == category_id
+            ))
+        
+        if search_query.after or search_query.before:
+            after = index._timestamp(search_query.after) if search_query.after else None
+            before = index._timestamp(search_query.before) if search_query.before else None
+            steps.append((
+                'created_at', index.count_created_range(search_query.after, search_query.before),
+                lambda: index.created_range(search_query.after, search_query.before),
+                lambda entry: (after is None or entry.created_at >= after) and
+                              (before is None or entry.created_at < before)
+            ))
+        
+        steps.sort(key=lambda step: step[1])
+        return steps
+    
+    def _category_excludes(self, search_query):
+        """限定分类时，用各段的分类布隆过滤器判断必须命中的词是否一定不在该分类中
+        
+        成立时不必物化任何倒排表或分类集合
+        """
+        index = self.index
+        category_id = search_query.category_id
+        
+        def absent(word):
+            return not index.keyword_may_match(word, category_id)
+        
+        def keyword_absent(keyword):
+            return absent(keyword) and all(
+                absent(alternative) for alternative in search_query.fuzzy.get(keyword, ())
+            )
+        
+        keywords = search_query.keywords
+        if keywords:
+            if search_query.search_mode == 'and':
+                if any(keyword_absent(keyword) for keyword in keywords):
+                    return True
+            elif all(keyword_absent(keyword) for keyword in keywords):
+                return True
+        if any(absent(term) for term in search_query.title_terms):
+            return True
+        # 短语的任一切分方式中的词项都齐全才可能命中
+        return any(
+            all(any(absent(term) for term, _ in terms) for terms in phrase.variants)
+            for phrase in search_query.phrases
+        )
+    
+    def _match(self, search_query, trace=None):
+        """执行查询计划，返回匹配的文档ID集合
+        
+        Args:
+            trace: 传入列表时记录每一步的策略和结果数量（用于 explain）
+        """
+        index = self.index
+        if search_query.category is not None and self._category_excludes(search_query):
+            if trace is not None:
+                trace.append({'step': f'category:{search_query.category}', 'strategy': 'bloom', 'matched': 0})
+            return set()
+        
+        matched_ids = None
+        for name, estimate, produce, check in self._plan(search_query):
+            if matched_ids is not None and not matched_ids:
+                break
+            if matched_ids is not None and check is not None and len(matched_ids) < estimate:
+                # 候选集已经比该条件的命中集小：逐文档检查元数据，不再物化命中集
+                strategy = 'check'
+                documents = index.documents
+                matched_ids = {
+                    doc_id for doc_id in matched_ids
+                    if doc_id in documents and check(documents[doc_id])
+                }
+            else:
+                strategy = 'postings' if check is None else 'bitmap'
+                ids = produce()
+                matched_ids = set(ids) if matched_ids is None else matched_ids & ids
+            if trace is not None:
+                trace.append({'step': name, 'estimate': estimate, 'strategy': strategy, 'matched': len(matched_ids)})
+        
+        for phrase in search_query.phrases:
+            if matched_ids is not None and not matched_ids:
+                break
+            phrase_ids = set()
+            for terms in phrase.variants:
+                phrase_ids |= index.match_phrase(terms, phrase.slop, candidates=matched_ids)
+            matched_ids = phrase_ids
+            if trace is not None:
+                trace.append({'step': f'"{phrase.text}"', 'strategy': 'positions', 'matched': len(matched_ids)})
+        
+        if matched_ids is None:
+            matched_ids = index.all_ids()
+        
+        for keyword in search_query.excluded:
+            if not matched_ids:
+                break
+            matched_ids = matched_ids - index.match([keyword])
+            if trace is not None:
+                trace.append({'step': f'-{keyword}', 'strategy': 'exclude', 'matched': len(matched_ids)})
+        for term in search_query.excluded_title:
+            if not matched_ids:
+                break
+            matched_ids = matched_ids - index.match_field(term, TITLE)
+            if trace is not None:
+                trace.append({'step': f'-title:{term}', 'strategy': 'exclude', 'matched': len(matched_ids)})
+        for tag in search_query.excluded_tags:
+            if not matched_ids:
+                break
+            matched_ids = matched_ids - index.docs_with_tag(tag)
+            if trace is not None:
+                trace.append({'step': f'-tag:{tag}', 'strategy': 'exclude', 'matched': len(matched_ids)})
+        
+        return matched_ids
+    
+    def explain(self, search_query, k=10):
+        """执行查询并返回各步骤的执行策略和结果数量，含相关度排序取前k个时实际打分的文档数"""
+        trace = []
+        matched_ids = self._match(search_query, trace)
+        terms = self._score_terms(search_query)
+        if terms and matched_ids:
+            self.scorer.top_k(terms, matched_ids, k, trace=trace)
+        return trace
+    
+    def _score_terms(self, search_query):
+        alternatives = [
+            alternative for keyword in search_query.keywords
+            for alternative in search_query.fuzzy.get(keyword, ())
+        ]
+        terms = self.index.query_terms(search_query.keywords + alternatives + search_query.title_terms)
+        for phrase in search_query.phrases:
+            terms.extend(term for term in phrase.words if term not in terms)
+        return terms
+    
+    def query(self, search_query, page=1, per_page=10, sort_by='relevance', count=True):
+        # 候选集大小即总数，无需额外计数
+        matched_ids = self._match(search_query)
+        
+        total = len(matched_ids)
+        offset = (page - 1) * per_page
+        if offset >= total:
+            return [], total, None
+        
+        # 只对当前页需要的文档做堆选择，再按ID回表
+        scores = None
+        terms = self._score_terms(search_query) if sort_by == 'relevance' else None
+        if terms:
+            # 对整个候选集做BM25F打分，保证第1页就是全局最相关的结果
+            ranked = self.scorer.top_k(terms, matched_ids, offset + per_page)[offset:]
+            page_ids = [doc_id for doc_id, _ in ranked]
+            scores = dict(ranked)
+        else:
+            page_ids = self.index.top_ids(matched_ids, sort_by, offset + per_page)[offset:]
+        
+        return fetch_documents(page_ids), total, scores
+    
+    def score(self, search_query, doc_ids):
+        terms = self._score_terms(search_query)
+        if not terms or not doc_ids:
+            return None
+        return dict(self.scorer.top_k(terms, set(doc_ids), len(doc_ids)))
+    
+    def query_after(self, search_query, after=None, per_page=10, sort_by='date_desc'):
+        matched_ids = self._match(search_query)
+        page_ids = self.index.keyset_ids(
+            matched_ids, after, per_page + 1, ascending=(sort_by == 'date_asc')
+        )
+        return fetch_documents(page_ids[:per_page]), len(page_ids) > per_page
+    
+    def count(self, search_query):
+        return len(self._match(search_query))
+    
+    def facets(self, search_query, tag_limit=10):
+        return self.index.facet_counts(self._match(search_query), tag_limit)
+    
+    def term_offsets(self, doc_id, terms):
+        return self.index.term_offsets(doc_id, terms)
+    
+    def suggest(self, query, limit=5):
+        matched_ids = self.index.match([query])
+        page_ids = self.index.top_ids(matched_ids, 'date_desc', limit)
+        return [doc.title for doc in fetch_documents(page_ids)]
+    
+    def stats(self):
+        stats = super().stats()
+        stats['index'] = self.index.stats()
+        stats['ranking'] = self.scorer.get_stats()
+        if self.store is not None:
+            stats['segments'] = dict(self.store.stats(), reloads=self.reloads)
+            if self.maintainer is not None:
+                stats['segments'].update(self.maintainer.stats)
+        return stats
@@ -0,0 +1,107 @@
+"""
+LIKE检索后端
+原有的 SQLAlchemy contains() 多字段匹配，作为其他引擎的降级方案
+"""
+from sqlalchemy import or_, and_, func
+
+from app import db
+from app.models import Document
+from app.services.count_cache import count_cache
+from app.services.search.backends.base import (
+    SearchBackend, apply_sort, keyset_page, keyword_condition, filter_conditions
+)
+
+# 估算总数时抽样的主键数，平均分成若干段分布在整个主键范围内
+ESTIMATE_SAMPLE_SIZE = 5000
+ESTIMATE_WINDOWS = 10
+
+class LikeBackend(SearchBackend):
+    """基于数据库 LIKE '%关键词%' 的检索后端"""
+    
+    name = 'like'
+    
+    def _filtered_query(self, search_query):
+        base_query = Document.query
+        
+        # 多字段搜索条件
+        conditions = [keyword_condition(keyword) for keyword in search_query.keywords]
+        if conditions:
+            # AND模式：必须包含所有关键词；OR模式：包含任意关键词（默认）
+            combine = and_ if search_query.search_mode == 'and' else or_
+            base_query = base_query.filter(combine(*conditions))
+        
+        # 短语退化为其中的词项全部出现
+        for phrase in search_query.phrases:
+            base_query = base_query.filter(
+                and_(*[keyword_condition(word) for word in phrase.words])
+            )
+        
+        filters = filter_conditions(search_query)
+        if filters:
+            base_query = base_query.filter(*filters)
+        
+        return base_query
+    
+    def index_document(self, doc):
+        """数据库即数据源，无需维护额外索引"""
+        pass
+    
+    def delete_document(self, doc_id):
+        """数据库即数据源，无需维护额外索引"""
+        pass
+    
+    def query(self, search_query, page=1, per_page=10, sort_by='relevance', count=True):
+        # 相关度排序时按创建时间取页，页内再由调用方按相关度重排
+        base_query = apply_sort(self._filtered_query(search_query), sort_by)
+        
+        documents = base_query.paginate(
+            page=page, per_page=per_page, error_out=False, count=count
+        )
+        return documents.items, documents.total, None
+    
+    def query_after(self, search_query, after=None, per_page=10, sort_by='date_desc'):
+        return keyset_page(self._filtered_query(search_query), after, per_page, sort_by)
+    
+    def count(self, search_query):
+        return self._filtered_query(search_query).count()
+    
+    def estimate_count(self, search_query):
+        """在均匀分布于主键范围内的若干段文档上统计命中率，再按文档总数换算
+        
+        LIKE '%关键词%' 无法使用索引，抽样把扫描限制在固定行数内；
+        各段按主键范围读取，新旧文档都被覆盖，不会偏向最近的文档。
+        文档总数取自计数缓存（写入后才重新计数），主键最小/最大值由主键索引直接得到
+        """
+        total = count_cache.document_total()
+        if not total:
+            return 0
+        
+        min_id = db.session.query(func.min(Document.id)).scalar()
+        max_id = db.session.query(func.max(Document.id)).scalar()
+        if min_id is None:
+            return 0
+        
+        span = max_id - min_id + 1
+        if span <= ESTIMATE_SAMPLE_SIZE:
+            window = Document.id.between(min_id, max_id)
+        else:
+            width = ESTIMATE_SAMPLE_SIZE // ESTIMATE_WINDOWS
+            step = span / ESTIMATE_WINDOWS
+            window = or_(*[
+                Document.id.between(start, start + width - 1)
+                for start in (min_id + int(i * step) for i in range(ESTIMATE_WINDOWS))
+            ])
+        sampled = Document.query.filter(window).count()
+        if not sampled:
+            return None
+        
+        matched = self._filtered_query(search_query).filter(window).count()
+        return round(total * matched / sampled)
+    
+    def suggest(self, query, limit=5):
+        # 简单的标题匹配建议
+        suggestions = Document.query.filter(
+            Document.title.contains(query)
+        ).limit(limit).all()
+        
+        return [doc.title for doc in suggestions]
@@ -0,0 +1,175 @@
+"""
+MySQL全文检索后端
+使用 FULLTEXT 索引（ngram 分词器）的 MATCH ... AGAINST 布尔模式检索，
+把中文子串匹配交给数据库索引，并返回引擎给出的相关度分数
+"""
+import re
+from sqlalchemy import and_, or_
+from sqlalchemy.dialects.mysql import match
+
+from app import db
+from app.models import Document
+from app.services.search.backends.base import (
+    SearchBackend, apply_sort, keyset_page, keyword_condition, filter_conditions
+)
+
+# 布尔模式下具有特殊含义的字符
+_BOOLEAN_OPERATORS = re.compile(r'[+\-<>()~*"@]')
+
+# ngram_token_size（默认2）：更短的词（如单个汉字）不在 FULLTEXT 索引中，MATCH 永远不会命中，
+# 这类关键词退化为 LIKE（与 sqlite_fts5 对 trigram 以下短词的处理相同）
+MIN_NGRAM_LENGTH = 2
+
+class MySQLFulltextBackend(SearchBackend):
+    """MySQL FULLTEXT 检索后端
+    
+    依赖迁移 0e991c142a0e 创建的 idx_document_fulltext (title, content)。
+    标签存放在JSON列中，不在全文索引范围内。
+    短于 MIN_NGRAM_LENGTH 的关键词使用 LIKE 条件，只含短词的查询不计算相关度分数。
+    """
+    
+    name = 'mysql_fulltext'
+    
+    def initialize(self):
+        if db.engine.dialect.name != 'mysql':
+            raise RuntimeError('mysql_fulltext 搜索后端需要 MySQL 数据库')
+        self.initialized = True
+    
+    @staticmethod
+    def _quote(keyword):
+        cleaned = _BOOLEAN_OPERATORS.sub(' ', keyword).strip()
+        return f'"{cleaned}"' if cleaned else None
+    
+    @staticmethod
+    def _indexable(keyword):
+        """词是否足够长，能被 ngram FULLTEXT 索引命中"""
+        return len(keyword.strip()) >= MIN_NGRAM_LENGTH
+    
+    @classmethod
+    def _quoted(cls, words):
+        return [q for q in map(cls._quote, filter(cls._indexable, words)) if q]
+    
+    @classmethod
+    def build_boolean_query(cls, search_query):
+        """构建布尔模式查询串（只包含能走全文索引的词，短词由 keyword_conditions 用 LIKE 处理）
+        
+        每个关键词作为短语（ngram序列需相邻出现，语义接近子串匹配），
+        AND模式下每个短语前加 '+' 表示必须出现；
+        短语/邻近查询退化为其中每个词项都必须出现
+        """
+        keywords = cls._quoted(search_query.keywords)
+        required = cls._quoted(word for phrase in search_query.phrases for word in phrase.words)
+        
+        if search_query.search_mode == 'and':
+            return ' '.join(f'+{q}' for q in keywords + required)
+        if not required:
+            return ' '.join(keywords)
+        
+        parts = [f'+{q}' for q in required]
+        if keywords:
+            parts.insert(0, '+(' + ' '.join(keywords) + ')')
+        return ' '.join(parts)
+    
+    def relevance(self, against):
+        """MATCH ... AGAINST 表达式，可同时用于过滤和排序"""
+        return match(Document.title, Document.content, against=against).in_boolean_mode()
+    
+    def keyword_conditions(self, search_query):
+        """关键词和短语的过滤条件
+        
+        词项都能走全文索引时就是一个 MATCH 条件；含短词时，长词的 MATCH 条件与短词的 LIKE 条件
+        按匹配模式组合（OR模式下任意关键词命中即可，短语中的词都必须出现）
+        
+        Returns:
+            (条件列表, 相关度表达式或None)，没有可走全文索引的词时相关度为None
+        """
+        against = self.build_boolean_query(search_query)
+        relevance = self.relevance(against) if against else None
+        
+        words = [word for phrase in search_query.phrases for word in phrase.words]
+        short_keywords = [kw for kw in search_query.keywords if not self._indexable(kw)]
+        short_words = [word for word in words if not self._indexable(word)]
+        if not short_keywords and not short_words:
+            return ([relevance] if relevance is not None else []), relevance
+        
+        and_mode = search_query.search_mode == 'and'
+        conditions = []
+        keyword_parts = [keyword_condition(kw) for kw in short_keywords]
+        long_keywords = self._quoted(search_query.keywords)
+        if long_keywords:
+            keyword_against = ' '.join(f'+{q}' if and_mode else q for q in long_keywords)
+            keyword_parts.insert(0, self.relevance(keyword_against))
+        if keyword_parts:
+            conditions.append(and_(*keyword_parts) if and_mode else or_(*keyword_parts))
+        
+        long_words = self._quoted(words)
+        if long_words:
+            conditions.append(self.relevance(' '.join(f'+{q}' for q in long_words)))
+        conditions.extend(keyword_condition(word) for word in short_words)
+        return conditions, relevance
+    
+    def index_document(self, doc):
+        """FULLTEXT索引由MySQL随写入自动维护"""
+        pass
+    
+    def delete_document(self, doc_id):
+        """FULLTEXT索引由MySQL随写入自动维护"""
+        pass
+    
+    def _filtered_query(self, search_query):
+        """全文条件加上字段限定、排除和过滤条件（后者使用普通索引或LIKE）"""
+        conditions, _ = self.keyword_conditions(search_query)
+        return Document.query.filter(*conditions, *filter_conditions(search_query))
+    
+    def query(self, search_query, page=1, per_page=10, sort_by='relevance', count=True):
+        conditions, relevance = self.keyword_conditions(search_query)
+        if relevance is None:
+            # 没有可走全文索引的关键词（没有关键词或只有短词）时按时间返回满足条件的文档
+            pagination = apply_sort(self._filtered_query(search_query), sort_by).paginate(
+                page=page, per_page=per_page, error_out=False, count=count
+            )
+            return pagination.items, pagination.total, None
+        
+        base_query = db.session.query(Document, relevance.label('score')).filter(
+            *conditions, *filter_conditions(search_query)
+        )
+        
+        total = base_query.order_by(None).count() if count else None
+        
+        if sort_by == 'relevance':
+            base_query = base_query.order_by(relevance.desc(), Document.id.desc())
+        else:
+            base_query = apply_sort(base_query, sort_by)
+        
+        rows = base_query.offset((page - 1) * per_page).limit(per_page).all()
+        
+        documents = [doc for doc, _ in rows]
+        scores = {doc.id: float(score or 0) for doc, score in rows}
+        return documents, total, scores if sort_by == 'relevance' else None
+    
+    def score(self, search_query, doc_ids):
+        _, relevance = self.keyword_conditions(search_query)
+        if relevance is None or not doc_ids:
+            return None
+        rows = db.session.query(Document.id, relevance).filter(Document.id.in_(doc_ids)).all()
+        return {doc_id: float(score or 0) for doc_id, score in rows}
+    
+    def query_after(self, search_query, after=None, per_page=10, sort_by='date_desc'):
+        return keyset_page(self._filtered_query(search_query), after, per_page, sort_by)
+    
+    def count(self, search_query):
+        return self._filtered_query(search_query).count()
+    
+    def suggest(self, query, limit=5):
+        if not self._indexable(query):
+            rows = Document.query.filter(Document.title.contains(query.strip())).limit(limit).all()
+            return [doc.title for doc in rows]
+        against = self._quote(query)
+        if not against:
+            return []
+        
+        relevance = self.relevance(against)
+        rows = db.session.query(Document.title).filter(relevance).order_by(
+            relevance.desc()
+        ).limit(limit).all()
+        return [row.title for row in rows]
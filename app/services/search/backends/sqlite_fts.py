@@ -0,0 +1,297 @@
+"""
+SQLite FTS5检索后端
+使用 trigram 分词器的 FTS5 虚表，便于在没有MySQL的单机环境下运行完整API和压测，
+并与其他引擎在同一语料上对比
+"""
+from datetime import datetime
+from sqlalchemy import text, bindparam
+
+from app import db
+from app.services.search.backends.base import SearchBackend, fetch_documents
+
+FTS_TABLE = 'documents_fts'
+
+# bm25() 的列权重，顺序与虚表列一致（标题、正文、标签）
+COLUMN_WEIGHTS = (3.0, 1.0, 2.0)
+
+# 相关度：bm25() 越小越相关，取负值使分数越大越相关
+_BM25_SCORE = f"-bm25({FTS_TABLE}, {', '.join(str(w) for w in COLUMN_WEIGHTS)})"
+
+# trigram 分词器只能用 MATCH 检索不少于3个字符的串，更短的关键词退化为 LIKE
+MIN_TRIGRAM_LENGTH = 3
+
+# 短模式直接对虚表列做 LIKE 时 FTS5 会尝试走 trigram 索引而返回空结果，
+# 拼接空串使其按普通表达式逐行匹配
+_LIKE_COLUMN = "({table}.{column} || '') LIKE :{param}"
+
+_SORT_CLAUSES = {
+    'date_asc': 'documents.created_at ASC',
+    'date_desc': 'documents.created_at DESC',
+    'title': 'documents.title ASC',
+}
+
+class SQLiteFTS5Backend(SearchBackend):
+    """SQLite FTS5（trigram）检索后端"""
+    
+    name = 'sqlite_fts5'
+    
+    def initialize(self):
+        if db.engine.dialect.name != 'sqlite':
+            raise RuntimeError('sqlite_fts5 搜索后端需要 SQLite 数据库')
+        
+        with db.engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                f"USING fts5(title, content, tags, tokenize='trigram')"
+            ))
+            indexed = conn.execute(text(f'SELECT count(*) FROM {FTS_TABLE}')).scalar()
+            total = conn.execute(text('SELECT count(*) FROM documents')).scalar()
+        
+        # 虚表与文档表不一致时（首次使用或曾切换过后端）全量重建
+        if indexed != total:
+            self.rebuild()
+        
+        self.initialized = True
+    
+    def rebuild(self):
+        """从文档表全量重建FTS5虚表"""
+        with db.engine.begin() as conn:
+            conn.execute(text(f'DELETE FROM {FTS_TABLE}'))
+            # 标签以JSON存储（中文会被转义），通过 json_each 还原为纯文本
+            conn.execute(text(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, content, tags) "
+                f"SELECT id, title, content, "
+                f"COALESCE((SELECT group_concat(value, ' ') FROM json_each(documents.tags)), '') "
+                f"FROM documents"
+            ))
+        print("SQLite FTS5 搜索索引重建完成")
+    
+    def index_document(self, doc):
+        with db.engine.begin() as conn:
+            conn.execute(text(f'DELETE FROM {FTS_TABLE} WHERE rowid = :id'), {'id': doc.id})
+            conn.execute(
+                text(f'INSERT INTO {FTS_TABLE} (rowid, title, content, tags) VALUES (:id, :title, :content, :tags)'),
+                {
+                    'id': doc.id,
+                    'title': doc.title or '',
+                    'content': doc.content or '',
+                    'tags': ' '.join(str(tag) for tag in doc.tags or [])
+                }
+            )
+    
+    def delete_document(self, doc_id):
+        with db.engine.begin() as conn:
+            conn.execute(text(f'DELETE FROM {FTS_TABLE} WHERE rowid = :id'), {'id': doc_id})
+    
+    @staticmethod
+    def _phrase(keyword):
+        return '"' + keyword.replace('"', '""') + '"'
+    
+    def _keyword_clause(self, keywords, search_mode, prefix='', embedded=False):
+        """构建关键词过滤条件
+        
+        Args:
+            prefix: 参数名前缀，同一语句中组合多个条件时避免重名
+            embedded: 是否作为组合条件的一部分（此时MATCH改写为rowid子查询）
+        
+        Returns:
+            (WHERE子句, 参数, 是否可以使用bm25排序)
+        """
+        if not keywords:
+            return '1 = 1', {}, False
+        
+        joiner = ' AND ' if search_mode == 'and' else ' OR '
+        long_keywords = [kw for kw in keywords if len(kw) >= MIN_TRIGRAM_LENGTH]
+        short_keywords = [kw for kw in keywords if len(kw) < MIN_TRIGRAM_LENGTH]
+        
+        params = {}
+        match_param = f'{prefix}match'
+        if long_keywords:
+            params[match_param] = joiner.join(self._phrase(kw) for kw in long_keywords)
+        if not short_keywords and not embedded:
+            return f'{FTS_TABLE} MATCH :{match_param}', params, True
+        
+        conditions = []
+        if long_keywords:
+            conditions.append(
+                f'{FTS_TABLE}.rowid IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :{match_param})'
+            )
+        for i, keyword in enumerate(short_keywords):
+            param = f'{prefix}like{i}'
+            params[param] = f'%{keyword}%'
+            conditions.append('(' + ' OR '.join(
+                _LIKE_COLUMN.format(table=FTS_TABLE, column=column, param=param)
+                for column in ('title', 'content', 'tags')
+            ) + ')')
+        return '(' + joiner.join(conditions) + ')', params, False
+    
+    def _column_clause(self, keyword, columns, param, params):
+        """关键词出现在指定列中（列过滤的MATCH子查询，短关键词用LIKE）"""
+        if len(keyword) >= MIN_TRIGRAM_LENGTH:
+            params[param] = '{' + ' '.join(columns) + '} : ' + self._phrase(keyword)
+            return f'{FTS_TABLE}.rowid IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :{param})'
+        
+        params[param] = f'%{keyword}%'
+        return '(' + ' OR '.join(
+            _LIKE_COLUMN.format(table=FTS_TABLE, column=column, param=param) for column in columns
+        ) + ')'
+    
+    def _filter_clauses(self, search_query, params):
+        """字段限定、排除以及分类/时间过滤条件（后者走文档表的普通索引）"""
+        clauses = []
+        title_words = [word for term in search_query.title_terms for word in term.split()]
+        for i, word in enumerate(title_words):
+            clauses.append(self._column_clause(word, ('title',), f'title{i}', params))
+        for i, tag in enumerate(search_query.tags):
+            clauses.append(self._column_clause(tag, ('tags',), f'tag{i}', params))
+        for i, keyword in enumerate(search_query.excluded):
+            clauses.append('NOT ' + self._column_clause(
+                keyword, ('title', 'content', 'tags'), f'exclude{i}', params
+            ))
+        for i, term in enumerate(search_query.excluded_title):
+            clauses.append('NOT (' + ' AND '.join(
+                self._column_clause(word, ('title',), f'exclude_title{i}_{j}', params)
+                for j, word in enumerate(term.split())
+            ) + ')')
+        for i, tag in enumerate(search_query.excluded_tags):
+            clauses.append('NOT ' + self._column_clause(tag, ('tags',), f'exclude_tag{i}', params))
+        
+        document_filters = []
+        if search_query.category is not None:
+            document_filters.append('category_id = :filter_category')
+            params['filter_category'] = search_query.category_id
+        if search_query.after:
+            document_filters.append('created_at >= :filter_after')
+            params['filter_after'] = search_query.after
+        if search_query.before:
+            document_filters.append('created_at < :filter_before')
+            params['filter_before'] = search_query.before
+        if document_filters:
+            clauses.append(
+                f'{FTS_TABLE}.rowid IN (SELECT id FROM documents WHERE '
+                + ' AND '.join(document_filters) + ')'
+            )
+        return clauses
+    
+    def _where_clause(self, search_query):
+        """构建查询的过滤条件，短语/邻近查询退化为其中的词项全部出现
+        
+        Returns:
+            (WHERE子句, 参数, 是否可以使用bm25排序)
+        """
+        where, params, rankable = self._keyword_clause(
+            search_query.keywords, search_query.search_mode
+        )
+        
+        clauses = [where] if search_query.keywords else []
+        for i, phrase in enumerate(search_query.phrases):
+            clause, phrase_params, _ = self._keyword_clause(
+                phrase.words, 'and', prefix=f'p{i}_', embedded=True
+            )
+            clauses.append(clause)
+            params.update(phrase_params)
+        clauses.extend(self._filter_clauses(search_query, params))
+        
+        if not clauses:
+            return '1 = 1', params, False
+        return ' AND '.join(clauses), params, rankable
+    
+    @staticmethod
+    def _statement(sql, params):
+        """构建SQL语句，时间参数显式声明DateTime类型，保证与ORM写入的时间格式一致"""
+        statement = text(sql)
+        date_params = [name for name, value in params.items() if isinstance(value, datetime)]
+        if date_params:
+            statement = statement.bindparams(
+                *[bindparam(name, type_=db.DateTime) for name in date_params]
+            )
+        return statement
+    
+    def query(self, search_query, page=1, per_page=10, sort_by='relevance', count=True):
+        where, params, rankable = self._where_clause(search_query)
+        
+        total = None
+        if count:
+            total = db.session.execute(
+                self._statement(f'SELECT count(*) FROM {FTS_TABLE} WHERE {where}', params), params
+            ).scalar()
+        
+        ranked = rankable and sort_by == 'relevance'
+        if ranked:
+            score = _BM25_SCORE
+            order = 'score DESC, documents.id DESC'
+        else:
+            score = '0'
+            order = _SORT_CLAUSES.get(sort_by, 'documents.created_at DESC')
+        
+        rows = db.session.execute(
+            self._statement(
+                f'SELECT documents.id AS id, {score} AS score FROM {FTS_TABLE} '
+                f'JOIN documents ON documents.id = {FTS_TABLE}.rowid '
+                f'WHERE {where} ORDER BY {order} LIMIT :limit OFFSET :offset',
+                params
+            ),
+            dict(params, limit=per_page, offset=(page - 1) * per_page)
+        ).all()
+        
+        documents = fetch_documents([row.id for row in rows])
+        scores = {row.id: float(row.score) for row in rows} if ranked else None
+        return documents, total, scores
+    
+    def score(self, search_query, doc_ids):
+        where, params, rankable = self._where_clause(search_query)
+        if not rankable or not doc_ids:
+            return None
+        ids = ', '.join(str(int(doc_id)) for doc_id in doc_ids)
+        rows = db.session.execute(
+            self._statement(
+                f'SELECT rowid AS id, {_BM25_SCORE} AS score FROM {FTS_TABLE} '
+                f'WHERE {where} AND rowid IN ({ids})',
+                params
+            ),
+            params
+        ).all()
+        return {row.id: float(row.score) for row in rows}
+    
+    def query_after(self, search_query, after=None, per_page=10, sort_by='date_desc'):
+        where, params, _ = self._where_clause(search_query)
+        ascending = sort_by == 'date_asc'
+        direction, op = ('ASC', '>') if ascending else ('DESC', '<')
+        
+        statement = (
+            f'SELECT documents.id AS id FROM {FTS_TABLE} '
+            f'JOIN documents ON documents.id = {FTS_TABLE}.rowid WHERE {where}'
+        )
+        if after is not None:
+            statement += (
+                f' AND (documents.created_at {op} :after_created OR '
+                f'(documents.created_at = :after_created AND documents.id {op} :after_id))'
+            )
+            params = dict(params, after_created=after[0], after_id=after[1])
+        statement += f' ORDER BY documents.created_at {direction}, documents.id {direction} LIMIT :limit'
+        
+        rows = db.session.execute(
+            self._statement(statement, params), dict(params, limit=per_page + 1)
+        ).all()
+        page_ids = [row.id for row in rows]
+        return fetch_documents(page_ids[:per_page]), len(page_ids) > per_page
+    
+    def count(self, search_query):
+        where, params, _ = self._where_clause(search_query)
+        return db.session.execute(
+            self._statement(f'SELECT count(*) FROM {FTS_TABLE} WHERE {where}', params), params
+        ).scalar()
+    
+    def suggest(self, query, limit=5):
+        if len(query) >= MIN_TRIGRAM_LENGTH:
+            where = f'{FTS_TABLE} MATCH :query'
+            params = {'query': 'title : ' + self._phrase(query)}
+        else:
+            where = _LIKE_COLUMN.format(table=FTS_TABLE, column='title', param='query')
+            params = {'query': f'%{query}%'}
+        
+        rows = db.session.execute(
+            text(f'SELECT title FROM {FTS_TABLE} WHERE {where} LIMIT :limit'),
+            dict(params, limit=limit)
+        ).all()
+        return [row.title for row in rows]
@@ -0,0 +1,68 @@
+"""
+布隆过滤器
+落盘段和段内每个分类各带一个词项布隆过滤器：查询词不在段（或该分类）中时，
+几次位探测即可确定，不必在段的词典中二分查找。
+位数组按词项数和目标误判率确定大小，随段文件一起映射，多进程共享
+"""
+import hashlib
+import math
+import struct
+
+# 默认误判率：每个词项约 9.6 位
+ERROR_RATE = 0.01
+
+_HASH = struct.Struct('<QQ')
+
+def term_hashes(term):
+    """词项的两个64位哈希（双重哈希生成k个探测位置）
+    
+    不能使用内置 hash()：字符串哈希按进程随机化，而位数组要写入段文件
+    """
+    h1, h2 = _HASH.unpack(hashlib.blake2b(term.encode('utf-8'), digest_size=16).digest())
+    return h1, h2 | 1
+
+class BloomFilter:
+    """布隆过滤器
+    
+    bits: 构建时为 bytearray，从段文件载入时为映射上的只读 memoryview
+    size: 位数, hashes: 每个词项的探测次数
+    """
+    
+    __slots__ = ('bits', 'size', 'hashes')
+    
+    def __init__(self, bits, size, hashes):
+        self.bits = bits
+        self.size = size
+        self.hashes = hashes
+    
+    @classmethod
+    def create(cls, capacity, error_rate=ERROR_RATE):
+        """按预计词项数创建：m = -n·ln(p) / ln(2)²，k = m/n·ln(2)"""
+        capacity = max(capacity, 1)
+        size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        size = max(64, (size + 63) // 64 * 64)
+        hashes = max(1, round(size / capacity * math.log(2)))
+        return cls(bytearray(size // 8), size, hashes)
+    
+    def add(self, term, hashes=None):
+        h1, h2 = hashes or term_hashes(term)
+        bits, size = self.bits, self.size
+        for i in range(self.hashes):
+            position = (h1 + i * h2) % size
+            bits[position >> 3] |= 1 << (position & 7)
+    
+    def might_contain(self, term, hashes=None):
+        """False 表示一定不存在；True 表示可能存在（有误判）"""
+        h1, h2 = hashes or term_hashes(term)
+        bits, size = self.bits, self.size
+        for i in range(self.hashes):
+            position = (h1 + i * h2) % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+    
+    def __contains__(self, term):
+        return self.might_contain(term)
+    
+    def nbytes(self):
+        return self.size // 8
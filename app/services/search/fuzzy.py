@@ -0,0 +1,134 @@
+"""
+拼写容错
+对索引词表中的英文/数字词项建立字符三元组（trigram）倒排，查询中不在词表里的词项
+（如 Pyhton、Reddis）扩展为编辑距离最近的词表词项：先按共享三元组数剪枝候选，
+再计算有上限的编辑距离（相邻字符换位计为一次编辑）。扩展结果按词项缓存
+"""
+import re
+import threading
+from collections import Counter, OrderedDict
+
+# 参与拼写容错的词项：英文字母开头的技术词（允许数字和 . + # - 等符号）
+_FUZZY_TERM = re.compile(r'^[a-z][a-z0-9.+#\-]*$')
+
+GRAM = 3
+# 每个未知词项最多扩展的词表词项数
+MAX_EXPANSIONS = 3
+# 扩展结果缓存的词项数
+CACHE_SIZE = 4096
+
+def is_fuzzy_term(term):
+    return len(term) >= GRAM and bool(_FUZZY_TERM.match(term))
+
+def max_distance(term):
+    """允许的编辑距离：3~5个字符为1，更长为2"""
+    return 1 if len(term) <= 5 else 2
+
+def trigrams(term):
+    """首尾补位后的字符三元组（长度为n的词项得到n个）"""
+    padded = f'${term}$'
+    return {padded[i:i + GRAM] for i in range(len(padded) - GRAM + 1)}
+
+def bounded_distance(a, b, limit):
+    """编辑距离（插入、删除、替换和相邻换位各计1），超过limit时返回limit+1
+    
+    按行计算，某一行的最小值已超过limit时提前结束
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    
+    before = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, before[j - 2] + 1)
+            current[j] = value
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+class TrigramIndex:
+    """词表的三元组倒排：三元组 -> 词项编号列表
+    
+    只增不减：词项从索引中消失后仍留在这里，扩展时按文档频率过滤掉。
+    新词项加入时清空扩展缓存
+    """
+    
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.clear()
+    
+    def clear(self):
+        with self.lock:
+            self.terms = []
+            self.term_ids = {}
+            self.grams = {}
+            self.cache = OrderedDict()
+            self.stats = {
+                'expansions': 0,
+                'cache_hits': 0,
+                'candidates_checked': 0
+            }
+    
+    def add(self, term):
+        if not is_fuzzy_term(term) or term in self.term_ids:
+            return
+        with self.lock:
+            term_id = self.term_ids[term] = len(self.terms)
+            self.terms.append(term)
+            for gram in trigrams(term):
+                self.grams.setdefault(gram, []).append(term_id)
+            self.cache.clear()
+    
+    def expand(self, term, doc_freq, limit=MAX_EXPANSIONS):
+        """编辑距离最近的词表词项（同距离按文档频率降序），最多limit个
+        
+        Args:
+            doc_freq: 词项 -> 文档频率，为0的词项（已从索引中删除）不作为结果
+        """
+        if not is_fuzzy_term(term):
+            return []
+        with self.lock:
+            cached = self.cache.get(term)
+            if cached is not None:
+                self.cache.move_to_end(term)
+                self.stats['cache_hits'] += 1
+                return cached
+            
+            self.stats['expansions'] += 1
+            distance_limit = max_distance(term)
+            grams = trigrams(term)
+            shared = Counter()
+            for gram in grams:
+                shared.update(self.grams.get(gram, ()))
+            
+            best = []
+            for term_id, count in shared.items():
+                candidate = self.terms[term_id]
+                # 每次编辑最多破坏 GRAM+1 个三元组（换位），共享数不足的候选不可能在距离内
+                if count < max(len(grams), len(candidate)) - (GRAM + 1) * distance_limit:
+                    continue
+                self.stats['candidates_checked'] += 1
+                distance = bounded_distance(term, candidate, distance_limit)
+                if distance > distance_limit:
+                    continue
+                frequency = doc_freq(candidate)
+                if frequency:
+                    best.append((distance, -frequency, candidate))
+            
+            best.sort()
+            # 只保留最近的一档
+            result = [candidate for distance, _, candidate in best if distance == best[0][0]][:limit]
+            self.cache[term] = result
+            if len(self.cache) > CACHE_SIZE:
+                self.cache.popitem(last=False)
+            return result
+    
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, terms=len(self.terms), cached=len(self.cache))
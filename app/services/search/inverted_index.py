@@ -0,0 +1,882 @@
+"""
+内存倒排索引
+基于jieba分词，为标题、标签、正文建立词项到文档的倒排表，
+OR/AND检索通过倒排表的并集、交集完成，不再依赖数据库的LIKE扫描。
+配置了索引目录时，已落盘的文档由只读映射的段提供倒排表和位置信息（见 segments.py），
+内存中的 postings/positions 只保存尚未落盘的文档（可写段）
+"""
+import bisect
+import heapq
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from itertools import islice, product
+
+from app.services.search.analyzer import iter_tokens, tokenize, analyze_keyword, normalize_term
+from app.services.search.bloom import term_hashes
+from app.services.search.fuzzy import TrigramIndex, MAX_EXPANSIONS, is_fuzzy_term
+from app.services.search.pinyin import PinyinIndex
+from app.services.search.postings import PostingList, MultiPostings, encode_positions, decode_positions
+
+# 索引字段，倒排表中的词频按此顺序存放
+FIELDS = ('title', 'tags', 'content')
+TITLE, TAGS, CONTENT = 0, 1, 2
+
+_CJK_CHAR = re.compile(r'^[\u4e00-\u9fa5]$')
+
+class DocumentEntry:
+    """索引中保存的文档元数据，用于删除、排序和过滤
+    
+    segment 为文档所在的落盘段（None 表示在内存段中）；落盘后 terms 置空，删除时只需在段中标记
+    """
+    
+    __slots__ = ('terms', 'lengths', 'created_at', 'updated_at', 'title', 'category_id', 'tags',
+                 'file_type', 'segment')
+    
+    def __init__(self, terms, lengths, created_at, title, category_id=None, tags=(), file_type=None,
+                 updated_at=0.0, segment=None):
+        self.terms = terms
+        self.lengths = lengths
+        self.created_at = created_at
+        self.title = title
+        self.category_id = category_id
+        self.tags = tags
+        self.file_type = file_type
+        self.updated_at = updated_at
+        self.segment = segment
+
+class InvertedIndex:
+    """倒排索引
+    
+    postings: 词项 -> PostingList（压缩倒排表，文档ID -> (标题词频, 标签词频, 正文词频)）
+    positions: 词项 -> {文档ID: 编码后的 (标题位置, 正文位置, 正文字符偏移)}，
+               用于短语/邻近查询和摘要高亮，使用时由 decode_positions 解码
+    documents: 文档ID -> DocumentEntry
+    char_terms: 汉字 -> 包含该字的多字词项，用于单字查询
+    tag_docs: 完整标签（小写）-> 文档ID集合
+    tag_labels: 完整标签（小写）-> 首次出现时的原始写法，用于分面展示
+    category_docs: 分类ID -> 文档ID集合
+    file_type_docs: 文件类型 -> 文档ID集合
+    created_order: 按 (创建时间, 文档ID) 排序的列表，用于时间范围过滤
+    score_bounds: 词项 -> 各字段伪词频上界的缓存（由 BM25FScorer 维护，用于top-k剪枝）
+    fuzzy: 词表的三元组索引，用于拼写容错
+    pinyin: 标题和标签词项的拼音映射，用于拼音和首字母检索
+    segments: 已落盘的段（按写入先后），memory_ids: 内存段中的文档
+    
+    读取倒排表和位置信息统一通过 term_postings/term_positions，它们合并内存段和各落盘段
+    """
+    
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.fuzzy = TrigramIndex()
+        self.pinyin = PinyinIndex()
+        self.clear()
+    
+    def clear(self):
+        """清空索引"""
+        with self.lock:
+            self.postings = {}
+            self.positions = {}
+            self.char_terms = {}
+            self.tag_docs = {}
+            self.tag_labels = {}
+            self.category_docs = {}
+            self.file_type_docs = {}
+            self.created_order = []
+            self.score_bounds = {}
+            self.fuzzy.clear()
+            self.pinyin.clear()
+            self.segments = []
+            self.memory_ids = set()
+            self.documents = {}
+            self.total_lengths = [0, 0, 0]
+            self.built_at = None
+    
+    def build(self, documents):
+        """从文档集合全量构建索引
+        
+        Args:
+            documents: 可迭代对象，元素需要具有 id/title/content/tags/created_at 属性
+        """
+        with self.lock:
+            self.clear()
+            for doc in documents:
+                self._add(doc)
+            # 构建期间的增量缓冲全部压缩
+            for doc_postings in self.postings.values():
+                doc_postings.compact()
+            self.built_at = time.time()
+    
+    def add_document(self, doc):
+        """新增或更新单个文档"""
+        with self.lock:
+            if doc.id in self.documents:
+                self._remove(doc.id)
+            self._add(doc)
+    
+    def remove_document(self, doc_id):
+        """从索引中删除文档"""
+        with self.lock:
+            return self._remove(doc_id)
+    
+    @staticmethod
+    def _field_tokens(text):
+        """字段词频，以及每个词项的 (位置列表, 字符偏移列表)"""
+        counts = Counter()
+        positions = {}
+        for term, position, offset in iter_tokens(text):
+            counts[term] += 1
+            entry = positions.get(term)
+            if entry is None:
+                entry = positions[term] = ([], [])
+            entry[0].append(position)
+            entry[1].append(offset)
+        return counts, positions
+    
+    def _add(self, doc):
+        title_counts, title_positions = self._field_tokens(doc.title)
+        content_counts, content_positions = self._field_tokens(doc.content)
+        field_counts = (
+            title_counts,
+            Counter(self._tag_terms(doc.tags)),
+            content_counts,
+        )
+        
+        term_freqs = {}
+        for field, counts in enumerate(field_counts):
+            for term, tf in counts.items():
+                freqs = term_freqs.get(term)
+                if freqs is None:
+                    freqs = term_freqs[term] = [0] * len(FIELDS)
+                freqs[field] = tf
+        
+        for term, freqs in term_freqs.items():
+            doc_postings = self.postings.get(term)
+            if doc_postings is None:
+                doc_postings = self.postings[term] = PostingList(len(FIELDS))
+                self._link_chars(term)
+                self.fuzzy.add(term)
+            doc_postings.add(doc.id, freqs)
+            # 新文档可能抬高词项的得分上界；删除文档只会降低上界，缓存仍然有效
+            self.score_bounds.pop(term, None)
+        terms = term_freqs.keys()
+        for term in title_counts.keys() | field_counts[1].keys():
+            self.pinyin.add(term)
+        
+        for term in title_positions.keys() | content_positions.keys():
+            title_entry = title_positions.get(term, ((), ()))
+            content_entry = content_positions.get(term, ((), ()))
+            self.positions.setdefault(term, {})[doc.id] = encode_positions(
+                title_entry[0], content_entry[0], content_entry[1]
+            )
+        
+        entry = DocumentEntry(
+            terms=tuple(terms),
+            lengths=tuple(sum(counts.values()) for counts in field_counts),
+            created_at=self._timestamp(doc.created_at),
+            updated_at=self._timestamp(getattr(doc, 'updated_at', None)),
+            title=(doc.title or '').lower(),
+            category_id=getattr(doc, 'category_id', None),
+            tags=tuple({normalize_term(str(tag)) for tag in doc.tags or []} - {''}),
+            file_type=getattr(doc, 'file_type', None)
+        )
+        for tag in doc.tags or []:
+            self.tag_labels.setdefault(normalize_term(str(tag)), str(tag).strip())
+        self._register(doc.id, entry)
+        self.memory_ids.add(doc.id)
+        bisect.insort(self.created_order, (entry.created_at, doc.id))
+    
+    def _register(self, doc_id, entry):
+        """登记文档元数据（长度统计和各过滤维度，created_order 由调用方维护）"""
+        self.documents[doc_id] = entry
+        for field, length in enumerate(entry.lengths):
+            self.total_lengths[field] += length
+        for tag in entry.tags:
+            self.tag_docs.setdefault(tag, set()).add(doc_id)
+        self.category_docs.setdefault(entry.category_id, set()).add(doc_id)
+        self.file_type_docs.setdefault(entry.file_type, set()).add(doc_id)
+    
+    def _remove(self, doc_id):
+        entry = self.documents.pop(doc_id, None)
+        if entry is None:
+            return False
+        
+        if entry.segment is not None:
+            # 段不可变：只做删除标记，合并时丢弃
+            entry.segment.delete(doc_id)
+        self.memory_ids.discard(doc_id)
+        
+        for term in entry.terms:
+            doc_postings = self.postings.get(term)
+            if doc_postings is None:
+                continue
+            doc_postings.remove(doc_id)
+            if not doc_postings:
+                del self.postings[term]
+                if not self._in_segments(term):
+                    self._unlink_chars(term)
+            
+            doc_positions = self.positions.get(term)
+            if doc_positions is not None:
+                doc_positions.pop(doc_id, None)
+                if not doc_positions:
+                    del self.positions[term]
+        
+        for field, length in enumerate(entry.lengths):
+            self.total_lengths[field] -= length
+        
+        for tag in entry.tags:
+            self._discard(self.tag_docs, tag, doc_id)
+            if tag not in self.tag_docs:
+                self.tag_labels.pop(tag, None)
+        self._discard(self.category_docs, entry.category_id, doc_id)
+        self._discard(self.file_type_docs, entry.file_type, doc_id)
+        i = bisect.bisect_left(self.created_order, (entry.created_at, doc_id))
+        if i < len(self.created_order) and self.created_order[i] == (entry.created_at, doc_id):
+            del self.created_order[i]
+        return True
+    
+    @staticmethod
+    def _discard(mapping, key, doc_id):
+        docs = mapping.get(key)
+        if docs is not None:
+            docs.discard(doc_id)
+            if not docs:
+                del mapping[key]
+    
+    def _link_chars(self, term):
+        if len(term) > 1:
+            for char in set(term):
+                if _CJK_CHAR.match(char):
+                    self.char_terms.setdefault(char, set()).add(term)
+    
+    def _unlink_chars(self, term):
+        if len(term) > 1:
+            for char in set(term):
+                terms = self.char_terms.get(char)
+                if terms is not None:
+                    terms.discard(term)
+                    if not terms:
+                        del self.char_terms[char]
+    
+    @staticmethod
+    def _tag_terms(tags):
+        """标签既按整体索引，也按分词结果索引"""
+        terms = []
+        for tag in tags or []:
+            whole = normalize_term(str(tag))
+            if not whole:
+                continue
+            terms.append(whole)
+            terms.extend(t for t in tokenize(str(tag), search_mode=False) if t != whole)
+        return terms
+    
+    @staticmethod
+    def _timestamp(value):
+        if isinstance(value, datetime):
+            return value.timestamp()
+        return float(value or 0)
+    
+    def _in_segments(self, term):
+        hashes = term_hashes(term)
+        return any(segment.lookup(term, hashes) is not None for segment in self.segments)
+    
+    def has_term(self, term):
+        return term in self.postings or self._in_segments(term)
+    
+    def term_postings(self, term):
+        """词项的倒排表：只有内存段时就是 PostingList，否则为合并各段的 MultiPostings；
+        不存在时返回None"""
+        memory = self.postings.get(term)
+        if not self.segments:
+            return memory
+        
+        # 哈希只算一次，各段的布隆过滤器共用；段中没有的词项几次位探测即被排除
+        hashes = term_hashes(term)
+        parts = []
+        for segment in self.segments:
+            doc_postings = segment.postings(term, hashes)
+            if doc_postings is not None:
+                size = segment.live_size(term, doc_postings)
+                if size:
+                    parts.append((doc_postings, segment.deleted, size))
+        if not parts:
+            return memory
+        if memory is None and len(parts) == 1 and not parts[0][1]:
+            return parts[0][0]
+        if memory is not None:
+            parts.append((memory, None, len(memory)))
+        return MultiPostings(parts)
+    
+    def term_positions(self, term):
+        """词项在各文档中的位置编码 {文档ID: 字节串}"""
+        memory = self.positions.get(term, {})
+        if not self.segments:
+            return memory
+        hashes = term_hashes(term)
+        merged = {}
+        for segment in self.segments:
+            merged.update(segment.positions(term, hashes=hashes))
+        merged.update(memory)
+        return merged
+    
+    def positions_for(self, term, doc_id):
+        """单个文档中词项的位置编码，不存在时返回None"""
+        entry = self.documents.get(doc_id)
+        if entry is not None and entry.segment is not None:
+            return entry.segment.positions_for(term, doc_id)
+        return self.positions.get(term, {}).get(doc_id)
+    
+    def category_may_contain(self, category_id, term):
+        """该分类的文档是否可能包含词项
+        
+        落盘段查各段的分类布隆过滤器；内存段很小，直接检查倒排表中的文档。
+        没有落盘段时无法廉价判断，总是返回True
+        """
+        if not self.segments:
+            return True
+        hashes = term_hashes(term)
+        if any(segment.category_might_contain(category_id, term, hashes) for segment in self.segments):
+            return True
+        memory = self.postings.get(term)
+        if memory is None:
+            return False
+        documents = self.documents
+        return any(documents[doc_id].category_id == category_id for doc_id in memory.doc_ids())
+    
+    def keyword_may_match(self, keyword, category_id=None):
+        """关键词是否可能命中（限定分类时只看该分类的文档），False 表示一定不命中
+        
+        关键词整体命中或其所有词项都命中才算命中；单个汉字还会命中包含它的长词，视为可能命中
+        """
+        if category_id is None:
+            def present(term):
+                return self.has_term(term)
+        else:
+            def present(term):
+                return self.category_may_contain(category_id, term)
+        
+        with self.lock:
+            if present(normalize_term(keyword)):
+                return True
+            terms = analyze_keyword(keyword)
+            return bool(terms) and all(
+                (len(term) == 1 and term in self.char_terms) or present(term) for term in terms
+            )
+    
+    def doc_freq(self, term):
+        """词项的文档频率"""
+        return len(self.term_postings(term) or ())
+    
+    def all_ids(self):
+        """索引中的全部文档ID"""
+        with self.lock:
+            return set(self.documents)
+    
+    def match(self, keywords, mode='or', alternatives=None):
+        """查找匹配关键词的文档
+        
+        Args:
+            keywords: 查询关键词列表，每个关键词会再被切分为词项
+            mode: 'or' - 倒排表并集, 'and' - 倒排表交集
+            alternatives: 拼写容错得到的 {关键词: [候选关键词, ...]}，命中任一候选即视为命中该关键词
+        """
+        with self.lock:
+            result = None
+            for keyword in keywords:
+                docs = self._match_keyword(keyword)
+                for alternative in (alternatives or {}).get(keyword, ()):
+                    docs |= self._match_keyword(alternative)
+                if mode == 'and':
+                    result = docs if result is None else result & docs
+                    if not result:
+                        return set()
+                else:
+                    result = docs if result is None else result | docs
+            return result or set()
+    
+    def _match_keyword(self, keyword):
+        """单个关键词：整体命中（如完整标签）或其所有词项同时命中"""
+        matched = set(self.term_postings(normalize_term(keyword)) or ())
+        
+        terms = analyze_keyword(keyword)
+        if terms:
+            # 从最短的倒排表开始求交，候选较少时用游标跳过不相关的块
+            by_length = sorted(terms, key=self._term_size)
+            docs = self._term_docs(by_length[0])
+            for term in by_length[1:]:
+                if not docs:
+                    break
+                doc_postings = self.term_postings(term)
+                if len(term) == 1 and term in self.char_terms or doc_postings is None:
+                    docs.intersection_update(self._term_docs(term))
+                else:
+                    docs = doc_postings.intersect(docs)
+            matched |= docs
+        
+        return matched
+    
+    def _term_size(self, term):
+        if len(term) == 1 and term in self.char_terms:
+            return self.doc_freq(term) + sum(
+                self.doc_freq(longer) for longer in self.char_terms[term]
+            )
+        return self.doc_freq(term)
+    
+    def _term_docs(self, term):
+        """词项命中的文档；单个汉字还会命中包含该字的词项（如“雪”命中“雪崩”）"""
+        doc_postings = self.term_postings(term)
+        docs = doc_postings.doc_ids() if doc_postings is not None else set()
+        if len(term) != 1 or term not in self.char_terms:
+            return docs
+        
+        for longer in self.char_terms[term]:
+            longer_postings = self.term_postings(longer)
+            if longer_postings is not None:
+                docs.update(longer_postings.doc_ids())
+        return docs
+    
+    def match_phrase(self, terms, slop=0, candidates=None):
+        """短语/邻近查询：通过合并各词项的位置列表判断，不扫描原文
+        
+        Args:
+            terms: [(词项, 相对位置), ...]
+            slop: 0 - 按相对位置顺序相邻; >0 - 各词项落在跨度不超过 slop+词项数-1 的窗口内
+            candidates: 可选，只在这些文档中查找
+        """
+        with self.lock:
+            if not terms:
+                return set()
+            
+            term_positions = {term: self.term_positions(term) for term, _ in terms}
+            doc_positions = sorted(term_positions.values(), key=len)
+            docs = set(doc_positions[0])
+            if candidates is not None:
+                docs &= candidates
+            for other in doc_positions[1:]:
+                if not docs:
+                    return set()
+                docs.intersection_update(other.keys())
+            
+            if len(terms) == 1:
+                return docs
+            
+            # 邻近查询中重复的词项每次都要占用不同的位置
+            counts = Counter(term for term, _ in terms)
+            matched = set()
+            for doc_id in docs:
+                # 只在同一字段内匹配（0: 标题, 1: 正文）
+                for field in (0, 1):
+                    lists = [
+                        decode_positions(term_positions[term][doc_id])[field] for term, _ in terms
+                    ]
+                    if not all(lists):
+                        continue
+                    if slop:
+                        unique = {term: positions for (term, _), positions in zip(terms, lists)}
+                        found = _min_span(
+                            list(unique.values()), [counts[term] for term in unique]
+                        ) <= slop + len(terms) - 1
+                    else:
+                        found = _adjacent(lists, [offset for _, offset in terms])
+                    if found:
+                        matched.add(doc_id)
+                        break
+            return matched
+    
+    def term_offsets(self, doc_id, terms):
+        """文档正文中各词项的命中区间 [(起点, 终点), ...]，供摘要高亮使用"""
+        with self.lock:
+            spans = []
+            for term in terms:
+                entry = self.positions_for(normalize_term(term), doc_id)
+                if entry is not None:
+                    spans.extend((offset, offset + len(term)) for offset in decode_positions(entry)[2])
+            return spans
+    
+    def match_field(self, keyword, field):
+        """关键词在指定字段中命中：其所有词项都出现在该字段"""
+        with self.lock:
+            terms = analyze_keyword(keyword) or [normalize_term(keyword)]
+            docs = None
+            for term in terms:
+                term_docs = {
+                    doc_id for doc_id, freqs in (self.term_postings(term) or {}).items() if freqs[field]
+                }
+                docs = term_docs if docs is None else docs & term_docs
+                if not docs:
+                    return set()
+            return docs
+    
+    def docs_with_tag(self, tag):
+        """带有该标签的文档（完整标签，不区分大小写）"""
+        with self.lock:
+            return set(self.tag_docs.get(normalize_term(tag), ()))
+    
+    def docs_in_category(self, category_id):
+        with self.lock:
+            return set(self.category_docs.get(category_id, ()))
+    
+    def created_range(self, after=None, before=None):
+        """创建时间位于 [after, before) 内的文档，通过有序列表二分查找"""
+        with self.lock:
+            order = self.created_order
+            start = bisect.bisect_left(order, (self._timestamp(after), -1)) if after else 0
+            end = bisect.bisect_left(order, (self._timestamp(before), -1)) if before else len(order)
+            return {doc_id for _, doc_id in order[start:end]}
+    
+    def count_created_range(self, after=None, before=None):
+        with self.lock:
+            order = self.created_order
+            start = bisect.bisect_left(order, (self._timestamp(after), -1)) if after else 0
+            end = bisect.bisect_left(order, (self._timestamp(before), -1)) if before else len(order)
+            return max(end - start, 0)
+    
+    @staticmethod
+    def _value_counts(value_docs, doc_ids):
+        """每个取值的文档集合与匹配集合的交集大小（从较小的一侧遍历），省略为0的取值"""
+        counts = {}
+        for value, docs in value_docs.items():
+            small, large = (docs, doc_ids) if len(docs) <= len(doc_ids) else (doc_ids, docs)
+            count = sum(1 for doc_id in small if doc_id in large)
+            if count:
+                counts[value] = count
+        return counts
+    
+    def facet_counts(self, doc_ids, tag_limit=10):
+        """匹配集合在分类、文件类型和标签上的分布
+        
+        Returns:
+            {'category': {分类ID: 数量}, 'file_type': {类型: 数量}, 'tags': [(标签, 数量), ...]}
+            标签只返回数量最多的tag_limit个
+        """
+        if not isinstance(doc_ids, (set, frozenset)):
+            doc_ids = set(doc_ids)
+        with self.lock:
+            tag_counts = self._value_counts(self.tag_docs, doc_ids)
+            top_tags = heapq.nsmallest(
+                tag_limit, tag_counts.items(), key=lambda item: (-item[1], item[0])
+            )
+            return {
+                'category': self._value_counts(self.category_docs, doc_ids),
+                'file_type': self._value_counts(self.file_type_docs, doc_ids),
+                'tags': [(self.tag_labels.get(tag, tag), count) for tag, count in top_tags]
+            }
+    
+    def estimate_keyword(self, keyword):
+        """关键词命中文档数的估计（不求交集）"""
+        with self.lock:
+            whole = self.doc_freq(normalize_term(keyword))
+            terms = analyze_keyword(keyword)
+            if not terms:
+                return whole
+            return max(whole, min(self.doc_freq(term) for term in terms))
+    
+    def fuzzy_alternatives(self, keywords):
+        """拼音和拼写容错：不在词表中的关键词先按拼音/首字母解析为中文词项，
+        解析不到时把其中不在词表里的英文词项替换为编辑距离最近的词表词项
+        
+        Returns:
+            {关键词: [替换后的候选关键词, ...]}，词项都在词表中（或无法纠正）的关键词不出现
+        """
+        with self.lock:
+            result = {}
+            for keyword in keywords:
+                key = normalize_term(keyword)
+                if self.has_term(key):
+                    continue
+                terms = self.pinyin.lookup(key, self.doc_freq)
+                if terms:
+                    result[keyword] = terms
+                    continue
+                options = []
+                corrected = False
+                for term in analyze_keyword(keyword):
+                    expansions = None
+                    if is_fuzzy_term(term) and not self.has_term(term):
+                        expansions = self.fuzzy.expand(term, self.doc_freq)
+                    corrected = corrected or bool(expansions)
+                    options.append(expansions or [term])
+                if corrected:
+                    result[keyword] = [
+                        ' '.join(terms) for terms in islice(product(*options), MAX_EXPANSIONS)
+                    ]
+            return result
+    
+    def query_terms(self, keywords):
+        """关键词对应的全部打分词项（去重，保持顺序）"""
+        terms = []
+        for keyword in keywords:
+            whole = normalize_term(keyword)
+            candidates = analyze_keyword(keyword)
+            if whole not in candidates and self.has_term(whole):
+                candidates.append(whole)
+            for term in candidates:
+                if term not in terms:
+                    terms.append(term)
+        return terms
+    
+    def top_ids(self, doc_ids, sort_by, limit):
+        """按排序方式取前limit个文档ID（堆选择，避免全量排序）"""
+        with self.lock:
+            documents = self.documents
+            if sort_by == 'date_asc':
+                return heapq.nsmallest(
+                    limit, doc_ids, key=lambda i: (documents[i].created_at, i)
+                )
+            if sort_by == 'title':
+                return heapq.nsmallest(
+                    limit, doc_ids, key=lambda i: (documents[i].title, i)
+                )
+            return heapq.nlargest(
+                limit, doc_ids, key=lambda i: (documents[i].created_at, i)
+            )
+    
+    def keyset_ids(self, doc_ids, after, limit, ascending=False):
+        """游标分页：取排序键 (created_at, id) 位于after之后的前limit个文档ID"""
+        with self.lock:
+            documents = self.documents
+            
+            def sort_key(doc_id):
+                return documents[doc_id].created_at, doc_id
+            
+            if after is not None:
+                after_key = (self._timestamp(after[0]), after[1])
+                if ascending:
+                    doc_ids = [i for i in doc_ids if sort_key(i) > after_key]
+                else:
+                    doc_ids = [i for i in doc_ids if sort_key(i) < after_key]
+            
+            select = heapq.nsmallest if ascending else heapq.nlargest
+            return select(limit, doc_ids, key=sort_key)
+    
+    def _labels(self, documents):
+        return {
+            tag: self.tag_labels.get(tag, tag) for _, entry in documents for tag in entry.tags
+        }
+    
+    def attach_segments(self, segments):
+        """载入已落盘的段（按写入先后）
+        
+        文档元数据进入内存，倒排表和位置信息留在映射中；段的删除标记中的文档跳过；
+        同一文档出现在多个段中时（更新前后各自落盘过）以较新的段为准
+        """
+        with self.lock:
+            added = {}
+            for segment in segments:
+                for doc_id, lengths, created_at, updated_at, title, category_id, tags, file_type in segment.rows:
+                    if doc_id in segment.deleted:
+                        continue
+                    if doc_id in self.documents:
+                        self._remove(doc_id)
+                    self._register(doc_id, DocumentEntry(
+                        (), tuple(lengths), created_at, title, category_id, tuple(tags), file_type,
+                        updated_at=updated_at, segment=segment
+                    ))
+                    added[doc_id] = created_at
+                for tag, label in segment.tag_labels.items():
+                    self.tag_labels.setdefault(tag, label)
+                for term in segment.iter_terms():
+                    self._link_chars(term)
+                    self.fuzzy.add(term)
+                for term in segment.title_terms:
+                    self.pinyin.add(term)
+                segment.rows = None
+                segment.title_terms = None
+                self.segments.append(segment)
+            
+            self.created_order.extend((created_at, doc_id) for doc_id, created_at in added.items())
+            self.created_order.sort()
+            self.built_at = time.time()
+    
+    def deleted_documents(self):
+        """各落盘段的删除标记 {段名: 文档ID集合}（副本，供写入者记入清单）"""
+        with self.lock:
+            return {segment.name: set(segment.deleted) for segment in self.segments if segment.deleted}
+    
+    def memory_size(self):
+        """内存段中的文档数"""
+        return len(self.memory_ids)
+    
+    def flush(self, store):
+        """把内存段写为新的落盘段，之后这些文档的倒排表和位置信息改由映射提供
+        
+        内存段很小（由落盘阈值控制），写入期间持有索引锁
+        
+        Returns:
+            新段，内存段为空时返回None
+        """
+        with self.lock:
+            if not self.memory_ids:
+                return None
+            documents = [(doc_id, self.documents[doc_id]) for doc_id in sorted(self.memory_ids)]
+            segment = store.write(len(FIELDS), documents, self._labels(documents), (
+                (term, doc_postings.items(), sorted(self.positions.get(term, {}).items()))
+                for term, doc_postings in sorted(self.postings.items())
+            ))
+            segment.rows = None
+            for _, entry in documents:
+                entry.segment = segment
+                entry.terms = ()
+            self.postings = {}
+            self.positions = {}
+            self.memory_ids = set()
+            self.segments.append(segment)
+            return segment
+    
+    def merge(self, segments, store):
+        """把若干相邻的落盘段合并为一个，丢弃已删除的文档
+        
+        段不可变，写新段期间不持有索引锁；合并期间被删除的文档在新段中补记删除
+        
+        Returns:
+            是否完成（被合并的段已不在清单中时放弃）
+        """
+        with self.lock:
+            deleted = {segment: set(segment.deleted) for segment in segments}
+            documents = sorted(
+                (doc_id, self.documents[doc_id])
+                for segment in segments for doc_id in segment.doc_ids - deleted[segment]
+            )
+            labels = self._labels(documents)
+        
+        def live(pairs, gone):
+            return ((doc_id, value) for doc_id, value in pairs if doc_id not in gone)
+        
+        def merged_terms():
+            previous = None
+            for term in heapq.merge(*(segment.iter_terms() for segment in segments)):
+                if term == previous:
+                    continue
+                previous = term
+                postings_parts = []
+                positions_parts = []
+                hashes = term_hashes(term)
+                for segment in segments:
+                    doc_postings = segment.postings(term, hashes, cache=False)
+                    if doc_postings is None:
+                        continue
+                    postings_parts.append(live(doc_postings.items(), deleted[segment]))
+                    positions_parts.append(segment.positions(term, deleted[segment], hashes).items())
+                yield term, heapq.merge(*postings_parts), heapq.merge(*positions_parts)
+        
+        if documents:
+            merged = store.write(len(FIELDS), documents, labels, merged_terms(), replaces=segments)
+            if merged is None:
+                return False
+            merged.rows = None
+        else:
+            merged = None
+            if not store.drop(segments):
+                return False
+        
+        with self.lock:
+            if merged is not None:
+                for segment in segments:
+                    for doc_id in segment.deleted - deleted[segment]:
+                        merged.delete(doc_id)
+                for doc_id, entry in documents:
+                    if self.documents.get(doc_id) is entry:
+                        entry.segment = merged
+            position = self.segments.index(segments[0])
+            remaining = [segment for segment in self.segments if segment not in segments]
+            if merged is not None:
+                remaining.insert(position, merged)
+            self.segments = remaining
+        store.remove(segments)
+        return True
+    
+    def memory_report(self):
+        """内存段倒排表和位置信息的内存占用（字节，不含词项字符串和字典本身），
+        以及落盘段映射的文件大小（在页缓存中，由各进程共享）"""
+        with self.lock:
+            postings = sum(len(p) for p in self.postings.values())
+            postings_bytes = sum(p.nbytes() for p in self.postings.values())
+            pending = sum(p.pending_count() for p in self.postings.values())
+            positions = sum(len(docs) for docs in self.positions.values())
+            positions_bytes = sum(
+                sys.getsizeof(data) for docs in self.positions.values() for data in docs.values()
+            )
+            return {
+                'postings_bytes': postings_bytes,
+                'bytes_per_posting': round(postings_bytes / postings, 2) if postings else 0,
+                'pending_postings': pending,
+                'positions_bytes': positions_bytes,
+                'bytes_per_position_entry': round(positions_bytes / positions, 2) if positions else 0,
+                'mapped_bytes': sum(segment.size_bytes() for segment in self.segments)
+            }
+    
+    def stats(self):
+        """索引统计信息"""
+        with self.lock:
+            return {
+                'documents': len(self.documents),
+                # 落盘段按段累加：同一词项在多个段中重复计数，倒排项数包含尚未被合并清除的已删除文档
+                'terms': len(self.postings) + sum(segment.term_count for segment in self.segments),
+                'postings': sum(len(p) for p in self.postings.values()) + sum(
+                    segment.postings_count for segment in self.segments
+                ),
+                'memory_documents': len(self.memory_ids),
+                'segments': [
+                    {'name': segment.name, 'documents': segment.doc_count, 'deleted': len(segment.deleted)}
+                    for segment in self.segments
+                ],
+                'bloom': {
+                    key: sum(segment.stats[key] for segment in self.segments)
+                    for key in ('bloom_rejections', 'dictionary_lookups', 'false_positives')
+                },
+                'fuzzy': self.fuzzy.get_stats(),
+                'pinyin': self.pinyin.get_stats(),
+                'memory': self.memory_report(),
+                'built_at': self.built_at
+            }
+
+def _adjacent(lists, offsets):
+    """有序位置列表的归并：是否存在p，使每个词项都出现在 p + 相对位置 上"""
+    starts = lists[0]
+    base = offsets[0]
+    for positions, offset in zip(lists[1:], offsets[1:]):
+        shift = offset - base
+        merged = []
+        i = j = 0
+        while i < len(starts) and j < len(positions):
+            target = starts[i] + shift
+            if positions[j] < target:
+                j += 1
+            elif positions[j] > target:
+                i += 1
+            else:
+                merged.append(starts[i])
+                i += 1
+                j += 1
+        if not merged:
+            return False
+        starts = merged
+    return True
+
+def _min_span(lists, counts):
+    """滑动窗口求最小窗口跨度：窗口内第i个列表至少有 counts[i] 个不同位置
+    
+    同一词项在查询中出现多次时由同一个列表表示，每次出现需要各自的位置；
+    位置不够时返回无穷大
+    """
+    events = list(heapq.merge(*([(position, i) for position in positions] for i, positions in enumerate(lists))))
+    have = [0] * len(lists)
+    missing = len(lists)
+    best = float('inf')
+    left = 0
+    for position, i in events:
+        have[i] += 1
+        if have[i] == counts[i]:
+            missing -= 1
+        while not missing:
+            low, k = events[left]
+            best = min(best, position - low)
+            if have[k] == counts[k]:
+                missing += 1
+            have[k] -= 1
+            left += 1
+    return best
@@ -0,0 +1,87 @@
+"""
+拼音检索
+把标题和标签中的中文词项转写为全拼和首字母（如 机器学习 -> jiqixuexi / jqxx），
+输入拼音或首字母时通过预先计算的映射直接找到对应的中文词项。
+转写使用 pypinyin 自带的离线词典，不访问网络；未安装时拼音检索不可用，其余检索不受影响
+"""
+import re
+import threading
+from functools import lru_cache
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:
+    lazy_pinyin = None
+    Style = None
+    print("未安装 pypinyin，拼音检索和拼音补全不可用")
+
+_CJK_PATTERN = re.compile(r'[\u4e00-\u9fa5]')
+_PINYIN_INPUT = re.compile(r'^[a-z]{2,}$')
+_NOT_ALNUM = re.compile(r'[^a-z0-9]+')
+
+# 至少两个汉字的词项才建立映射（单字的首字母过于宽泛）
+MIN_CHARS = 2
+# 每个拼音输入最多解析出的中文词项数
+MAX_TERMS = 3
+
+def available():
+    return lazy_pinyin is not None
+
+def is_pinyin_input(text):
+    """是否可能是拼音或首字母输入（纯小写字母）"""
+    return bool(_PINYIN_INPUT.match(text))
+
+@lru_cache(maxsize=65536)
+def pinyin_keys(text):
+    """文本的 (全拼, 首字母)
+    
+    非汉字的字母和数字原样保留，空白和标点丢弃；不含汉字或未安装 pypinyin 时返回 None
+    """
+    if lazy_pinyin is None or not _CJK_PATTERN.search(text):
+        return None
+    full = _NOT_ALNUM.sub('', ''.join(lazy_pinyin(text)).lower())
+    initials = _NOT_ALNUM.sub('', ''.join(lazy_pinyin(text, style=Style.FIRST_LETTER)).lower())
+    return full, initials
+
+class PinyinIndex:
+    """拼音 -> 中文词项 的映射
+    
+    与拼写容错的三元组索引一样只增不减：词项从索引中消失后仍留在这里，查找时按文档频率过滤
+    """
+    
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.clear()
+    
+    def clear(self):
+        with self.lock:
+            self.terms = set()
+            self.keys = {}
+    
+    def add(self, term):
+        if term in self.terms or len(term) < MIN_CHARS:
+            return
+        keys = pinyin_keys(term)
+        with self.lock:
+            self.terms.add(term)
+            if keys is None:
+                return
+            for key in set(keys):
+                self.keys.setdefault(key, []).append(term)
+    
+    def lookup(self, text, doc_freq, limit=MAX_TERMS):
+        """拼音或首字母对应的中文词项（按文档频率降序），最多limit个
+        
+        Args:
+            doc_freq: 词项 -> 文档频率，为0的词项（已从索引中删除）不作为结果
+        """
+        if not is_pinyin_input(text):
+            return []
+        with self.lock:
+            ranked = [(doc_freq(term), term) for term in self.keys.get(text, ())]
+        ranked = sorted((item for item in ranked if item[0]), key=lambda item: (-item[0], item[1]))
+        return [term for _, term in ranked[:limit]]
+    
+    def get_stats(self):
+        with self.lock:
+            return {'available': available(), 'terms': len(self.terms), 'keys': len(self.keys)}
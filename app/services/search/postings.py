@@ -0,0 +1,421 @@
+"""
+压缩倒排表
+文档ID按块内差值编码，与各字段词频交错存放在按最大值选择元素宽度的 array 中
+（多数词项每个倒排项只占 1 字节差值 + 每字段 1 字节词频），块内差值用 accumulate 解码；
+跳表记录每块第一个文档ID，查找和求交可以整块跳过。
+增量写入先进入未压缩的小缓冲区，积累到一定比例后合并重编码。
+落盘段中的倒排表直接以段文件映射上的 memoryview 作为压缩块（只读，不复制），
+多个段中同一词项的倒排表由 MultiPostings 合并读取。
+位置信息体积更大但只在短语查询和高亮时读取，使用 varint 字节串
+"""
+import bisect
+import heapq
+import sys
+from array import array
+from itertools import accumulate
+
+# 每块的倒排项数
+BLOCK_SIZE = 128
+# 缓冲区（新增、修改、删除）超过 max(MIN_PENDING, 已压缩项数 * COMPACT_RATIO) 时重编码
+MIN_PENDING = 32
+COMPACT_RATIO = 0.125
+
+_TYPECODES = (('B', 0xFF), ('H', 0xFFFF), ('I', 0xFFFFFFFF), ('q', 2 ** 63 - 1))
+
+def _typecode(max_value):
+    """能容纳max_value的最窄无符号array类型"""
+    for code, limit in _TYPECODES:
+        if max_value <= limit:
+            return code
+    raise OverflowError(max_value)
+
+def encode_varint(value, out):
+    """把非负整数按 varint（每字节7位，高位为延续标记）追加到 out"""
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def decode_varint(data, pos):
+    """从 pos 处解码一个 varint，返回 (值, 下一个位置)"""
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+def encode_positions(*lists):
+    """把若干个升序整数列表编码为字节串：每个列表为 长度 + 差值序列"""
+    out = bytearray()
+    for values in lists:
+        encode_varint(len(values), out)
+        previous = 0
+        for value in values:
+            encode_varint(value - previous, out)
+            previous = value
+    return bytes(out)
+
+def decode_positions(data, count=3):
+    """encode_positions 的逆操作，返回count个元组"""
+    result = []
+    pos = 0
+    for _ in range(count):
+        length, pos = decode_varint(data, pos)
+        values = []
+        previous = 0
+        for _ in range(length):
+            delta, pos = decode_varint(data, pos)
+            previous += delta
+            values.append(previous)
+        result.append(tuple(values))
+    return result
+
+class PostingList:
+    """单个词项的倒排表：文档ID -> 各字段词频元组
+    
+    提供与字典相近的只读接口（len/in/get/items/迭代），迭代按文档ID升序；
+    写入使用 add/remove。
+    
+    data: 每个倒排项占 fields+1 个元素：块内文档ID差值（块首为0）+ 各字段词频
+    skip: 每块第一个文档ID（跳表）
+    pending: 尚未压缩的新增或修改项，覆盖压缩块中的同一文档（空时为None）
+    deleted: 压缩块中已删除或被 pending 覆盖的文档（空时为None）
+    """
+    
+    __slots__ = ('fields', 'data', 'skip', 'last', 'base_size', 'pending', 'deleted', 'size')
+    
+    def __init__(self, fields=3, items=()):
+        self.fields = fields
+        self.pending = None
+        self.deleted = None
+        self._encode(items)
+    
+    @classmethod
+    def from_buffers(cls, fields, data, skip, last, size):
+        """直接使用已编码的压缩块和跳表（如段文件映射上的 memoryview），不复制；
+        这样构造的倒排表只读"""
+        postings = cls.__new__(cls)
+        postings.fields = fields
+        postings.data = data
+        postings.skip = skip
+        postings.last = last
+        postings.base_size = postings.size = size
+        postings.pending = None
+        postings.deleted = None
+        return postings
+    
+    def _encode(self, items):
+        """把按文档ID升序的 (文档ID, 词频元组) 编码为压缩块"""
+        values = []
+        skip = []
+        previous = 0
+        for count, (doc_id, freqs) in enumerate(items):
+            if count % BLOCK_SIZE == 0:
+                skip.append(doc_id)
+                values.append(0)
+            else:
+                values.append(doc_id - previous)
+            values.extend(freqs)
+            previous = doc_id
+        
+        self.data = array(_typecode(max(values, default=0)), values)
+        self.skip = array('q', skip)
+        self.last = previous
+        self.base_size = self.size = len(values) // (self.fields + 1)
+    
+    def _block_ids(self, block):
+        """解码一个块的文档ID（C层累加，无逐项Python循环）"""
+        stride = self.fields + 1
+        start = block * BLOCK_SIZE
+        end = min(start + BLOCK_SIZE, self.base_size)
+        return list(accumulate(self.data[(start + 1) * stride:end * stride:stride], initial=self.skip[block]))
+    
+    def _freqs(self, index):
+        stride = self.fields + 1
+        return tuple(self.data[index * stride + 1:(index + 1) * stride])
+    
+    def _base_get(self, doc_id):
+        """在压缩块中查找：跳表二分定位到块，只解码这一块"""
+        if not self.base_size or doc_id > self.last:
+            # 新文档ID通常大于已有ID，追加时无需解码
+            return None
+        block = bisect.bisect_right(self.skip, doc_id) - 1
+        if block < 0:
+            return None
+        ids = self._block_ids(block)
+        i = bisect.bisect_left(ids, doc_id)
+        if i < len(ids) and ids[i] == doc_id:
+            return self._freqs(block * BLOCK_SIZE + i)
+        return None
+    
+    def _base_items(self):
+        pending, deleted = self.pending or {}, self.deleted or ()
+        stride = self.fields + 1
+        data = self.data
+        for block in range(len(self.skip)):
+            index = block * BLOCK_SIZE * stride
+            for doc_id in self._block_ids(block):
+                if doc_id not in deleted and doc_id not in pending:
+                    yield doc_id, tuple(data[index + 1:index + stride])
+                index += stride
+    
+    def get(self, doc_id, default=None):
+        if self.pending:
+            freqs = self.pending.get(doc_id)
+            if freqs is not None:
+                return freqs
+        if self.deleted and doc_id in self.deleted:
+            return default
+        freqs = self._base_get(doc_id)
+        return default if freqs is None else freqs
+    
+    def __getitem__(self, doc_id):
+        freqs = self.get(doc_id)
+        if freqs is None:
+            raise KeyError(doc_id)
+        return freqs
+    
+    def __contains__(self, doc_id):
+        return self.get(doc_id) is not None
+    
+    def __len__(self):
+        return self.size
+    
+    def __bool__(self):
+        return self.size > 0
+    
+    def items(self):
+        """按文档ID升序的 (文档ID, 词频元组)"""
+        if not self.pending:
+            return self._base_items()
+        return heapq.merge(self._base_items(), sorted(self.pending.items()))
+    
+    def __iter__(self):
+        return iter(sorted(self.doc_ids()))
+    
+    def doc_ids(self):
+        """全部文档ID的集合（按块解码，不构造词频）"""
+        docs = set()
+        for block in range(len(self.skip)):
+            docs.update(self._block_ids(block))
+        if self.deleted:
+            docs -= self.deleted
+        if self.pending:
+            docs.update(self.pending)
+        return docs
+    
+    def add(self, doc_id, freqs):
+        """新增或替换一个文档的词频"""
+        if self.pending is None:
+            self.pending = {}
+        if doc_id not in self.pending:
+            in_base = self._base_get(doc_id) is not None
+            if not in_base or doc_id in (self.deleted or ()):
+                self.size += 1
+            # 被覆盖的压缩项在读取时由 pending 屏蔽；记为删除，合并时一并丢弃
+            if in_base:
+                if self.deleted is None:
+                    self.deleted = set()
+                self.deleted.add(doc_id)
+        self.pending[doc_id] = tuple(freqs)
+        self._maybe_compact()
+    
+    def remove(self, doc_id):
+        """删除一个文档，返回是否存在"""
+        if self.get(doc_id) is None:
+            return False
+        if self.pending:
+            self.pending.pop(doc_id, None)
+        if self._base_get(doc_id) is not None:
+            if self.deleted is None:
+                self.deleted = set()
+            self.deleted.add(doc_id)
+        self.size -= 1
+        self._maybe_compact()
+        return True
+    
+    def pending_count(self):
+        return len(self.pending or ()) + len(self.deleted or ())
+    
+    def _maybe_compact(self):
+        if self.pending_count() > max(MIN_PENDING, self.base_size * COMPACT_RATIO):
+            self.compact()
+    
+    def compact(self):
+        """把缓冲区合并进压缩块"""
+        if not self.pending_count():
+            return
+        items = list(self.items())
+        self.pending = None
+        self.deleted = None
+        self._encode(items)
+    
+    def cursor(self):
+        return PostingCursor(self)
+    
+    def intersect(self, doc_ids):
+        """与文档ID集合求交：候选远少于倒排项时用游标跳块，否则整表解码后集合求交"""
+        if len(doc_ids) * 8 < self.size:
+            cursor = self.cursor()
+            return {doc_id for doc_id in sorted(doc_ids) if cursor.advance(doc_id) is not None}
+        return self.doc_ids() & doc_ids
+    
+    def items_for(self, doc_ids):
+        """只取给定文档的词频：文档ID排序后用游标前进，整块跳过不相关的块"""
+        cursor = self.cursor()
+        for doc_id in sorted(doc_ids):
+            freqs = cursor.advance(doc_id)
+            if freqs is not None:
+                yield doc_id, freqs
+    
+    def nbytes(self):
+        """占用内存（字节）：对象本身、压缩块、跳表和缓冲区"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.data) + sys.getsizeof(self.skip)
+        if self.pending:
+            size += sys.getsizeof(self.pending) + sum(
+                sys.getsizeof(freqs) for freqs in self.pending.values()
+            )
+        if self.deleted:
+            size += sys.getsizeof(self.deleted)
+        return size
+
+class PostingCursor:
+    """按文档ID递增顺序探测倒排表的游标
+    
+    advance(目标) 要求目标单调不减：跳表定位到可能包含目标的块，
+    已经越过的块不再解码，同一块只解码一次
+    """
+    
+    __slots__ = ('postings', 'block', 'ids', 'index')
+    
+    def __init__(self, postings):
+        self.postings = postings
+        self.block = -1
+        self.ids = ()
+        self.index = 0
+    
+    def advance(self, doc_id):
+        """返回目标文档的词频，不存在时返回None"""
+        postings = self.postings
+        if postings.pending:
+            freqs = postings.pending.get(doc_id)
+            if freqs is not None:
+                return freqs
+        if postings.deleted and doc_id in postings.deleted:
+            return None
+        
+        skip = postings.skip
+        next_block = self.block + 1
+        if self.block < 0 or (next_block < len(skip) and doc_id >= skip[next_block]):
+            block = bisect.bisect_right(skip, doc_id, max(self.block, 0)) - 1
+            if block < 0:
+                return None
+            if block != self.block:
+                self.block = block
+                self.ids = postings._block_ids(block)
+                self.index = 0
+        
+        ids = self.ids
+        index = bisect.bisect_left(ids, doc_id, self.index)
+        self.index = index
+        if index < len(ids) and ids[index] == doc_id:
+            return postings._freqs(self.block * BLOCK_SIZE + index)
+        return None
+
+class MultiPostings:
+    """同一词项在多个段中的倒排表的合并视图，接口与 PostingList 的只读部分一致
+    
+    parts: [(PostingList, 已删除文档集合或None, 存活倒排项数), ...]，
+    各段的存活文档互不重叠（文档更新后旧段中的版本记为删除）
+    """
+    
+    __slots__ = ('parts', 'size')
+    
+    def __init__(self, parts):
+        self.parts = parts
+        self.size = sum(size for _, _, size in parts)
+    
+    def get(self, doc_id, default=None):
+        for postings, deleted, _ in self.parts:
+            if deleted and doc_id in deleted:
+                continue
+            freqs = postings.get(doc_id)
+            if freqs is not None:
+                return freqs
+        return default
+    
+    def __getitem__(self, doc_id):
+        freqs = self.get(doc_id)
+        if freqs is None:
+            raise KeyError(doc_id)
+        return freqs
+    
+    def __contains__(self, doc_id):
+        return self.get(doc_id) is not None
+    
+    def __len__(self):
+        return self.size
+    
+    def __bool__(self):
+        return self.size > 0
+    
+    def items(self):
+        """按文档ID升序的 (文档ID, 词频元组)"""
+        def live(postings, deleted):
+            if not deleted:
+                return postings.items()
+            return ((doc_id, freqs) for doc_id, freqs in postings.items() if doc_id not in deleted)
+        
+        return heapq.merge(*(live(postings, deleted) for postings, deleted, _ in self.parts))
+    
+    def __iter__(self):
+        return iter(sorted(self.doc_ids()))
+    
+    def doc_ids(self):
+        docs = set()
+        for postings, deleted, _ in self.parts:
+            ids = postings.doc_ids()
+            docs.update(ids - deleted if deleted else ids)
+        return docs
+    
+    def pending_count(self):
+        return sum(postings.pending_count() for postings, _, _ in self.parts)
+    
+    def cursor(self):
+        return MultiCursor(self)
+    
+    def intersect(self, doc_ids):
+        docs = set()
+        for postings, deleted, _ in self.parts:
+            ids = postings.intersect(doc_ids)
+            docs.update(ids - deleted if deleted else ids)
+        return docs
+    
+    def items_for(self, doc_ids):
+        cursor = self.cursor()
+        for doc_id in sorted(doc_ids):
+            freqs = cursor.advance(doc_id)
+            if freqs is not None:
+                yield doc_id, freqs
+    
+    def nbytes(self):
+        return sum(postings.nbytes() for postings, _, _ in self.parts)
+
+class MultiCursor:
+    """MultiPostings 的游标：每个段各自一个游标，同样要求目标单调不减"""
+    
+    __slots__ = ('parts',)
+    
+    def __init__(self, postings):
+        self.parts = [(part.cursor(), deleted) for part, deleted, _ in postings.parts]
+    
+    def advance(self, doc_id):
+        for cursor, deleted in self.parts:
+            freqs = cursor.advance(doc_id)
+            if freqs is not None and not (deleted and doc_id in deleted):
+                return freqs
+        return None
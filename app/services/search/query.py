@@ -0,0 +1,211 @@
+"""
+查询解析模块
+把 /api/search/advanced 的查询串解析为 SearchQuery，供各检索后端执行：
+    普通关键词            按 search_mode 做 OR/AND 匹配
+    "A B"                短语：各词项必须按顺序相邻出现
+    "A B"~5              邻近：各词项出现在彼此5个词以内（不要求顺序）
+    title:Python         只在标题中匹配
+    tag:Redis            带有该标签（完整标签，不区分大小写）
+    -草稿                 排除匹配该词的文档
+    -title:草稿           排除标题中匹配该词的文档
+    -tag:草稿             排除带有该标签的文档
+    category:技术         分类名称
+    after:2025-01-01     创建时间不早于该日期
+    before:2025-02-01    创建时间早于该日期
+"""
+import re
+from datetime import datetime
+
+from app.services.search.analyzer import analyze_query, iter_tokens
+
+# 单个查询子句：可选的排除符号、字段前缀，值为带引号的短语或连续的非空白字符
+_CLAUSE_PATTERN = re.compile(
+    r'(?P<negate>-)?(?:(?P<field>title|tag|category|after|before):)?'
+    r'(?:"(?P<phrase>[^"]+)"(?:~(?P<slop>\d+))?|(?P<word>[^\s"]+))'
+)
+
+_CJK_SPACE_PATTERN = re.compile(r'(?<=[\u4e00-\u9fa5])\s+(?=[\u4e00-\u9fa5])')
+
+# 邻近查询允许的最大间隔
+MAX_SLOP = 50
+
+class QuerySyntaxError(ValueError):
+    """查询语法错误（如无法解析的日期）"""
+    pass
+
+class Phrase:
+    """短语或邻近查询
+    
+    terms: [(词项, 相对位置), ...]，按jieba精确模式切分
+    variants: 可互相替代的切分方式，汉字之间的空格去掉后切分结果不同时
+              （如“深度 学习”与“深度学习”）两种都会尝试
+    slop: 0 表示短语（顺序相邻），大于0表示邻近查询允许间隔的词数
+    """
+    
+    __slots__ = ('text', 'terms', 'variants', 'slop')
+    
+    def __init__(self, text, slop=0):
+        self.text = text
+        self.slop = min(max(slop, 0), MAX_SLOP)
+        self.terms = self._analyze(text)
+        
+        self.variants = [self.terms]
+        joined = self._analyze(_CJK_SPACE_PATTERN.sub('', text))
+        if joined and joined != self.terms:
+            self.variants.append(joined)
+    
+    @staticmethod
+    def _analyze(text):
+        terms = []
+        base = None
+        for term, position, _ in iter_tokens(text, search_mode=False):
+            if base is None:
+                base = position
+            terms.append((term, position - base))
+        return terms
+    
+    @property
+    def words(self):
+        """短语中的词项（去重，保持顺序）"""
+        words = []
+        for term, _ in self.terms:
+            if term not in words:
+                words.append(term)
+        return words
+    
+    def to_dict(self):
+        return {'text': self.text, 'terms': self.words, 'slop': self.slop}
+    
+    def cache_key(self):
+        return (tuple(self.terms), self.slop)
+
+class SearchQuery:
+    """解析后的查询
+    
+    keywords 按 search_mode 组合；phrases、title_terms、tags 和各过滤条件都必须满足，
+    excluded 中的词不能命中，excluded_title 中的词不能在标题中命中，不能带有 excluded_tags 中的标签。category 为分类名称，执行前由调用方解析为 category_id。
+    fuzzy 为拼音解析和拼写容错结果 {关键词: [候选关键词, ...]}，由支持的后端在执行前填充
+    """
+    
+    def __init__(self, keywords=None, search_mode='or', phrases=None, title_terms=None,
+                 tags=None, excluded=None, excluded_title=None, excluded_tags=None,
+                 category=None, after=None, before=None):
+        self.keywords = list(keywords or [])
+        self.search_mode = search_mode
+        self.phrases = list(phrases or [])
+        self.title_terms = list(title_terms or [])
+        self.tags = list(tags or [])
+        self.excluded = list(excluded or [])
+        self.excluded_title = list(excluded_title or [])
+        self.excluded_tags = list(excluded_tags or [])
+        self.category = category
+        self.category_id = None
+        self.after = after
+        self.before = before
+        self.fuzzy = {}
+    
+    def is_empty(self):
+        """是否没有任何匹配条件（只有过滤条件时也视为空）"""
+        return not (self.keywords or self.phrases or self.title_terms or self.tags)
+    
+    def has_filters(self):
+        return bool(
+            self.excluded or self.excluded_title or self.excluded_tags or self.category is not None or self.after or self.before
+        )
+    
+    @property
+    def highlight_keywords(self):
+        """用于高亮和页内相关度估算的关键词"""
+        keywords = list(self.keywords)
+        candidates = list(self.title_terms)
+        for alternatives in self.fuzzy.values():
+            for alternative in alternatives:
+                candidates.extend(alternative.split())
+        for phrase in self.phrases:
+            candidates.extend(phrase.words)
+        keywords.extend(word for word in dict.fromkeys(candidates) if word not in keywords)
+        return keywords
+    
+    def cache_key(self):
+        """计数缓存键：关键词顺序和大小写不影响匹配结果"""
+        def normalized(words):
+            return tuple(sorted({word.lower() for word in words}))
+        
+        return (
+            normalized(self.keywords),
+            self.search_mode,
+            tuple(sorted(phrase.cache_key() for phrase in self.phrases)),
+            normalized(self.title_terms),
+            normalized(self.tags),
+            normalized(self.excluded),
+            normalized(self.excluded_title),
+            normalized(self.excluded_tags),
+            self.category,
+            self.after,
+            self.before,
+            tuple(sorted((keyword, tuple(alternatives)) for keyword, alternatives in self.fuzzy.items()))
+        )
+    
+    def to_dict(self):
+        """解析结果（用于响应中回显）"""
+        return {
+            'keywords': self.keywords,
+            'phrases': [phrase.to_dict() for phrase in self.phrases],
+            'title': self.title_terms,
+            'tags': self.tags,
+            'excluded': self.excluded,
+            'excluded_title': self.excluded_title,
+            'excluded_tags': self.excluded_tags,
+            'category': self.category,
+            'after': self.after.date().isoformat() if self.after else None,
+            'before': self.before.date().isoformat() if self.before else None,
+            'fuzzy': self.fuzzy
+        }
+
+def _parse_date(field, value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise QuerySyntaxError(f'{field}: 日期格式应为 YYYY-MM-DD，收到 {value}')
+
+def parse_query(text, search_mode='or'):
+    """解析查询串，未闭合的引号按普通字符处理
+    
+    Raises:
+        QuerySyntaxError: 日期等字段值无法解析
+    """
+    text = (text or '').strip()
+    query = SearchQuery(search_mode=search_mode)
+    
+    rest = []
+    for match in _CLAUSE_PATTERN.finditer(text):
+        negate, field = match.group('negate'), match.group('field')
+        phrase_text, word = match.group('phrase'), match.group('word')
+        value = (phrase_text or word or '').strip()
+        if not value:
+            continue
+        
+        if field in ('after', 'before'):
+            setattr(query, field, _parse_date(field, value))
+        elif field == 'category':
+            query.category = value
+        elif negate and field == 'title':
+            query.excluded_title.append(value)
+        elif negate and field == 'tag':
+            query.excluded_tags.append(value)
+        elif negate:
+            query.excluded.append(value)
+        elif field == 'title':
+            query.title_terms.append(value)
+        elif field == 'tag':
+            query.tags.append(value)
+        elif phrase_text is not None:
+            phrase = Phrase(phrase_text, int(match.group('slop') or 0))
+            if phrase.terms:
+                query.phrases.append(phrase)
+        else:
+            rest.append(word)
+    
+    if rest:
+        query.keywords = list(analyze_query(' '.join(rest), search_mode))
+    return query
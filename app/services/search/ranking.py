@@ -0,0 +1,210 @@
+"""
+相关度排序
+基于倒排索引中的词项统计计算字段加权的BM25（BM25F）分数；
+取前k个结果时使用 MaxScore 动态剪枝，按词项得分上界跳过不可能进入前k的文档
+"""
+import heapq
+import math
+import threading
+
+# 字段权重和长度归一化系数，顺序与 inverted_index.FIELDS 一致（标题、标签、正文）
+FIELD_WEIGHTS = (3.0, 2.0, 1.0)
+FIELD_B = (0.5, 0.3, 0.75)
+K1 = 1.2
+
+# 上界比较时的相对容差，避免浮点误差导致误剪
+BOUND_EPSILON = 1e-9
+
+class BM25FScorer:
+    """BM25F打分器
+    
+    各字段词频先按字段权重和字段长度归一化后合并为伪词频，
+    再套用BM25的饱和函数与IDF
+    """
+    
+    def __init__(self, index, field_weights=FIELD_WEIGHTS, field_b=FIELD_B, k1=K1):
+        self.index = index
+        self.field_weights = field_weights
+        self.field_b = field_b
+        self.k1 = k1
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            'top_k_queries': 0,
+            'candidates': 0,
+            'documents_scored': 0
+        }
+    
+    def idf(self, term):
+        """BM25的IDF（加1平滑，保证非负）"""
+        total_docs = len(self.index.documents)
+        df = self.index.doc_freq(term)
+        return math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+    
+    def _avg_lengths(self):
+        total_docs = max(len(self.index.documents), 1)
+        return [max(total / total_docs, 1.0) for total in self.index.total_lengths]
+    
+    def _field_tf(self, field, freq, length, avg_length):
+        b = self.field_b[field]
+        return self.field_weights[field] * freq / (1 - b + b * length / avg_length)
+    
+    def _pseudo_tf(self, freqs, lengths, avg_lengths):
+        """字段加权、长度归一化后的伪词频"""
+        tf = 0.0
+        for field, freq in enumerate(freqs):
+            if freq:
+                tf += self._field_tf(field, freq, lengths[field], avg_lengths[field])
+        return tf
+    
+    def get_stats(self):
+        with self.stats_lock:
+            return dict(self.stats)
+    
+    def upper_bound(self, term, avg_lengths):
+        """词项对任意文档的得分上界
+        
+        缓存计算时各字段伪词频的最大值和当时的平均长度。平均长度变大时，
+        伪词频最多放大 新平均长度/旧平均长度 倍，按该比例放大即可继续作为上界；
+        新增含该词项的文档时由索引清除缓存
+        """
+        index = self.index
+        cached = index.score_bounds.get(term)
+        if cached is None:
+            documents = index.documents
+            maxima = [0.0] * len(self.field_weights)
+            for doc_id, freqs in (index.term_postings(term) or {}).items():
+                lengths = documents[doc_id].lengths
+                for field, freq in enumerate(freqs):
+                    if freq:
+                        tf = self._field_tf(field, freq, lengths[field], avg_lengths[field])
+                        if tf > maxima[field]:
+                            maxima[field] = tf
+            cached = index.score_bounds[term] = (tuple(avg_lengths), maxima)
+        
+        cached_avg, maxima = cached
+        tf = sum(
+            maximum * max(1.0, avg / old_avg)
+            for maximum, avg, old_avg in zip(maxima, avg_lengths, cached_avg)
+        )
+        return self.idf(term) * tf / (self.k1 + tf) * (1 + BOUND_EPSILON)
+    
+    def score_candidates(self, terms, candidates):
+        """对候选文档计算BM25F分数
+        
+        Returns:
+            {文档ID: 分数}，只经过滤条件或单字匹配命中的候选分数为0
+        """
+        index = self.index
+        with index.lock:
+            documents = index.documents
+            avg_lengths = self._avg_lengths()
+            scores = dict.fromkeys(candidates, 0.0)
+            
+            for term in terms:
+                doc_postings = index.term_postings(term)
+                if not doc_postings:
+                    continue
+                idf = self.idf(term)
+                
+                # 从较小的一侧遍历
+                if len(doc_postings) <= len(candidates):
+                    pairs = ((d, f) for d, f in doc_postings.items() if d in candidates)
+                else:
+                    pairs = doc_postings.items_for(candidates)
+                
+                for doc_id, freqs in pairs:
+                    tf = self._pseudo_tf(freqs, documents[doc_id].lengths, avg_lengths)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf / (self.k1 + tf)
+            
+            return scores
+    
+    def top_k(self, terms, candidates, k, trace=None):
+        """候选集中分数最高的k个文档（MaxScore剪枝）
+        
+        词项按得分上界从高到低处理，只遍历仍可能让新文档进入前k的词项的倒排表：
+        当某词项及所有上界更低的词项的上界之和不超过当前第k名分数时，
+        尚未见过的文档不可能进入前k，后续倒排表不再遍历。
+        每个文档按上界从高到低累加各词项得分，剩余上界不足以超过第k名时提前放弃。
+        结果与对整个候选集打分后取前k个一致（同分按文档ID降序）。
+        
+        Args:
+            trace: 传入列表时记录候选数和实际打分的文档数
+        
+        Returns:
+            [(文档ID, 分数), ...]，按分数降序
+        """
+        if k <= 0 or not candidates:
+            return []
+        
+        index = self.index
+        with index.lock:
+            documents = index.documents
+            avg_lengths = self._avg_lengths()
+            
+            scored_terms = []
+            for term in dict.fromkeys(terms):
+                doc_postings = index.term_postings(term)
+                if doc_postings:
+                    scored_terms.append((
+                        self.upper_bound(term, avg_lengths), self.idf(term), doc_postings
+                    ))
+            scored_terms.sort(key=lambda item: item[0], reverse=True)
+            
+            # remaining[i]: 第i个及之后所有词项的上界之和
+            remaining = [0.0] * (len(scored_terms) + 1)
+            for i in range(len(scored_terms) - 1, -1, -1):
+                remaining[i] = remaining[i + 1] + scored_terms[i][0]
+            
+            heap = []
+            visited = set()
+            scored = 0
+            for i, (_, _, doc_postings) in enumerate(scored_terms):
+                if len(heap) == k and remaining[i] < heap[0][0]:
+                    break
+                # 当前倒排表按文档ID升序遍历，其余词项用游标单调前进探测
+                cursors = [None] * i + [
+                    term_postings.cursor() for _, _, term_postings in scored_terms[i:]
+                ]
+                for doc_id, current_freqs in doc_postings.items():
+                    if doc_id in visited or doc_id not in candidates:
+                        continue
+                    visited.add(doc_id)
+                    scored += 1
+                    
+                    # 上界更高的词项已经处理过：文档若包含它们，早已被访问
+                    lengths = documents[doc_id].lengths
+                    score = 0.0
+                    for j in range(i, len(scored_terms)):
+                        if len(heap) == k and score + remaining[j] < heap[0][0]:
+                            score = None
+                            break
+                        idf = scored_terms[j][1]
+                        freqs = current_freqs if j == i else cursors[j].advance(doc_id)
+                        if freqs:
+                            tf = self._pseudo_tf(freqs, lengths, avg_lengths)
+                            score += idf * tf / (self.k1 + tf)
+                    if score is None:
+                        continue
+                    
+                    item = (score, doc_id)
+                    if len(heap) < k:
+                        heapq.heappush(heap, item)
+                    elif item > heap[0]:
+                        heapq.heapreplace(heap, item)
+            
+            # 得分为正的文档不足k个时，用只经过滤条件命中的候选（0分）补足
+            if len(heap) < k:
+                rest = heapq.nlargest(
+                    k - len(heap), (doc_id for doc_id in candidates if doc_id not in visited)
+                )
+                heap.extend((0.0, doc_id) for doc_id in rest)
+        
+        with self.stats_lock:
+            self.stats['top_k_queries'] += 1
+            self.stats['candidates'] += len(candidates)
+            self.stats['documents_scored'] += scored
+        if trace is not None:
+            trace.append({'step': 'rank', 'strategy': 'maxscore', 'candidates': len(candidates), 'scored': scored})
+        
+        ranked = sorted(heap, reverse=True)
+        return [(doc_id, score) for score, doc_id in ranked]
@@ -0,0 +1,629 @@
+"""
+索引段文件
+倒排索引持久化为不可变的段文件，启动时以只读 mmap 映射：倒排块和位置信息留在页缓存中，
+多个工作进程映射同一批文件时共享同一份物理内存，也不再从数据库全量重建。
+持有目录独占文件锁的进程是唯一的写入者，负责落盘、合并和改写清单；其他进程只读映射清单中的段，
+清单变化时重新载入。段不可变，删除标记按段记在清单中，载入段时一并恢复。
+新写入进入内存中的可写段，定期（或积累到一定文档数时）落盘为新段；
+段按存活文档数分层，连续的同层段达到合并因子时由后台线程合并，合并时丢弃已删除的文档。
+
+段文件格式（小端）：
+    数据区 | JSON尾部 | 尾部偏移(8字节) + 魔数(8字节)
+数据区中每个词项依次存放压缩块、跳表、位置信息和位置信息的跳表，均按8字节对齐；
+之后是词典（按UTF-8字节序排列的词项串、词项偏移表、各部分偏移表）以及整段和段内各分类的
+布隆过滤器。尾部为这些区域的位置和文档元数据。
+词典留在映射中、按二分查找，不载入进程内存；查找前先查布隆过滤器，段中没有的词项不触及词典。
+清单 manifest.json 记录当前有效的段（按写入先后）和各段的删除标记，原子替换
+"""
+import bisect
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+
+from app.services.search.bloom import BloomFilter, term_hashes
+from app.services.search.postings import BLOCK_SIZE, PostingList, encode_varint, decode_varint
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 下没有 fcntl，只在进程内加锁
+    fcntl = None
+
+SEGMENT_MAGIC = b'KMSEG002'
+SEGMENT_SUFFIX = '.seg'
+MANIFEST_NAME = 'manifest.json'
+LOCK_NAME = 'index.lock'
+_TRAILER = struct.Struct('<Q8s')
+
+# 存活文档少于该比例的段单独重写，回收已删除文档占用的空间
+EXPUNGE_RATIO = 0.5
+
+# 词典中每个词项的字段：压缩块偏移、元素类型、元素数、跳表偏移、块数、最大文档ID、倒排项数、
+# 位置信息偏移、长度、位置跳表偏移、位置块数
+_ENTRY_WIDTH = 11
+_TYPECODES = 'BHIq'
+
+def _pad(handle):
+    """把文件位置补齐到8字节，返回补齐后的偏移"""
+    offset = handle.tell()
+    if offset % 8:
+        handle.write(b'\0' * (8 - offset % 8))
+        offset = handle.tell()
+    return offset
+
+def _write_array(handle, values):
+    offset = _pad(handle)
+    handle.write(values.tobytes())
+    return offset
+
+def _write_bloom(handle, hash_list):
+    """按词项数确定大小写入布隆过滤器，返回 [偏移, 位数, 探测次数]"""
+    bloom = BloomFilter.create(len(hash_list))
+    for hashes in hash_list:
+        bloom.add(None, hashes)
+    offset = _pad(handle)
+    handle.write(bloom.bits)
+    return [offset, bloom.size, bloom.hashes]
+
+def write_segment(path, fields, documents, tag_labels, terms):
+    """写入段文件（先写临时文件再改名，读者不会看到写了一半的段）
+    
+    Args:
+        fields: 每个倒排项的字段数
+        documents: [(文档ID, DocumentEntry), ...]
+        tag_labels: 段内标签的原始写法 {规范化标签: 原始写法}
+        terms: 按词项排序的 (词项, 升序的(文档ID, 词频元组), 升序的(文档ID, 位置编码)) 序列
+    """
+    doc_categories = {doc_id: entry.category_id for doc_id, entry in documents}
+    term_blob = bytearray()
+    term_offsets = array('q', [0])
+    entries = array('q')
+    term_hash_list = []
+    # 分类 -> 该分类文档包含的词项的哈希（各分类过滤器按自己的词项数确定大小）
+    category_hashes = {}
+    # 在标题或标签中出现过的词项（载入时用于建立拼音映射，无需重新分词）
+    title_terms = []
+    postings_count = 0
+    
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as handle:
+        for term, items, positions in terms:
+            items = list(items)
+            postings = PostingList(fields, items)
+            if not postings:
+                continue
+            hashes = term_hashes(term)
+            term_hash_list.append(hashes)
+            for category_id in {doc_categories.get(doc_id) for doc_id, _ in items}:
+                category_hashes.setdefault(category_id, []).append(hashes)
+            if any(freqs[0] or freqs[1] for _, freqs in items):
+                title_terms.append(term)
+            postings_count += len(postings)
+            
+            data_offset = _write_array(handle, postings.data)
+            skip_offset = _write_array(handle, postings.skip)
+            
+            # 位置信息：每项为 文档ID差值 + 长度 + 编码后的位置；每块第一项的差值相对0，
+            # 跳表记录每块第一个文档ID和该项的偏移，单个文档的位置只需解码一块
+            blob = bytearray()
+            position_skip = array('q')
+            previous = 0
+            for count, (doc_id, data) in enumerate(positions):
+                if count % BLOCK_SIZE == 0:
+                    position_skip.extend((doc_id, len(blob)))
+                    previous = 0
+                encode_varint(doc_id - previous, blob)
+                encode_varint(len(data), blob)
+                blob += data
+                previous = doc_id
+            positions_offset = handle.tell()
+            handle.write(blob)
+            position_skip_offset = _write_array(handle, position_skip)
+            
+            term_blob += term.encode('utf-8')
+            term_offsets.append(len(term_blob))
+            entries.extend((
+                data_offset, _TYPECODES.index(postings.data.typecode), len(postings.data),
+                skip_offset, len(postings.skip), postings.last, len(postings),
+                positions_offset, len(blob), position_skip_offset, len(position_skip) // 2
+            ))
+        
+        terms_offset = _pad(handle)
+        handle.write(term_blob)
+        footer = {
+            'fields': fields,
+            'created_at': time.time(),
+            'postings': postings_count,
+            'dictionary': {
+                'count': len(term_offsets) - 1,
+                'terms': terms_offset,
+                'offsets': _write_array(handle, term_offsets),
+                'entries': _write_array(handle, entries)
+            },
+            'bloom': _write_bloom(handle, term_hash_list),
+            'category_blooms': [
+                [category_id] + _write_bloom(handle, hash_list)
+                for category_id, hash_list in category_hashes.items()
+            ],
+            'documents': [
+                [doc_id, list(entry.lengths), entry.created_at, entry.updated_at, entry.title,
+                 entry.category_id, list(entry.tags), entry.file_type]
+                for doc_id, entry in documents
+            ],
+            'tag_labels': tag_labels,
+            'title_terms': title_terms
+        }
+        footer_offset = handle.tell()
+        handle.write(json.dumps(footer, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        handle.write(_TRAILER.pack(footer_offset, SEGMENT_MAGIC))
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temp_path, path)
+
+class Segment:
+    """只读映射的段
+    
+    词典、倒排块、位置信息和布隆过滤器都在映射中，进程内只保存文档ID集合和少量缓存。
+    rows: 文档元数据，title_terms: 标题或标签中出现过的词项，二者载入索引后置为None
+    deleted: 段内已删除（或已被新版本覆盖）的文档，写入者维护时记入清单，载入段时从清单恢复
+    stats: 布隆过滤器拒绝的查找数、查词典的次数，以及其中词项实际不存在（误判）的次数
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(path, 'rb') as handle:
+            self.mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        size = len(self.mmap)
+        if size < _TRAILER.size:
+            raise ValueError(f'段文件不完整: {self.name}')
+        footer_offset, magic = _TRAILER.unpack_from(self.mmap, size - _TRAILER.size)
+        if magic != SEGMENT_MAGIC:
+            raise ValueError(f'不是索引段文件（或格式版本不同）: {self.name}')
+        
+        footer = json.loads(self.mmap[footer_offset:size - _TRAILER.size].decode('utf-8'))
+        self.buffer = memoryview(self.mmap)
+        self.fields = footer['fields']
+        self.postings_count = footer['postings']
+        dictionary = footer['dictionary']
+        self.term_count = dictionary['count']
+        self.terms_offset = dictionary['terms']
+        self.term_offsets = self._view(dictionary['offsets'], 'q', self.term_count + 1)
+        self.entries = self._view(dictionary['entries'], 'q', self.term_count * _ENTRY_WIDTH)
+        self.bloom = self._bloom(*footer['bloom'])
+        self.category_blooms = {
+            category_id: self._bloom(*bloom) for category_id, *bloom in footer['category_blooms']
+        }
+        self.rows = footer['documents']
+        self.tag_labels = footer['tag_labels']
+        self.title_terms = footer.get('title_terms', [])
+        self.doc_ids = {row[0] for row in self.rows}
+        self.doc_count = len(self.doc_ids)
+        self.deleted = set()
+        self.stats = {
+            'bloom_rejections': 0,
+            'dictionary_lookups': 0,
+            'false_positives': 0
+        }
+        self._postings = {}
+        self._live_sizes = {}
+    
+    def __repr__(self):
+        return f'<Segment {self.name} docs={self.doc_count} deleted={len(self.deleted)}>'
+    
+    def _view(self, offset, typecode, count):
+        itemsize = array(typecode).itemsize
+        return self.buffer[offset:offset + count * itemsize].cast(typecode)
+    
+    def _bloom(self, offset, size, hashes):
+        return BloomFilter(self._view(offset, 'B', size // 8), size, hashes)
+    
+    def _term(self, index):
+        start = self.terms_offset
+        return self.mmap[start + self.term_offsets[index]:start + self.term_offsets[index + 1]]
+    
+    def iter_terms(self):
+        """按字节序遍历段中的全部词项"""
+        for index in range(self.term_count):
+            yield self._term(index).decode('utf-8')
+    
+    def might_contain(self, term, hashes=None):
+        """布隆过滤器判断：False 表示段中一定没有该词项"""
+        return self.bloom.might_contain(term, hashes)
+    
+    def category_might_contain(self, category_id, term, hashes=None):
+        """该分类在段中的文档是否可能包含词项（段中没有该分类的文档时为False）"""
+        bloom = self.category_blooms.get(category_id)
+        return bloom is not None and bloom.might_contain(term, hashes)
+    
+    def lookup(self, term, hashes=None):
+        """词典条目（_ENTRY_WIDTH 个整数），不存在时返回None
+        
+        先查布隆过滤器，可能存在时才在映射中的词典上二分查找
+        """
+        if not self.bloom.might_contain(term, hashes):
+            self.stats['bloom_rejections'] += 1
+            return None
+        self.stats['dictionary_lookups'] += 1
+        key = term.encode('utf-8')
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.term_count and self._term(low) == key:
+            return tuple(self.entries[low * _ENTRY_WIDTH:(low + 1) * _ENTRY_WIDTH])
+        self.stats['false_positives'] += 1
+        return None
+    
+    def __contains__(self, term):
+        return self.lookup(term) is not None
+    
+    def postings(self, term, hashes=None, cache=True):
+        """词项在段内的倒排表（不含删除标记），不存在时返回None
+        
+        Args:
+            cache: 是否缓存倒排表对象（合并时逐个遍历全部词项，不缓存）
+        """
+        postings = self._postings.get(term)
+        if postings is None:
+            entry = self.lookup(term, hashes)
+            if entry is None:
+                return None
+            data_offset, typecode, data_count, skip_offset, skip_count, last, size = entry[:7]
+            postings = PostingList.from_buffers(
+                self.fields,
+                self._view(data_offset, _TYPECODES[typecode], data_count),
+                self._view(skip_offset, 'q', skip_count),
+                last, size
+            )
+            if cache:
+                self._postings[term] = postings
+        return postings
+    
+    def live_size(self, term, postings):
+        """扣除删除标记后的倒排项数（按词项缓存，删除文档时清空）"""
+        if not self.deleted:
+            return len(postings)
+        size = self._live_sizes.get(term)
+        if size is None:
+            size = self._live_sizes[term] = len(postings) - len(postings.intersect(self.deleted))
+        return size
+    
+    def delete(self, doc_id):
+        self.deleted.add(doc_id)
+        self._live_sizes.clear()
+    
+    def live_count(self):
+        return self.doc_count - len(self.deleted)
+    
+    def _position_entries(self, entry, start=0):
+        """从位置信息的第start块开始，依次产生 (文档ID, 位置编码的偏移, 长度)"""
+        positions_offset, positions_length, skip_offset, skip_count = entry[7:11]
+        skip = self._view(skip_offset, 'q', skip_count * 2)
+        data = self.buffer[positions_offset:positions_offset + positions_length]
+        for block in range(start, skip_count):
+            pos = skip[block * 2 + 1]
+            end = skip[block * 2 + 3] if block + 1 < skip_count else positions_length
+            doc_id = 0
+            while pos < end:
+                delta, pos = decode_varint(data, pos)
+                length, pos = decode_varint(data, pos)
+                doc_id += delta
+                yield doc_id, positions_offset + pos, length
+                pos += length
+    
+    def positions(self, term, deleted=None, hashes=None):
+        """词项在段内各存活文档的位置编码 {文档ID: 字节串}
+        
+        Args:
+            deleted: 按给定的删除集合过滤（默认为当前的删除标记）
+        """
+        entry = self.lookup(term, hashes)
+        if entry is None:
+            return {}
+        if deleted is None:
+            deleted = self.deleted
+        return {
+            doc_id: bytes(self.buffer[offset:offset + length])
+            for doc_id, offset, length in self._position_entries(entry)
+            if doc_id not in deleted
+        }
+    
+    def positions_for(self, term, doc_id):
+        """单个文档的位置编码：通过跳表只解码一块"""
+        if doc_id in self.deleted:
+            return None
+        entry = self.lookup(term)
+        if entry is None:
+            return None
+        skip = self._view(entry[9], 'q', entry[10] * 2)
+        block = bisect.bisect_right(skip[::2], doc_id) - 1
+        if block < 0:
+            return None
+        for current, offset, length in self._position_entries(entry, block):
+            if current == doc_id:
+                return bytes(self.buffer[offset:offset + length])
+            if current > doc_id:
+                break
+        return None
+    
+    def size_bytes(self):
+        return len(self.mmap)
+
+def merge_candidates(segments, merge_factor):
+    """对数分层合并策略
+    
+    段按存活文档数分层（第 floor(log_factor(存活数)) 层），在按写入顺序排列的段中
+    找连续 merge_factor 个同层的段合并——只合并相邻的段，清单中的先后顺序仍表示新旧；
+    存活比例过低的段单独重写。
+    
+    Returns:
+        待合并的段列表，无需合并时返回空列表
+    """
+    for segment in segments:
+        if segment.doc_count and segment.live_count() < segment.doc_count * EXPUNGE_RATIO:
+            return [segment]
+    
+    tiers = [int(math.log(max(segment.live_count(), 1), merge_factor)) for segment in segments]
+    start = 0
+    for i in range(1, len(segments) + 1):
+        if i == len(segments) or tiers[i] != tiers[start]:
+            if i - start >= merge_factor:
+                return segments[start:start + merge_factor]
+            start = i
+    return []
+
+class SegmentStoreReadOnly(RuntimeError):
+    """段目录的写入者是另一个 SegmentStore（通常在另一个进程中），本实例不能改写目录"""
+
+class SegmentStore:
+    """段目录：段文件和清单
+    
+    创建时对目录锁文件尝试加非阻塞的独占 fcntl 锁：得到锁的实例是写入者（writable），
+    锁一直持有到 close()，只有写入者落盘、合并、改写清单和清理残留文件；
+    其他实例只读，修改操作抛出 SegmentStoreReadOnly，写入者退出后可由 acquire() 接替。
+    进程内的写入、合并和维护线程之间用线程锁互斥。
+    Windows 下没有 fcntl，每个实例都是写入者，需由部署保证只有一个进程使用该目录
+    """
+    
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.writable = False
+        # 最近一次 open_segments 时清单文件的状态，用于判断清单是否变化
+        self.loaded = None
+        os.makedirs(directory, exist_ok=True)
+        self._owner = open(os.path.join(directory, LOCK_NAME), 'a+')
+        self.acquire()
+    
+    def acquire(self):
+        """尝试成为目录的写入者，返回本实例是否为写入者"""
+        with self.lock:
+            if self.writable or self._owner.closed:
+                return self.writable
+            if fcntl is not None:
+                try:
+                    fcntl.flock(self._owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+            self.writable = True
+            return True
+    
+    def close(self):
+        """释放目录锁（已映射的段仍可继续读取）"""
+        with self.lock:
+            self.writable = False
+            if not self._owner.closed:
+                self._owner.close()
+    
+    @contextmanager
+    def _locked(self, write=True):
+        with self.lock:
+            if self._owner.closed:
+                raise RuntimeError(f'索引段目录已关闭: {self.directory}')
+            if write and not self.writable:
+                raise SegmentStoreReadOnly(f'索引段目录由其他进程写入: {self.directory}')
+            yield
+    
+    def _signature(self):
+        try:
+            stat = os.stat(os.path.join(self.directory, MANIFEST_NAME))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+    
+    def changed(self):
+        """清单在最近一次 open_segments 之后是否被改写过"""
+        return self._signature() != self.loaded
+    
+    def _read_manifest(self):
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return {'generation': 0, 'segments': [], 'deletes': {}}
+        with open(path, encoding='utf-8') as handle:
+            return json.load(handle)
+    
+    def _write_manifest(self, manifest):
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        with open(path + '.tmp', 'w', encoding='utf-8') as handle:
+            json.dump(manifest, handle)
+        os.replace(path + '.tmp', path)
+    
+    def open_segments(self):
+        """映射清单中的全部段（按写入先后）并恢复各段的删除标记
+        
+        写入者同时清理不在清单中的残留文件；只读实例不改动目录
+        """
+        with self._locked(write=False):
+            # 先记录清单状态再读取：读取之后的改写一定会被 changed() 发现
+            self.loaded = self._signature()
+            manifest = self._read_manifest()
+            names = manifest['segments']
+            deletes = manifest.get('deletes', {})
+            segments = []
+            for name in names:
+                try:
+                    segment = Segment(os.path.join(self.directory, name))
+                except (OSError, ValueError) as e:
+                    # 缺失的段中的文档由 catch_up 从数据库补回
+                    print(f"索引段加载失败，已跳过 {name}: {e}")
+                    continue
+                segment.deleted = set(deletes.get(name, ()))
+                segments.append(segment)
+            
+            if self.writable:
+                for filename in os.listdir(self.directory):
+                    if filename.endswith((SEGMENT_SUFFIX, SEGMENT_SUFFIX + '.tmp')) and filename not in names:
+                        self._unlink(filename)
+            return segments
+    
+    def write(self, fields, documents, tag_labels, terms, replaces=()):
+        """写入新段并登记到清单
+        
+        Args:
+            replaces: 被这个段合并掉的段；它们已不全在清单中（已被合并或移除）时放弃本次写入
+        
+        Returns:
+            映射好的新段，放弃时返回None
+        """
+        with self._locked():
+            manifest = self._read_manifest()
+            names = manifest['segments']
+            replaced = [segment.name for segment in replaces]
+            if any(name not in names for name in replaced):
+                return None
+            
+            manifest['generation'] += 1
+            name = f"{manifest['generation']:010d}{SEGMENT_SUFFIX}"
+            path = os.path.join(self.directory, name)
+            write_segment(path, fields, documents, tag_labels, terms)
+            
+            if replaced:
+                # 合并后的段放在被合并的第一个段的位置，保持新旧顺序
+                position = names.index(replaced[0])
+                names = [n for n in names if n not in replaced]
+                names.insert(position, name)
+            else:
+                names.append(name)
+            manifest['segments'] = names
+            manifest['deletes'] = self._live_deletes(manifest)
+            self._write_manifest(manifest)
+            return Segment(path)
+    
+    def drop(self, segments):
+        """从清单中移除段（其中的文档都已删除），返回是否成功"""
+        with self._locked():
+            manifest = self._read_manifest()
+            names = [segment.name for segment in segments]
+            if any(name not in manifest['segments'] for name in names):
+                return False
+            manifest['segments'] = [name for name in manifest['segments'] if name not in names]
+            manifest['deletes'] = self._live_deletes(manifest)
+            self._write_manifest(manifest)
+            return True
+    
+    def save_deletes(self, deletes):
+        """把各段的删除标记 {段名: 文档ID集合} 记入清单，没有变化时不改写
+        
+        不在清单中的段（已被合并或移除）忽略
+        """
+        with self._locked():
+            manifest = self._read_manifest()
+            updated = {
+                name: sorted(deletes[name]) for name in manifest['segments'] if deletes.get(name)
+            }
+            if updated != manifest.get('deletes', {}):
+                manifest['deletes'] = updated
+                self._write_manifest(manifest)
+    
+    @staticmethod
+    def _live_deletes(manifest):
+        """只保留清单中仍然有效的段的删除标记"""
+        names = set(manifest['segments'])
+        return {name: ids for name, ids in manifest.get('deletes', {}).items() if name in names}
+    
+    def remove(self, segments):
+        """删除已被合并的段文件（仍在使用的映射不受影响）"""
+        with self._locked():
+            for segment in segments:
+                self._unlink(segment.name)
+    
+    def _unlink(self, filename):
+        try:
+            os.remove(os.path.join(self.directory, filename))
+        except OSError as e:
+            # Windows 下仍被映射的文件无法删除，留待下次启动清理
+            print(f"索引段文件删除失败 {filename}: {e}")
+    
+    def stats(self):
+        manifest = self._read_manifest()
+        return {
+            'directory': self.directory,
+            'writable': self.writable,
+            'generation': manifest['generation'],
+            'segments': len(manifest['segments']),
+            'deleted': sum(len(ids) for ids in manifest.get('deletes', {}).values())
+        }
+
+class SegmentMaintainer(threading.Thread):
+    """后台维护线程（只在写入者中运行）：定期把内存段落盘，按合并策略合并段，并把删除标记记入清单
+    
+    内存段达到 flush_docs 个文档时由 wakeup() 提前唤醒；
+    catch_up: 可选，每次落盘前调用，把其他进程提交的变更从数据库补进索引
+    """
+    
+    def __init__(self, index, store, interval=60, flush_docs=1000, merge_factor=4, catch_up=None):
+        super().__init__(name='search-segment-maintainer', daemon=True)
+        self.index = index
+        self.store = store
+        self.interval = interval
+        self.flush_docs = flush_docs
+        self.merge_factor = merge_factor
+        self.catch_up = catch_up
+        self.event = threading.Event()
+        self.stopped = False
+        self.stats = {
+            'flushes': 0,
+            'merges': 0,
+            'errors': 0
+        }
+    
+    def wakeup(self):
+        self.event.set()
+    
+    def stop(self):
+        self.stopped = True
+        self.event.set()
+    
+    def run(self):
+        while not self.stopped:
+            self.event.wait(self.interval)
+            self.event.clear()
+            if not self.stopped:
+                self.run_once()
+    
+    def run_once(self):
+        """与数据库对齐、落盘一次、把能合并的段合并完，最后记录删除标记"""
+        try:
+            if self.catch_up is not None:
+                self.catch_up()
+            if self.index.flush(self.store) is not None:
+                self.stats['flushes'] += 1
+            while True:
+                candidates = merge_candidates(self.index.segments, self.merge_factor)
+                if not candidates or not self.index.merge(candidates, self.store):
+                    break
+                self.stats['merges'] += 1
+            self.store.save_deletes(self.index.deleted_documents())
+        except Exception as e:
+            self.stats['errors'] += 1
+            print(f"索引段维护失败: {e}")
@@ -0,0 +1,217 @@
+"""
+搜索建议前缀树
+对文档标题、标题分词和标签建立字符前缀树，每个节点缓存子树内权重最高的候选，
+输入即搜的补全只需沿前缀走到对应节点，不再对数据库执行 LIKE 扫描。
+含汉字的候选同时以全拼和首字母插入（jiqixuexi / jqxx -> 机器学习）
+"""
+import heapq
+import threading
+import time
+
+from app.services.search.analyzer import iter_tokens, normalize_term
+from app.services.search.pinyin import pinyin_keys
+
+# 标题分词少于该长度的词不作为候选（如单字）
+MIN_TOKEN_LENGTH = 2
+# 拼音键与原候选键的分隔符：同音的不同候选各占一个节点，按拼音前缀仍能走到
+PINYIN_SEPARATOR = '\x00'
+# 只转写候选键的前几个字（拼音输入通常只输入开头几个字，长标题全文转写会使前缀树过深过大）
+PINYIN_ALIAS_CHARS = 8
+
+def _pinyin_aliases(key):
+    """候选键开头 PINYIN_ALIAS_CHARS 个字的拼音键（全拼、首字母），不含汉字时为空"""
+    keys = pinyin_keys(key[:PINYIN_ALIAS_CHARS])
+    if keys is None:
+        return ()
+    return tuple(f'{pinyin}{PINYIN_SEPARATOR}{key}' for pinyin in dict.fromkeys(keys))
+
+class _Node:
+    """前缀树节点
+    
+    weight > 0 表示该节点是一个候选的结尾；top 缓存子树内的最优候选，更新时沿路径置空
+    """
+    
+    __slots__ = ('children', 'phrase', 'weight', 'top')
+    
+    def __init__(self):
+        self.children = {}
+        self.phrase = None
+        self.weight = 0
+        self.top = None
+
+class SuggestionTrie:
+    """带热度权重的前缀补全索引
+    
+    候选权重 = 包含该候选的文档数 + 该候选作为搜索词被检索的次数，拼音键与原候选同权重
+    """
+    
+    def __init__(self, top_k=10):
+        self.top_k = top_k
+        self.lock = threading.RLock()
+        self.root = _Node()
+        self.doc_phrases = {}
+        self.doc_counts = {}
+        self.hits = {}
+        self.built_at = None
+    
+    def clear(self):
+        with self.lock:
+            self.root = _Node()
+            self.doc_phrases = {}
+            self.doc_counts = {}
+            self.hits = {}
+            self.built_at = None
+    
+    def build(self, documents):
+        """从文档集合全量构建
+        
+        Args:
+            documents: 可迭代对象，元素需要具有 id/title/tags 属性
+        """
+        with self.lock:
+            self.clear()
+            for doc in documents:
+                self._add(doc)
+            # 预先计算各节点的候选缓存，首次补全无需遍历子树
+            self._top(self.root)
+            self.built_at = time.time()
+    
+    def add_document(self, doc):
+        """新增或更新单个文档"""
+        with self.lock:
+            self._remove(doc.id)
+            self._add(doc)
+    
+    def remove_document(self, doc_id):
+        with self.lock:
+            return self._remove(doc_id)
+    
+    @staticmethod
+    def _phrases(doc):
+        """文档贡献的候选：归一化键 -> 展示文本"""
+        phrases = {}
+        title = (doc.title or '').strip()
+        if title:
+            phrases[normalize_term(title)] = title
+            for term, _, offset in iter_tokens(title, search_mode=False):
+                if len(term) >= MIN_TOKEN_LENGTH:
+                    phrases.setdefault(term, title[offset:offset + len(term)])
+        for tag in doc.tags or []:
+            tag = str(tag).strip()
+            if tag:
+                phrases.setdefault(normalize_term(tag), tag)
+        for key, phrase in list(phrases.items()):
+            for alias in _pinyin_aliases(key):
+                phrases[alias] = phrase
+        return phrases
+    
+    def _add(self, doc):
+        phrases = self._phrases(doc)
+        self.doc_phrases[doc.id] = tuple(phrases)
+        for key, phrase in phrases.items():
+            self.doc_counts[key] = self.doc_counts.get(key, 0) + 1
+            self._update(key, phrase)
+    
+    def _remove(self, doc_id):
+        keys = self.doc_phrases.pop(doc_id, None)
+        if keys is None:
+            return False
+        for key in keys:
+            count = self.doc_counts.get(key, 0) - 1
+            if count > 0:
+                self.doc_counts[key] = count
+            else:
+                self.doc_counts.pop(key, None)
+                self.hits.pop(key, None)
+            self._update(key)
+        return True
+    
+    def _update(self, key, phrase=None):
+        """重新计算候选权重，并使路径上各节点的缓存失效"""
+        weight = self.doc_counts.get(key, 0)
+        if weight:
+            weight += self.hits.get(key, 0)
+        
+        node = self.root
+        path = [node]
+        for char in key:
+            child = node.children.get(char)
+            if child is None:
+                if not weight:
+                    return
+                child = node.children[char] = _Node()
+            node = child
+            path.append(node)
+        
+        node.weight = weight
+        if weight and (phrase or node.phrase is None):
+            node.phrase = phrase or key
+        elif not weight:
+            node.phrase = None
+        
+        for node in path:
+            node.top = None
+        
+        # 删除不再有候选的叶子节点
+        for depth in range(len(key), 0, -1):
+            node = path[depth]
+            if node.weight or node.children:
+                break
+            del path[depth - 1].children[key[depth - 1]]
+    
+    def record_hit(self, query):
+        """记录一次搜索，已存在的候选热度加一"""
+        key = normalize_term(query)
+        with self.lock:
+            if key in self.doc_counts:
+                for hit_key in (key,) + _pinyin_aliases(key):
+                    if hit_key in self.doc_counts:
+                        self.hits[hit_key] = self.hits.get(hit_key, 0) + 1
+                        self._update(hit_key)
+    
+    def _top(self, node):
+        """子树内权重最高的top_k个候选：(权重, 展示文本)
+        
+        用显式栈后序遍历：长标题的键有几百层，递归会超过解释器的递归深度
+        """
+        stack = [(node, False)]
+        while stack:
+            current, expanded = stack.pop()
+            if current.top is not None:
+                continue
+            if not expanded:
+                # 子节点先出栈计算，再回到当前节点汇总
+                stack.append((current, True))
+                stack.extend((child, False) for child in current.children.values() if child.top is None)
+                continue
+            candidates = [(current.weight, current.phrase)] if current.weight else []
+            for child in current.children.values():
+                candidates.extend(child.top)
+            current.top = heapq.nlargest(
+                self.top_k, candidates, key=lambda item: (item[0], -len(item[1]))
+            )
+        return node.top
+    
+    def complete(self, prefix, limit=5):
+        """返回以prefix开头、按热度排序的候选（最多top_k个）"""
+        key = normalize_term(prefix)
+        if not key:
+            return []
+        
+        with self.lock:
+            node = self.root
+            for char in key:
+                node = node.children.get(char)
+                if node is None:
+                    return []
+            # 同一候选可能经全拼和首字母两条路径出现
+            phrases = dict.fromkeys(phrase for _, phrase in self._top(node))
+            return list(phrases)[:limit]
+    
+    def stats(self):
+        with self.lock:
+            return {
+                'documents': len(self.doc_phrases),
+                'phrases': len(self.doc_counts),
+                'built_at': self.built_at
+            }
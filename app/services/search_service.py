@@ -1,110 +1,264 @@
-from app.models import Document
-from app.utils.helpers import highlight_text, calculate_relevance, extract_search_keywords
-from flask_sqlalchemy import Pagination
-from sqlalchemy import or_, and_
+import math
+from flask import current_app
+from app import db
+from app.models import Document, Category
+from app.services.search import LikeBackend, InvertedIndexBackend, SuggestionTrie, create_backend, parse_query
+from app.services.count_cache import count_cache
+from app.utils.helpers import highlight_text, calculate_relevance, encode_cursor
 
 class SearchService:
     def __init__(self):
-        pass
+        self.backends = {}
+        self.suggester = SuggestionTrie()
     
-    def advanced_search(self, query, page=1, per_page=10, sort_by='relevance', search_mode='or'):
+    def get_backend(self, name=None):
+        """获取（必要时创建并初始化）搜索后端，默认使用配置 SEARCH_BACKEND"""
+        name = name or current_app.config.get('SEARCH_BACKEND', 'index')
+        backend = self.backends.get(name)
+        if backend is None:
+            backend = self.backends[name] = create_backend(name)
+        backend.ensure_initialized()
+        return backend
+    
+    def on_documents_changed(self, upserts, deleted_ids):
+        """索引同步回调：只把本次提交中变化的文档推送给已初始化的后端
+        
+        未初始化的后端会在首次使用时全量构建，无需接收增量
+        """
+        for backend in self.backends.values():
+            if not backend.initialized:
+                continue
+            for doc_id in deleted_ids:
+                backend.delete_document(doc_id)
+            for snapshot in upserts:
+                backend.index_document(snapshot)
+        
+        if self.suggester.built_at is not None:
+            for doc_id in deleted_ids:
+                self.suggester.remove_document(doc_id)
+            for snapshot in upserts:
+                self.suggester.add_document(snapshot)
+    
+    def parse(self, query, search_mode='or'):
+        """解析查询串，并把 category: 中的分类名称解析为分类ID
+        
+        Raises:
+            QuerySyntaxError: 查询语法错误
+        """
+        search_query = parse_query(query, search_mode)
+        if search_query.category is not None:
+            category = Category.query.filter_by(name=search_query.category).first()
+            # 分类不存在时使用不会命中任何文档的ID
+            search_query.category_id = category.id if category else -1
+        return search_query
+    
+    def advanced_search(self, query, page=1, per_page=10, sort_by='relevance', search_mode='or', explain=False, facets=False, fuzzy=True):
         """高级搜索功能
         
         Args:
             search_mode: 'or' - 任意关键词匹配, 'and' - 所有关键词匹配
+            query 中可以使用短语、邻近查询以及 title:/tag:/category:/after:/before: 和 -排除词，见 search.query
+            explain: 是否在 stats 中返回执行计划（仅倒排索引后端支持）
+            facets: 是否返回整个匹配集合按分类、标签、文件类型的分面计数
+            fuzzy: 是否把词表中不存在的关键词按拼音/首字母解析或做拼写容错（结果见 parsed.fuzzy，仅倒排索引后端支持）
         """
         if not query or not query.strip():
             return self._empty_search_result(page, per_page)
         
-        # 提取搜索关键词
-        keywords = extract_search_keywords(query)
-        
-        # 构建基础查询
-        base_query = Document.query
-        
-        # 多字段搜索条件
-        if keywords:
-            if search_mode == 'and':
-                # AND模式：必须包含所有关键词
-                search_conditions = []
-                for keyword in keywords:
-                    condition = (
-                        Document.title.contains(keyword) |
-                        Document.content.contains(keyword) |
-                        Document.tags.contains([keyword])
-                    )
-                    search_conditions.append(condition)
-                
-                if search_conditions:
-                    base_query = base_query.filter(and_(*search_conditions))
-            else:
-                # OR模式：包含任意关键词（默认）
-                or_conditions = []
-                for keyword in keywords:
-                    condition = (
-                        Document.title.contains(keyword) |
-                        Document.content.contains(keyword) |
-                        Document.tags.contains([keyword])
-                    )
-                    or_conditions.append(condition)
-                
-                if or_conditions:
-                    base_query = base_query.filter(or_(*or_conditions))
-        
-        # 获取总数
-        total = base_query.count()
-        
-        # 排序处理
-        if sort_by == 'relevance':
-            # 按相关度排序（暂时按创建时间，后续可优化）
-            base_query = base_query.order_by(Document.created_at.desc())
-        elif sort_by == 'date_asc':
-            base_query = base_query.order_by(Document.created_at.asc())
-        elif sort_by == 'date_desc':
-            base_query = base_query.order_by(Document.created_at.desc())
-        elif sort_by == 'title':
-            base_query = base_query.order_by(Document.title.asc())
-        
-        # 分页
-        documents = base_query.paginate(
-            page=page, per_page=per_page, error_out=False
+        # 解析查询：提取关键词、短语、字段限定和过滤条件
+        search_query = self.parse(query, search_mode)
+        
+        # 搜索次数计入建议热度
+        if self.suggester.built_at is not None:
+            self.suggester.record_hit(query)
+        
+        try:
+            backend = self.get_backend()
+            if fuzzy:
+                backend.expand(search_query)
+            documents, total, scores = backend.query(search_query, page, per_page, sort_by, count=False)
+            approximate = False
+            if total is None:
+                total, approximate = self._resolve_total(backend, search_query, page, per_page, documents)
+        except Exception as e:
+            print(f"搜索后端检索失败，降级为LIKE查询: {e}")
+            db.session.rollback()
+            backend = self.get_backend(LikeBackend.name)
+            documents, total, scores = backend.query(search_query, page, per_page, sort_by, count=False)
+            total, approximate = self._resolve_total(backend, search_query, page, per_page, documents)
+        
+        result = self._build_search_result(
+            query, search_query, documents, total, page, per_page, sort_by, scores, backend
         )
+        result['pagination']['approximate'] = approximate
+        result['stats']['backend'] = backend.name
+        if explain and hasattr(backend, 'explain'):
+            result['stats']['plan'] = backend.explain(search_query, page * per_page)
+        if facets:
+            result['facets'] = self.search_facets(backend, search_query)
+        return result
+    
+    def search_facets(self, backend, search_query, tag_limit=10):
+        """匹配集合的分面计数
+        
+        由倒排索引中各取值的文档集合与匹配集合求交得到，不执行 GROUP BY；
+        当前后端不支持时改用倒排索引后端计算
+        """
+        counts = backend.facets(search_query, tag_limit)
+        if counts is None:
+            counts = self.get_backend(InvertedIndexBackend.name).facets(search_query, tag_limit)
+        
+        category_ids = [category_id for category_id in counts['category'] if category_id is not None]
+        names = {}
+        if category_ids:
+            names = dict(
+                db.session.query(Category.id, Category.name).filter(Category.id.in_(category_ids)).all()
+            )
+        
+        def ordered(items):
+            return sorted(items, key=lambda item: (-item[1], str(item[0])))
+        
+        return {
+            'category': [
+                {'id': category_id, 'name': names.get(category_id, '未分类'), 'count': count}
+                for category_id, count in ordered(counts['category'].items())
+            ],
+            'tags': [{'tag': tag, 'count': count} for tag, count in counts['tags']],
+            'file_type': [
+                {'file_type': file_type, 'count': count}
+                for file_type, count in ordered(counts['file_type'].items())
+            ]
+        }
+    
+    def _resolve_total(self, backend, search_query, page, per_page, documents):
+        """确定匹配总数，返回 (总数, 是否近似)
+        
+        当前页未取满时总数可以直接推算；否则读取计数缓存，
+        未命中时由计数缓存决定精确计数还是估算
+        """
+        if len(documents) < per_page and (documents or page == 1):
+            total = (page - 1) * per_page + len(documents)
+            count_cache.set((backend.name, search_query.cache_key()), total)
+            return total, False
+        
+        return self._cached_count(backend, search_query)
+    
+    def search_by_cursor(self, query, after=None, per_page=10, sort_by='date_desc', search_mode='or', include_total=False, fuzzy=True):
+        """游标分页搜索：按 (created_at, id) 顺序翻页，无OFFSET，默认不计算总数
+        
+        Args:
+            after: 上一页游标解析出的 (created_at, id)，None表示第一页
+            include_total: 是否额外计算匹配总数
+        """
+        search_query = self.parse(query, search_mode)
+        
+        try:
+            backend = self.get_backend()
+            if fuzzy:
+                backend.expand(search_query)
+            documents, has_more = backend.query_after(search_query, after, per_page, sort_by)
+            total = self._cached_count(backend, search_query) if include_total else None
+        except Exception as e:
+            print(f"搜索后端游标检索失败，降级为LIKE查询: {e}")
+            db.session.rollback()
+            backend = self.get_backend(LikeBackend.name)
+            documents, has_more = backend.query_after(search_query, after, per_page, sort_by)
+            total = self._cached_count(backend, search_query) if include_total else None
+        
+        next_cursor = None
+        if has_more and documents:
+            last = documents[-1]
+            next_cursor = encode_cursor(last.created_at, last.id)
+        
+        pagination = {
+            'per_page': per_page,
+            'sort_by': sort_by,
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        }
+        if total is not None:
+            pagination['total'], pagination['approximate'] = total
+        
+        return {
+            'query': query,
+            'keywords': search_query.keywords,
+            'phrases': [phrase.to_dict() for phrase in search_query.phrases],
+            'parsed': search_query.to_dict(),
+            'results': self._process_documents(query, search_query, documents, sort_by, backend=backend),
+            'pagination': pagination,
+            'stats': {
+                'keywords_count': len(search_query.keywords),
+                'search_mode': search_mode,
+                'backend': backend.name
+            }
+        }
+    
+    def _cached_count(self, backend, search_query):
+        """经计数缓存的匹配总数，返回 (总数, 是否近似)"""
+        return count_cache.get_or_count(
+            (backend.name, search_query.cache_key()),
+            lambda: backend.count(search_query),
+            estimate=lambda: backend.estimate_count(search_query)
+        )
+    
+    def _process_documents(self, query, search_query, documents, sort_by, scores=None, backend=None):
+        """为结果文档添加高亮和相关度
+        
+        Args:
+            scores: 搜索后端给出的相关度分数，结果已全局有序；为None时向后端补取本页文档的分数，
+                    后端不支持时按页内相关度估算。同一后端下分数尺度不随分页和排序方式变化
+            backend: 能提供词项偏移的后端可以省去高亮时对正文的扫描
+        """
+        keywords = search_query.highlight_keywords
+        ranked = scores is not None
+        if not ranked and backend is not None and documents:
+            scores = backend.score(search_query, [doc.id for doc in documents])
         
-        # 处理搜索结果
         processed_docs = []
-        for doc in documents.items:
+        for doc in documents:
             doc_dict = doc.to_dict()
             
             # 计算相关度
-            relevance_score = calculate_relevance(
-                doc.title, doc.content, doc.tags, query, keywords
-            )
+            if scores is not None:
+                relevance_score = round(scores.get(doc.id, 0.0), 4)
+            else:
+                relevance_score = calculate_relevance(
+                    doc.title, doc.content, doc.tags, query, keywords
+                )
             
             # 添加高亮
+            offsets = backend.term_offsets(doc.id, keywords) if backend else None
             doc_dict['highlighted_title'] = highlight_text(doc.title, keywords)
-            doc_dict['highlighted_content'] = highlight_text(doc.content, keywords)
+            doc_dict['highlighted_content'] = highlight_text(doc.content, keywords, offsets=offsets)
             doc_dict['relevance_score'] = relevance_score
             
             processed_docs.append(doc_dict)
         
-        # 按相关度重新排序（如果适用）
-        if sort_by == 'relevance':
+        # 按相关度重新排序（仅降级路径需要，BM25结果已全局有序）
+        if sort_by == 'relevance' and not ranked:
             processed_docs.sort(key=lambda x: x['relevance_score'], reverse=True)
         
+        return processed_docs
+    
+    def _build_search_result(self, query, search_query, documents, total, page, per_page, sort_by, scores=None, backend=None):
+        """组装搜索结果：高亮、相关度和分页信息"""
         return {
             'query': query,
-            'keywords': keywords,
-            'results': processed_docs,
+            'keywords': search_query.keywords,
+            'phrases': [phrase.to_dict() for phrase in search_query.phrases],
+            'parsed': search_query.to_dict(),
+            'results': self._process_documents(query, search_query, documents, sort_by, scores, backend),
             'pagination': {
                 'page': page,
                 'per_page': per_page,
+                'sort_by': sort_by,
                 'total': total,
-                'pages': documents.pages
+                'pages': math.ceil(total / per_page) if per_page else 0
             },
             'stats': {
                 'total_matches': total,
-                'keywords_count': len(keywords),
-                'search_mode': search_mode
+                'keywords_count': len(search_query.keywords),
+                'search_mode': search_query.search_mode
             }
         }
     
@@ -132,12 +286,27 @@ class SearchService:
         if not query or len(query) < 2:
             return []
         
-        # 简单的标题匹配建议
-        suggestions = Document.query.filter(
-            Document.title.contains(query)
-        ).limit(limit).all()
-        
-        return [doc.title for doc in suggestions]
+        try:
+            return self.get_suggester().complete(query, limit)
+        except Exception as e:
+            print(f"前缀索引获取建议失败，降级为LIKE查询: {e}")
+            db.session.rollback()
+            return self.get_backend(LikeBackend.name).suggest(query, limit)
+    
+    def get_suggester(self):
+        """获取搜索建议前缀树，首次使用时从数据库构建"""
+        if self.suggester.built_at is None:
+            rows = db.session.query(Document.id, Document.title, Document.tags).yield_per(1000)
+            self.suggester.build(rows)
+            print(f"搜索建议索引构建完成: {self.suggester.stats()}")
+        return self.suggester
+    
+    def backend_stats(self):
+        """已加载的搜索后端状态"""
+        stats = {name: backend.stats() for name, backend in self.backends.items()}
+        stats['count_cache'] = count_cache.get_stats()
+        stats['suggester'] = self.suggester.stats()
+        return stats
 
 # 创建全局搜索服务实例
 search_service = SearchService()
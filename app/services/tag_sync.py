@@ -0,0 +1,135 @@
+"""
+标签同步模块
+文档的 tags JSON 列仍是接口返回的标签来源；flush之前把新增或修改了 tags 的文档
+同步到 tags / document_tags 表，使按标签过滤和标签统计可以走索引。
+所有写入路径（routes.py、routes_ai.py 等）经过同一个会话，无需逐个接口维护
+"""
+from sqlalchemy import event, inspect, insert
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import selectinload
+
+from app.models import Document, Tag
+
+class TagSync:
+    """Document.tags 到 document_tags 关联表的同步器"""
+    
+    def __init__(self):
+        self.installed = False
+        self.stats = {
+            'synced_documents': 0,
+            'created_tags': 0
+        }
+    
+    def install(self, session):
+        """在会话（或scoped_session）上挂载事件"""
+        if self.installed:
+            return
+        event.listen(session, 'before_flush', self._before_flush)
+        self.installed = True
+    
+    @staticmethod
+    def _tags_changed(document):
+        return inspect(document).attrs.tags.history.has_changes()
+    
+    @staticmethod
+    def tag_names(tags):
+        """去重后的标签：规范化形式 -> 原始写法（保持顺序）"""
+        names = {}
+        for tag in tags or []:
+            if tag is None or not str(tag).strip():
+                continue
+            names.setdefault(Tag.normalize(tag), str(tag).strip()[:100])
+        return names
+    
+    def _before_flush(self, session, flush_context, instances):
+        documents = [obj for obj in session.new if isinstance(obj, Document)]
+        documents.extend(
+            obj for obj in session.dirty if isinstance(obj, Document) and self._tags_changed(obj)
+        )
+        if documents:
+            self.sync(session, documents)
+    
+    @staticmethod
+    def _insert_ignoring_duplicates(session, rows):
+        """插入标签行，已存在（包括并发事务刚插入）的规范化标签跳过而不是违反唯一约束
+        
+        Returns:
+            实际插入的行数
+        """
+        dialect = session.get_bind().dialect.name
+        if dialect == 'sqlite':
+            statement = sqlite.insert(Tag).values(rows).on_conflict_do_nothing(index_elements=['normalized'])
+        elif dialect == 'mysql':
+            statement = mysql.insert(Tag).values(rows)
+            statement = statement.on_duplicate_key_update(normalized=statement.inserted.normalized)
+        else:
+            statement = insert(Tag).values(rows)
+        return max(session.execute(statement).rowcount, 0)
+    
+    def sync(self, session, documents):
+        """按 tags 列重建这些文档的标签关联，缺少的标签随之创建
+        
+        缺少的标签直接插入（忽略重复），再与已有标签一起查询：两个请求同时写入同一个新标签时，
+        后提交的一方复用先插入的行，不会因唯一约束导致整个flush失败
+        """
+        wanted = {}
+        for document in documents:
+            for normalized, name in self.tag_names(document.tags).items():
+                wanted.setdefault(normalized, name)
+        
+        with session.no_autoflush:
+            # 同一次flush中调用方自己新建的标签（尚未写入，查询不到）
+            existing = {obj.normalized: obj for obj in session.new if isinstance(obj, Tag)}
+            if wanted:
+                existing.update(
+                    (tag.normalized, tag)
+                    for tag in session.query(Tag).filter(Tag.normalized.in_(list(wanted)))
+                    if tag.normalized not in existing
+                )
+            
+            missing = [
+                {'name': name, 'normalized': normalized}
+                for normalized, name in wanted.items() if normalized not in existing
+            ]
+            if missing:
+                self.stats['created_tags'] += self._insert_ignoring_duplicates(session, missing)
+                existing.update(
+                    (tag.normalized, tag)
+                    for tag in session.query(Tag).filter(
+                        Tag.normalized.in_([row['normalized'] for row in missing])
+                    )
+                )
+            
+            for document in documents:
+                document.tag_items = [existing[normalized] for normalized in self.tag_names(document.tags)]
+                self.stats['synced_documents'] += 1
+    
+    def backfill(self, session, batch_size=500):
+        """为尚未同步的历史文档补建关联（迁移之外的兜底，如 db.create_all 建库）
+        
+        Returns:
+            补建关联的文档数
+        """
+        synced = 0
+        last_id = 0
+        while True:
+            documents = session.query(Document).options(selectinload(Document.tag_items)).filter(
+                Document.id > last_id
+            ).order_by(Document.id).limit(batch_size).all()
+            if not documents:
+                break
+            
+            stale = [
+                document for document in documents
+                if {tag.normalized for tag in document.tag_items} != set(self.tag_names(document.tags))
+            ]
+            # 提交后实例过期，先取出ID，避免再查询一次
+            last_id = documents[-1].id
+            if stale:
+                self.sync(session, stale)
+                synced += len(stale)
+            session.commit()
+        return synced
+
+# 创建全局同步器实例
+tag_sync = TagSync()
@@ -1,8 +1,17 @@
 import json
+import base64
 from datetime import datetime
+from functools import lru_cache
 from flask import jsonify
 import re
 
+# 没有索引提供的词项偏移时，最多在正文开头这么多字符内查找关键词
+HIGHLIGHT_SCAN_LIMIT = 65536
+# 选取摘要窗口时最多考虑的命中数
+HIGHLIGHT_MAX_MATCHES = 64
+# 摘要窗口中第一个命中之前保留的上下文字符数
+HIGHLIGHT_CONTEXT = 50
+
 def format_response(data=None, message="", status="success", code=200):
     """统一响应格式"""
     response = {
@@ -41,39 +50,98 @@ def validate_ids(ids):
     
     return True, ""
 
-def highlight_text(text, keywords, max_length=200):
-    """在文本中高亮显示关键词"""
-    if not text or not keywords:
-        return text[:max_length] + '...' if len(text) > max_length else text
+def encode_cursor(created_at, doc_id):
+    """生成不透明的分页游标（基于 created_at 和 id）"""
+    payload = json.dumps(
+        [created_at.isoformat() if created_at else None, doc_id],
+        separators=(',', ':')
+    )
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """解析分页游标，返回 (created_at, id)，格式错误时返回None"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, doc_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(doc_id)
+    except (ValueError, TypeError):
+        return None
+
+@lru_cache(maxsize=1024)
+def compile_keywords(keywords):
+    """编译关键词匹配模式（按查询缓存），长关键词优先匹配
+    
+    Args:
+        keywords: 关键词元组
+    """
+    ordered = sorted({kw for kw in keywords if kw}, key=len, reverse=True)
+    if not ordered:
+        return None
+    return re.compile('|'.join(re.escape(kw) for kw in ordered), re.IGNORECASE)
+
+def _best_window(matches, text_length, max_length):
+    """选择包含最多不同关键词（其次是最多命中）的摘要窗口，返回 (起点, 终点)
+    
+    Args:
+        matches: 按位置排序的 (起点, 终点, 关键词) 列表
+    """
+    best = None
+    best_score = (-1, -1)
+    right = 0
+    for left in range(len(matches)):
+        right = max(right, left)
+        while right + 1 < len(matches) and matches[right + 1][1] - matches[left][0] <= max_length:
+            right += 1
+        window = matches[left:right + 1]
+        score = (len({m[2] for m in window}), len(window))
+        if score > best_score:
+            best, best_score = (matches[left][0], window[-1][1]), score
+    
+    span_start, span_end = best
+    context = min(HIGHLIGHT_CONTEXT, max(0, (max_length - (span_end - span_start)) // 2))
+    start = max(0, min(span_start - context, text_length - max_length))
+    return start, min(text_length, start + max_length)
+
+def highlight_text(text, keywords, max_length=200, offsets=None):
+    """在文本中高亮显示关键词
     
-    # 转义关键词中的特殊字符
-    escaped_keywords = [re.escape(keyword) for keyword in keywords]
+    先确定摘要窗口，只对窗口内的文本做 <mark> 替换，避免对整篇正文执行正则替换。
     
-    # 创建高亮模式
-    pattern = '|'.join(escaped_keywords)
+    Args:
+        offsets: 可选，索引提供的命中位置 [(起点, 终点), ...]，提供时不再扫描正文
+    """
+    if not text:
+        return text
     
-    try:
-        # 高亮处理
-        highlighted = re.sub(
-            f'({pattern})', 
-            r'<mark>\1</mark>', 
-            text, 
-            flags=re.IGNORECASE
-        )
-        
-        # 截断处理
-        if len(highlighted) > max_length:
-            # 找到第一个高亮标签的位置
-            mark_pos = highlighted.find('<mark>')
-            if mark_pos != -1 and mark_pos > 50:
-                start = max(0, mark_pos - 50)
-                highlighted = '...' + highlighted[start:start + max_length] + '...'
-            else:
-                highlighted = highlighted[:max_length] + '...'
-        
-        return highlighted
-    except:
+    pattern = compile_keywords(tuple(keywords or ()))
+    if pattern is None:
         return text[:max_length] + '...' if len(text) > max_length else text
+    
+    start, end = 0, len(text)
+    if len(text) > max_length:
+        if offsets:
+            matches = [
+                (s, e, text[s:e].lower()) for s, e in sorted(offsets)[:HIGHLIGHT_MAX_MATCHES]
+            ]
+        else:
+            matches = []
+            for match in pattern.finditer(text, 0, HIGHLIGHT_SCAN_LIMIT):
+                matches.append((match.start(), match.end(), match.group(0).lower()))
+                if len(matches) >= HIGHLIGHT_MAX_MATCHES:
+                    break
+        
+        if matches:
+            start, end = _best_window(matches, len(text), max_length)
+        else:
+            end = max_length
+    
+    highlighted = pattern.sub(lambda m: f'<mark>{m.group(0)}</mark>', text[start:end])
+    
+    if start > 0:
+        highlighted = '...' + highlighted
+    if end < len(text):
+        highlighted += '...'
+    return highlighted
 
 def calculate_relevance(title, content, tags, query, keywords):
     """计算文档与查询的相关度分数"""
@@ -90,15 +158,14 @@ def calculate_relevance(title, content, tags, query, keywords):
     
     return score
 
-def extract_search_keywords(query):
-    """从搜索查询中提取关键词"""
-    if not query:
-        return []
-    
-    # 简单的关键词分割，可以后续用更智能的方法
-    keywords = query.strip().split()
+def extract_search_keywords(query, search_mode='or'):
+    """从搜索查询中提取关键词
     
-    # 过滤空关键词和短词
-    keywords = [kw for kw in keywords if len(kw) > 1]
+    使用jieba切分查询并去除停用词，OR模式下同时保留原始短语，
+    如“机器学习入门” -> ['机器学习入门', '机器学习', '入门']
+    """
+    if not query or not query.strip():
+        return []
     
-    return keywords
+    from app.services.search.analyzer import analyze_query
+    return list(analyze_query(query.strip(), search_mode))
@@ -20,6 +20,12 @@ def init_categories():
                 print(f"创建分类: {cat_data['name']}")
         
         db.session.commit()
+        
+        # 为已有文档补建标签关联（未通过迁移建表时）
+        from app.services.tag_sync import tag_sync
+        synced = tag_sync.backfill(db.session)
+        if synced:
+            print(f"补建标签关联: {synced} 个文档")
         print("初始化数据完成！")
 
 if __name__ == '__main__':
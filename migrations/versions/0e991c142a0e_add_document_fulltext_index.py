@@ -0,0 +1,35 @@
+"""Add ngram FULLTEXT index on documents
+
+Revision ID: 0e991c142a0e
+Revises: 09f1184620b8
+Create Date: 2026-10-18 10:12:41.208733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0e991c142a0e'
+down_revision = '09f1184620b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FULLTEXT + ngram 分词器仅 MySQL 支持，其他数据库跳过
+    if op.get_bind().dialect.name != 'mysql':
+        return
+
+    op.execute(
+        'ALTER TABLE documents '
+        'ADD FULLTEXT INDEX idx_document_fulltext (title, content) WITH PARSER ngram'
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'mysql':
+        return
+
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.drop_index('idx_document_fulltext')
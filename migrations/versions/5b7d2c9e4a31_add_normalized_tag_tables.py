@@ -0,0 +1,92 @@
+"""Add tags and document_tags tables
+
+Revision ID: 5b7d2c9e4a31
+Revises: 0e991c142a0e
+Create Date: 2026-10-18 15:40:12.517302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7d2c9e4a31'
+down_revision = '0e991c142a0e'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+
+def upgrade():
+    op.create_table('tags',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('normalized', sa.String(length=100), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('normalized')
+    )
+    op.create_table('document_tags',
+    sa.Column('document_id', sa.Integer(), nullable=False),
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['tag_id'], ['tags.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('document_id', 'tag_id')
+    )
+    with op.batch_alter_table('document_tags', schema=None) as batch_op:
+        batch_op.create_index('idx_document_tags_tag', ['tag_id'], unique=False)
+
+    _backfill()
+
+
+def _backfill():
+    """从 documents.tags JSON 列回填标签和关联（按主键分批读取）"""
+    bind = op.get_bind()
+    documents = sa.table('documents', sa.column('id', sa.Integer), sa.column('tags', sa.JSON))
+    tags = sa.Table(
+        'tags', sa.MetaData(),
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('name', sa.String(100)),
+        sa.Column('normalized', sa.String(100))
+    )
+    document_tags = sa.table('document_tags', sa.column('document_id', sa.Integer), sa.column('tag_id', sa.Integer))
+
+    tag_ids = {}
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(documents.c.id, documents.c.tags)
+            .where(documents.c.id > last_id)
+            .order_by(documents.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        links = []
+        for doc_id, doc_tags in rows:
+            seen = set()
+            for tag in doc_tags or []:
+                if tag is None or not str(tag).strip():
+                    continue
+                name = str(tag).strip()[:100]
+                normalized = name.lower()
+                if normalized in seen:
+                    continue
+                seen.add(normalized)
+                if normalized not in tag_ids:
+                    result = bind.execute(tags.insert().values(name=name, normalized=normalized))
+                    tag_ids[normalized] = result.inserted_primary_key[0]
+                links.append({'document_id': doc_id, 'tag_id': tag_ids[normalized]})
+
+        if links:
+            bind.execute(document_tags.insert(), links)
+        last_id = rows[-1][0]
+
+
+def downgrade():
+    with op.batch_alter_table('document_tags', schema=None) as batch_op:
+        batch_op.drop_index('idx_document_tags_tag')
+
+    op.drop_table('document_tags')
+    op.drop_table('tags')
@@ -0,0 +1,38 @@
+"""Add document_neighbors table
+
+Revision ID: 8c3e1f7a2b64
+Revises: 5b7d2c9e4a31
+Create Date: 2026-10-18 19:12:45.803117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c3e1f7a2b64'
+down_revision = '5b7d2c9e4a31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 表由 flask recommendations build-neighbors 填充，迁移时无需回填
+    op.create_table('document_neighbors',
+    sa.Column('document_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.Column('neighbor_id', sa.Integer(), nullable=False),
+    sa.Column('similarity', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['neighbor_id'], ['documents.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('document_id', 'rank')
+    )
+    with op.batch_alter_table('document_neighbors', schema=None) as batch_op:
+        batch_op.create_index('idx_document_neighbors_neighbor', ['neighbor_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('document_neighbors', schema=None) as batch_op:
+        batch_op.drop_index('idx_document_neighbors_neighbor')
+    
+    op.drop_table('document_neighbors')
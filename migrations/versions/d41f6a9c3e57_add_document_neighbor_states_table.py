@@ -0,0 +1,31 @@
+"""Add document_neighbor_states table
+
+Revision ID: d41f6a9c3e57
+Revises: 8c3e1f7a2b64
+Create Date: 2026-10-18 21:40:12.519204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41f6a9c3e57'
+down_revision = '8c3e1f7a2b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 由 flask recommendations build-neighbors 填充；没有状态的文档推荐时走实时计算
+    op.create_table('document_neighbor_states',
+    sa.Column('document_id', sa.Integer(), nullable=False),
+    sa.Column('document_updated_at', sa.DateTime(), nullable=True),
+    sa.Column('computed_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('document_id')
+    )
+
+
+def downgrade():
+    op.drop_table('document_neighbor_states')
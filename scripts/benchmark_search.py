@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+搜索后端压测脚本
+在同一份语料上对比各搜索后端的检索延迟，默认使用本地SQLite，无需MySQL
+
+用法:
+    DATABASE_URL=sqlite:////tmp/km_bench.db python scripts/benchmark_search.py --docs 20000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/km_bench.db')
+
+from app import create_app, db
+from app.models import Document
+from app.services.tag_sync import tag_sync
+
+VOCABULARY = [
+    'Python', 'Java', 'Redis', 'MySQL', 'Docker', 'Linux', 'Flask', 'Vue',
+    '机器学习', '深度学习', '数据库', '缓存', '索引', '算法', '架构', '微服务',
+    '项目', '会议', '计划', '总结', '学习', '笔记', '旅行', '健康', '性能', '优化'
+]
+
+QUERIES = [
+    ('Python', 'or'), ('机器学习 Python', 'or'), ('机器学习 Python', 'and'),
+    ('缓存 性能', 'and'), ('学习 项目', 'or'), ('不存在的关键词', 'or')
+]
+
+def seed_corpus(total, batch_size=1000):
+    """生成随机语料（已有足够文档时跳过）"""
+    existing = Document.query.count()
+    if existing >= total:
+        return existing
+    
+    rng = random.Random(42)
+    base = datetime(2025, 1, 1)
+    for start in range(existing, total, batch_size):
+        for i in range(start, min(start + batch_size, total)):
+            words = rng.choices(VOCABULARY, k=60)
+            db.session.add(Document(
+                title=''.join(rng.sample(VOCABULARY, 3)),
+                content='，'.join(words),
+                tags=rng.sample(VOCABULARY, 2),
+                created_at=base + timedelta(minutes=i)
+            ))
+        db.session.commit()
+    return total
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description='搜索后端压测')
+    parser.add_argument('--docs', type=int, default=5000, help='语料文档数')
+    parser.add_argument('--rounds', type=int, default=20, help='每个查询的重复次数')
+    parser.add_argument('--backends', default='like,index,sqlite_fts5', help='逗号分隔的后端名称')
+    args = parser.parse_args()
+    
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        tag_sync.backfill(db.session)
+        total = seed_corpus(args.docs)
+        print(f"语料文档数: {total}")
+        
+        from app.services.search_service import search_service
+        
+        for name in args.backends.split(','):
+            app.config['SEARCH_BACKEND'] = name
+            start = time.time()
+            search_service.get_backend(name)
+            print(f"\n[{name}] 初始化耗时: {time.time() - start:.3f}s")
+            
+            for query, mode in QUERIES:
+                samples = []
+                for _ in range(args.rounds):
+                    start = time.perf_counter()
+                    result = search_service.advanced_search(query, search_mode=mode)
+                    samples.append((time.perf_counter() - start) * 1000)
+                print(
+                    f"  {query!r:<24} {mode:<3} total={result['pagination']['total']:<7} "
+                    f"p50={percentile(samples, 50):.2f}ms p99={percentile(samples, 99):.2f}ms"
+                )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""
+测试公共夹具
+需要数据库的测试使用临时 SQLite 文件库上的最小应用（不初始化AI服务）
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from flask import Flask
+
+from app import db
+
+@pytest.fixture
+def app(tmp_path):
+    """临时 SQLite 库上的应用，已建表并挂载标签同步"""
+    from app.services.tag_sync import tag_sync
+    from app.services.count_cache import count_cache
+    
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}",
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        SEARCH_BACKEND='index'
+    )
+    db.init_app(app)
+    tag_sync.install(db.session)
+    
+    with app.app_context():
+        db.create_all()
+        # 计数缓存是全局实例，不能带着上一个测试库的总数
+        count_cache.invalidate()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+计数缓存测试
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+
+from app import db
+from app.models import Document
+from app.services.count_cache import CountCache
+from app.services.search import parse_query
+from app.services.search.backends import like_backend
+from app.services.search.backends.like_backend import LikeBackend
+
+def test_count_cached_until_documents_change():
+    """测试计数结果被缓存，文档变化后失效"""
+    cache = CountCache()
+    calls = []
+    
+    def count():
+        calls.append(1)
+        return 42
+    
+    key = ('like', parse_query('Python 学习').cache_key())
+    assert cache.get_or_count(key, count) == (42, False)
+    assert cache.get_or_count(key, count) == (42, False)
+    assert len(calls) == 1
+    
+    cache.on_documents_changed([], [1])
+    assert cache.get(key) is None
+    assert cache.get_or_count(key, count) == (42, False)
+    assert len(calls) == 2
+
+def test_cache_key_normalizes_order_and_case():
+    """测试关键词、标签顺序和大小写不影响缓存键，匹配模式、标签和分类过滤会区分缓存键"""
+    key = parse_query('tag:Python category:技术 Redis 缓存').cache_key()
+    assert parse_query('缓存 redis category:技术 tag:python').cache_key() == key
+    assert parse_query('Redis 缓存 tag:Java category:技术').cache_key() != key
+    assert parse_query('Redis 缓存 tag:Python category:生活').cache_key() != key
+    assert parse_query('Redis 缓存 category:技术').cache_key() != key
+    assert parse_query('Redis 缓存 tag:Python category:技术', search_mode='and').cache_key() != key
+
+def test_like_estimate_samples_whole_id_range(app, monkeypatch):
+    """测试LIKE估算在整个主键范围内抽样：命中文档都是旧文档时估算也不为0"""
+    for i in range(200):
+        title = f'Python笔记{i}' if i < 100 else f'旅行日记{i}'
+        db.session.add(Document(title=title, content='内容', created_at=datetime(2025, 1, 1)))
+    db.session.commit()
+    
+    monkeypatch.setattr(like_backend, 'ESTIMATE_SAMPLE_SIZE', 40)
+    monkeypatch.setattr(like_backend, 'ESTIMATE_WINDOWS', 4)
+    backend = LikeBackend()
+    search_query = parse_query('Python')
+    assert backend.count(search_query) == 100
+    assert 60 <= backend.estimate_count(search_query) <= 140
+    assert backend.estimate_count(parse_query('不存在的词')) == 0
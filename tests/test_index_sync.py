@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+索引同步测试
+提交后的新增、更新、删除推送到索引，回滚的变更不推送
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app import db
+from app.models import Document
+from app.services.index_sync import IndexSync
+from app.services.search.query import parse_query
+from app.services.search_service import SearchService
+
+class RecordingListener:
+    """记录每次推送的监听器"""
+    
+    def __init__(self):
+        self.calls = []
+    
+    def on_documents_changed(self, upserts, deleted_ids):
+        self.calls.append(({snapshot.id: snapshot.title for snapshot in upserts}, list(deleted_ids)))
+
+@pytest.fixture
+def session(app):
+    """测试库上的独立会话，不与 db.session 上已挂载的全局同步器共享事件"""
+    session = sessionmaker(bind=db.engine)()
+    yield session
+    session.close()
+
+@pytest.fixture
+def sync(session):
+    index_sync = IndexSync()
+    index_sync.install(session)
+    return index_sync
+
+def add_document(session, title, content=''):
+    document = Document(title=title, content=content, tags=[], created_at=datetime(2025, 1, 1))
+    session.add(document)
+    return document
+
+def found_titles(backend, query):
+    documents, _, _ = backend.query(parse_query(query))
+    return {doc.title for doc in documents}
+
+def test_committed_changes_reach_index(session, sync):
+    """测试提交的新增、更新、删除依次反映到倒排索引"""
+    add_document(session, '已有文档', 'Python入门')
+    session.commit()
+    
+    service = SearchService()
+    sync.register(service)
+    backend = service.get_backend('index')
+    assert found_titles(backend, 'Python') == {'已有文档'}
+    
+    document = add_document(session, 'Redis缓存设计', '缓存穿透')
+    session.commit()
+    assert found_titles(backend, '穿透') == {'Redis缓存设计'}
+    
+    document.content = '消息队列'
+    session.commit()
+    assert found_titles(backend, '穿透') == set()
+    assert found_titles(backend, '消息队列') == {'Redis缓存设计'}
+    
+    session.delete(document)
+    session.commit()
+    assert found_titles(backend, '消息队列') == set()
+    assert found_titles(backend, 'Python') == {'已有文档'}
+    assert sync.stats['commits'] == 4
+    assert sync.stats['listener_errors'] == 0
+
+def test_commit_pushes_only_changed_documents(session, sync):
+    """测试每次提交只推送本次变化的文档，未改动索引字段时不推送"""
+    listener = RecordingListener()
+    sync.register(listener)
+    
+    first = add_document(session, '第一篇')
+    second = add_document(session, '第二篇')
+    session.commit()
+    assert listener.calls == [({first.id: '第一篇', second.id: '第二篇'}, [])]
+    
+    first.title = '第一篇（修订）'
+    session.commit()
+    assert listener.calls[-1] == ({first.id: '第一篇（修订）'}, [])
+    
+    second.updated_at = datetime(2025, 3, 1)
+    session.commit()
+    assert len(listener.calls) == 2
+    
+    second_id = second.id
+    session.delete(second)
+    session.commit()
+    assert listener.calls[-1] == ({}, [second_id])
+
+def test_rollback_pushes_nothing(session, sync):
+    """测试回滚的事务（无论是否已flush）不推送任何变更"""
+    listener = RecordingListener()
+    sync.register(listener)
+    
+    add_document(session, '未flush即回滚')
+    session.rollback()
+    
+    add_document(session, 'flush后回滚')
+    session.flush()
+    session.rollback()
+    assert listener.calls == []
+    assert sync.stats['commits'] == 0
+
+def test_flushed_then_rolled_back_changes_do_not_leak(session, sync):
+    """测试flush后回滚的变更不会混入下一次提交"""
+    listener = RecordingListener()
+    sync.register(listener)
+    
+    kept = add_document(session, '保留')
+    session.commit()
+    listener.calls.clear()
+    
+    add_document(session, '被回滚的新文档')
+    kept.title = '被回滚的修改'
+    session.flush()
+    session.rollback()
+    
+    committed = add_document(session, '之后提交')
+    session.commit()
+    assert listener.calls == [({committed.id: '之后提交'}, [])]
+    assert session.get(Document, kept.id).title == '保留'
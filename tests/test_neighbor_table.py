@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+相似文档表测试
+命令行任务写表，是否可以查表只取决于数据库中的计算状态
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+
+from app import db
+from app.cli import recommendations_cli
+from app.models import Document, DocumentNeighbor, DocumentNeighborState
+from app.services.ai import neighbor_job
+from app.services.ai.neighbor_job import NeighborTable
+from app.services.ai.recommendation_service import RecommendationService
+
+DOCUMENTS = [
+    ('Python装饰器原理', 'Python装饰器的使用方法和闭包，Python函数'),
+    ('Python闭包详解', 'Python闭包与装饰器，函数作为返回值'),
+    ('Redis缓存设计', 'Redis适合做缓存，介绍缓存穿透和缓存雪崩'),
+    ('Redis集群', 'Redis主从复制、哨兵和集群，缓存高可用'),
+    ('机器学习入门', '监督学习和无监督学习的区别'),
+    ('深度学习框架', 'PyTorch和TensorFlow的机器学习实践，深度学习'),
+]
+
+def seed():
+    documents = [
+        Document(title=title, content=content, tags=[], created_at=datetime(2025, 1, day))
+        for day, (title, content) in enumerate(DOCUMENTS, start=1)
+    ]
+    db.session.add_all(documents)
+    db.session.commit()
+    return documents
+
+def make_service(k=2):
+    service = RecommendationService()
+    service.neighbors.k = k
+    return service
+
+def neighbor_ids(doc_id):
+    return [
+        row.neighbor_id for row in DocumentNeighbor.query.filter_by(document_id=doc_id).order_by(DocumentNeighbor.rank)
+    ]
+
+def test_build_marks_documents_current(app):
+    """测试全量计算后每个文档的邻居可用，最相似的文档排在第一位"""
+    documents = seed()
+    service = make_service()
+    assert not any(service.neighbors.is_current(doc.id) for doc in documents)
+    
+    assert service.update_neighbor_table(full=True) == len(documents)
+    assert all(service.neighbors.is_current(doc.id) for doc in documents)
+    assert service.neighbors.stale_documents() == set()
+    
+    python, closure, redis, cluster = (doc.id for doc in documents[:4])
+    assert neighbor_ids(python)[0] == closure
+    assert neighbor_ids(redis)[0] == cluster
+    assert DocumentNeighborState.query.count() == len(documents)
+
+def test_refresh_recomputes_changed_and_deleted_documents(app):
+    """测试修改和删除的文档在数据库中显示为待重算，刷新后恢复可用，删除的文档不再作为邻居"""
+    documents = seed()
+    service = make_service()
+    service.update_neighbor_table(full=True)
+    python, closure, redis, cluster = documents[:4]
+    
+    redis.content = 'Python装饰器和闭包的另一种写法'
+    db.session.commit()
+    # 另一个进程（新的实例）看到的状态相同
+    other = NeighborTable(k=2)
+    assert not other.is_current(redis.id)
+    assert other.is_current(python.id)
+    assert other.stale_documents() == {redis.id}
+    
+    cluster_id = cluster.id
+    db.session.delete(cluster)
+    db.session.commit()
+    assert other.stale_documents() == {redis.id, cluster_id}
+    
+    assert service.update_neighbor_table() >= 2
+    assert other.stale_documents() == set()
+    assert other.is_current(redis.id)
+    assert redis.id in neighbor_ids(python.id) + neighbor_ids(closure.id)
+    assert DocumentNeighbor.query.filter(
+        (DocumentNeighbor.document_id == cluster_id) | (DocumentNeighbor.neighbor_id == cluster_id)
+    ).count() == 0
+    assert db.session.get(DocumentNeighborState, cluster_id) is None
+    
+    assert service.update_neighbor_table() == 0
+
+def test_missing_tables_fall_back_to_live_recommendations(app):
+    """测试迁移之前（表不存在）查表判断为不可用，命令行任务报错退出"""
+    documents = seed()
+    DocumentNeighborState.__table__.drop(db.engine)
+    DocumentNeighbor.__table__.drop(db.engine)
+    
+    neighbors = NeighborTable()
+    assert not neighbors.tables_exist()
+    assert not neighbors.is_current(documents[0].id)
+    assert neighbors.get_stats()['available'] is False
+    
+    app.cli.add_command(recommendations_cli)
+    result = app.test_cli_runner().invoke(args=['recommendations', 'build-neighbors'])
+    assert result.exit_code != 0
+    assert 'flask db upgrade' in result.output
+
+def test_cli_builds_and_refreshes_table(app):
+    """测试命令行任务全量计算和刷新"""
+    documents = seed()
+    app.cli.add_command(recommendations_cli)
+    runner = app.test_cli_runner()
+    
+    result = runner.invoke(args=['recommendations', 'build-neighbors'])
+    assert result.exit_code == 0, result.output
+    assert f'重算 {len(documents)} 个文档' in result.output
+    assert DocumentNeighborState.query.count() == len(documents)
+    
+    result = runner.invoke(args=['recommendations', 'refresh-neighbors'])
+    assert result.exit_code == 0, result.output
+    assert '重算 0 个文档' in result.output
+
+def test_refresh_materializes_only_k_neighbors(app, monkeypatch):
+    """测试增量刷新只为重算的文档取k个邻居，被挤出的文档由每个文档一个最大相似度判断"""
+    documents = seed()
+    service = make_service()
+    service.update_neighbor_table(full=True)
+    
+    requested = []
+    maxima = []
+    original_neighbors = neighbor_job.nearest_neighbors
+    original_maximum = neighbor_job.max_similarity
+    
+    def recording_neighbors(queries, query_ids, matrix, doc_ids, k, *args, **kwargs):
+        requested.append(k)
+        return original_neighbors(queries, query_ids, matrix, doc_ids, k, *args, **kwargs)
+    
+    def recording_maximum(*args, **kwargs):
+        best = original_maximum(*args, **kwargs)
+        maxima.append(best)
+        return best
+    
+    monkeypatch.setattr(neighbor_job, 'nearest_neighbors', recording_neighbors)
+    monkeypatch.setattr(neighbor_job, 'max_similarity', recording_maximum)
+    
+    python, closure, redis = documents[:3]
+    redis.content = 'Python装饰器和闭包的另一种写法'
+    db.session.commit()
+    
+    assert service.update_neighbor_table() >= 1
+    assert requested and all(k == service.neighbors.k for k in requested)
+    assert len(maxima) == 1 and maxima[0].shape == (len(documents),)
+    assert redis.id in neighbor_ids(python.id) + neighbor_ids(closure.id)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+推荐向量索引测试
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+from types import SimpleNamespace
+
+from app.services.ai.recommendation_service import RecommendationService
+from app.services.ai.vector_index import document_text
+
+def make_snapshot(doc_id, title, content):
+    return SimpleNamespace(id=doc_id, title=title, content=content)
+
+def make_service(rows):
+    service = RecommendationService()
+    service.loader = lambda: list(rows)
+    service.initialized = True
+    assert service.refit(background=False)
+    return service
+
+ROWS = [
+    (1, 'Python装饰器原理 Python装饰器的使用方法和闭包'),
+    (2, '机器学习入门笔记 监督学习和无监督学习的区别'),
+    (3, 'Redis缓存设计 Redis适合做缓存，介绍缓存穿透和缓存雪崩'),
+    (4, '深度学习框架对比 PyTorch和TensorFlow的机器学习实践'),
+]
+
+def test_writes_update_vectors_without_refitting():
+    """测试少量写入只更新单个文档向量，词表保持不变"""
+    service = make_service(ROWS)
+    index = service.index
+    vocabulary = dict(index.vectorizer.vocabulary_)
+    
+    service.on_documents_changed([make_snapshot(5, 'Redis集群', 'Redis主从复制和缓存')], [1])
+    assert service.index is index
+    assert 5 in index and 1 not in index
+    assert index.vectorizer.vocabulary_ == vocabulary
+    assert index.search('Redis缓存', 1)[0][0] in (3, 5)
+
+def test_drift_triggers_background_refit_and_swap():
+    """测试词表外的新文档足够多时在后台重新拟合，并回放拟合期间的写入"""
+    rows = list(ROWS)
+    service = make_service(rows)
+    index = service.index
+    
+    words = ['Kubernetes', 'Helm', 'Ingress', 'Istio', 'Envoy']
+    snapshots = [
+        make_snapshot(100 + i, f'{words[i % 5]}部署实践', f'{words[i % 5]} 配置 第{i}篇') for i in range(25)
+    ]
+    rows.extend((s.id, document_text(s.title, s.content)) for s in snapshots)
+    
+    # 读取文档期间删除文档2：读到的行里仍有它，替换前回放删除
+    loader = service.loader
+    
+    def slow_loader():
+        loaded = loader()
+        service.on_documents_changed([], [2])
+        return loaded
+    service.loader = slow_loader
+    
+    service.on_documents_changed(snapshots, [])
+    deadline = time.time() + 30
+    while service.index is index and time.time() < deadline:
+        time.sleep(0.05)
+    
+    assert service.index is not index
+    assert 'istio' in service.index.vectorizer.vocabulary_
+    assert 2 not in service.index and 100 in service.index
+    assert service.refit_log is None
+    assert service.refit_count == 2
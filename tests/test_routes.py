@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+接口参数校验测试（临时 SQLite 库上注册主蓝图，不初始化AI服务）
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+
+import pytest
+
+from app import db
+from app.models import Document
+
+@pytest.fixture
+def client(app, monkeypatch):
+    from app.routes import main_bp
+    from app.services.search_service import search_service
+    # 全局搜索服务不能带着上一个测试库构建的索引
+    monkeypatch.setattr(search_service, 'backends', {})
+    app.register_blueprint(main_bp)
+    return app.test_client()
+
+def seed(count=5):
+    """count 篇文档，其中两篇创建时间相同（游标需按ID续页）"""
+    documents = [
+        Document(
+            title=f'Redis笔记{i}', content=f'Redis缓存第{i}篇', tags=[],
+            created_at=datetime(2025, 1, max(i, 2))
+        )
+        for i in range(1, count + 1)
+    ]
+    db.session.add_all(documents)
+    db.session.commit()
+    return sorted(documents, key=lambda doc: (doc.created_at, doc.id), reverse=True)
+
+def follow_cursor(client, url, key):
+    """从首页（cursor为空）开始依次翻页，返回每页的文档ID"""
+    pages = []
+    cursor = ''
+    while True:
+        response = client.get(f'{url}&cursor={cursor}')
+        assert response.status_code == 200, response.get_json()
+        data = response.get_json()
+        items = data[key] if key == 'documents' else data['results']
+        pages.append([item['id'] for item in items])
+        page_info = data if key == 'documents' else data['pagination']
+        if not page_info['has_more']:
+            assert page_info['next_cursor'] is None
+            return pages, data
+        cursor = page_info['next_cursor']
+
+def test_documents_cursor_pages(client):
+    """测试文档列表游标分页：首页、后续页不重复不遗漏，无效游标返回400"""
+    expected = [doc.id for doc in seed()]
+    pages, _ = follow_cursor(client, '/api/documents?per_page=2', 'documents')
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [doc_id for page in pages for doc_id in page] == expected
+    
+    assert client.get('/api/documents?cursor=not-a-cursor').status_code == 400
+
+def test_advanced_search_cursor_pages(client):
+    """测试高级搜索游标分页：未指定排序时按时间倒序并在响应中注明，无效游标和不支持的排序返回400"""
+    expected = [doc.id for doc in seed()]
+    pages, last = follow_cursor(client, '/api/search/advanced?q=Redis&per_page=2', 'results')
+    assert [doc_id for page in pages for doc_id in page] == expected
+    assert last['pagination']['sort_by'] == 'date_desc'
+    
+    pages, _ = follow_cursor(client, '/api/search/advanced?q=Redis&per_page=3&sort_by=date_asc', 'results')
+    assert [doc_id for page in pages for doc_id in page] == expected[::-1]
+    
+    assert client.get('/api/search/advanced?q=Redis&cursor=not-a-cursor').status_code == 400
+    for sort_by in ('relevance', 'title'):
+        response = client.get(f'/api/search/advanced?q=Redis&cursor=&sort_by={sort_by}')
+        assert response.status_code == 400
+        assert 'date_desc' in response.get_json()['error']
+    
+    # 不传游标时仍默认按相关度排序
+    response = client.get('/api/search/advanced?q=Redis')
+    assert response.status_code == 200
+    assert response.get_json()['pagination']['sort_by'] == 'relevance'
+
+@pytest.mark.parametrize('top_k', ['abc', None, 0, 101, 1.5, True])
+def test_semantic_search_rejects_invalid_top_k(client, top_k):
+    """测试语义搜索的 top_k 不是 1 到 100 之间的整数时返回400"""
+    response = client.post('/api/ai/search/semantic', json={'query': 'Python', 'top_k': top_k})
+    assert response.status_code == 400
+    assert 'top_k' in response.get_json()['error']
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+搜索后端测试（临时 SQLite 库）
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import importlib.util
+import io
+from datetime import datetime
+
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import inspect
+from sqlalchemy.dialects import mysql
+
+from app import db
+from app.models import Document
+from app.services.search.backends.mysql_fulltext import MySQLFulltextBackend
+from app.services.search.query import parse_query
+from app.services.search_service import SearchService
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations', 'versions')
+
+DOCUMENTS = [
+    ('Python装饰器原理', '今天学习了Python装饰器的使用方法', ['Python']),
+    ('机器学习入门笔记', '监督学习和无监督学习的区别，Python实现', ['机器学习']),
+    ('Redis缓存设计', 'Redis适合做缓存，介绍缓存穿透和Python客户端', ['Redis', '缓存']),
+    ('项目会议总结', '讨论了下一阶段的开发计划', ['会议']),
+]
+
+def seed(documents=DOCUMENTS):
+    for day, (title, content, tags) in enumerate(documents, start=1):
+        db.session.add(Document(title=title, content=content, tags=tags, created_at=datetime(2025, 1, day)))
+    db.session.commit()
+
+@pytest.mark.parametrize('backend_name', ['index', 'sqlite_fts5', 'like'])
+def test_relevance_scores_match_across_pagination(app, backend_name):
+    """测试同一查询在页码分页和游标分页下返回同一尺度的相关度分数"""
+    seed()
+    app.config['SEARCH_BACKEND'] = backend_name
+    service = SearchService()
+    
+    for query in ('Python', 'Redis缓存'):
+        offset = service.advanced_search(query, per_page=10, sort_by='relevance')
+        cursor = service.search_by_cursor(query, per_page=10)
+        assert offset['stats']['backend'] == cursor['stats']['backend'] == backend_name
+        
+        offset_scores = {doc['id']: doc['relevance_score'] for doc in offset['results']}
+        cursor_scores = {doc['id']: doc['relevance_score'] for doc in cursor['results']}
+        assert offset_scores and offset_scores == cursor_scores
+
+@pytest.mark.parametrize('backend_name', ['index', 'sqlite_fts5', 'like'])
+def test_field_scoped_exclusions(app, backend_name):
+    """测试 -title: 只排除标题命中的文档，-tag: 只排除带该标签的文档"""
+    from app.services.search.backends import create_backend
+    seed()
+    backend = create_backend(backend_name)
+    backend.ensure_initialized()
+    
+    search_query = parse_query('Python -title:Python -tag:缓存')
+    assert search_query.excluded == []
+    assert search_query.excluded_title == ['Python'] and search_query.excluded_tags == ['缓存']
+    
+    def found(text):
+        documents, _, _ = backend.query(parse_query(text))
+        return {doc.title for doc in documents}
+    
+    assert found('Python -title:Python') == {'机器学习入门笔记', 'Redis缓存设计'}
+    assert found('Python -tag:缓存') == {'Python装饰器原理', '机器学习入门笔记'}
+    assert found('Python -title:缓存') == {'Python装饰器原理', '机器学习入门笔记'}
+    assert found('Python -title:"Redis 设计"') == {'Python装饰器原理', '机器学习入门笔记'}
+    assert found('Python -学习') == {'Redis缓存设计'}
+
+def compile_mysql(conditions):
+    return [str(c.compile(dialect=mysql.dialect())) for c in conditions]
+
+def test_mysql_boolean_query_skips_short_keywords():
+    """测试布尔查询串只包含能走 ngram 索引的词"""
+    build = MySQLFulltextBackend.build_boolean_query
+    assert '"Redis缓存"' in build(parse_query('Redis缓存')).split()
+    assert '+"设计"' in build(parse_query('Redis缓存 设计', search_mode='and')).split()
+    assert build(parse_query('学')) == ''
+    mixed = build(parse_query('Redis缓存 学')).split()
+    assert '"Redis缓存"' in mixed and '"学"' not in mixed
+
+def test_mysql_short_keywords_fall_back_to_like():
+    """测试短于 ngram_token_size 的关键词使用 LIKE 条件"""
+    backend = MySQLFulltextBackend()
+    
+    conditions, relevance = backend.keyword_conditions(parse_query('学'))
+    sql = ' '.join(compile_mysql(conditions))
+    assert relevance is None
+    assert 'LIKE' in sql and 'MATCH' not in sql
+    
+    conditions, relevance = backend.keyword_conditions(parse_query('Redis缓存'))
+    sql = ' '.join(compile_mysql(conditions))
+    assert relevance is not None
+    assert 'MATCH' in sql and 'LIKE' not in sql
+    
+    conditions, relevance = backend.keyword_conditions(parse_query('Redis缓存 学'))
+    assert relevance is not None
+    assert len(conditions) == 1
+    sql = compile_mysql(conditions)[0]
+    assert 'MATCH' in sql and 'LIKE' in sql and ' OR ' in sql
+    
+    conditions, _ = backend.keyword_conditions(parse_query('Redis缓存 学', search_mode='and'))
+    sql = compile_mysql(conditions)[0]
+    assert 'MATCH' in sql and 'LIKE' in sql and ' AND ' in sql
+
+def run_fulltext_migration(dialect_name):
+    spec = importlib.util.spec_from_file_location(
+        'fulltext_migration', os.path.join(MIGRATIONS, '0e991c142a0e_add_document_fulltext_index.py')
+    )
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    
+    buffer = io.StringIO()
+    context = MigrationContext.configure(dialect_name=dialect_name, opts={'as_sql': True, 'output_buffer': buffer})
+    with Operations.context(context):
+        migration.upgrade()
+        migration.downgrade()
+    return buffer.getvalue()
+
+def test_fulltext_migration_only_runs_on_mysql():
+    """测试全文索引迁移只在 MySQL 上生成 DDL"""
+    sql = run_fulltext_migration('mysql')
+    assert 'ADD FULLTEXT INDEX idx_document_fulltext' in sql
+    assert 'WITH PARSER ngram' in sql
+    assert 'DROP INDEX idx_document_fulltext' in sql
+    assert run_fulltext_migration('sqlite').strip() == ''
+
+def test_fulltext_model_index_skipped_outside_mysql(app):
+    """测试模型上的全文索引在 create_all 时只对 MySQL 生效"""
+    indexes = {index['name'] for index in inspect(db.engine).get_indexes('documents')}
+    assert 'idx_document_fulltext' not in indexes
+    
+    index = next(i for i in Document.__table__.indexes if i.name == 'idx_document_fulltext')
+    from sqlalchemy.schema import CreateIndex
+    ddl = str(CreateIndex(index).compile(dialect=mysql.dialect()))
+    assert 'FULLTEXT' in ddl and 'WITH PARSER ngram' in ddl
+
+def test_create_backend_by_name():
+    """测试按名称创建各搜索后端，未知名称报错"""
+    from app.services.search.backends import BACKENDS, create_backend
+    assert set(BACKENDS) == {'like', 'index', 'mysql_fulltext', 'sqlite_fts5'}
+    for name, backend_class in BACKENDS.items():
+        backend = create_backend(name)
+        assert isinstance(backend, backend_class)
+        assert backend.name == name
+    with pytest.raises(ValueError):
+        create_backend('elasticsearch')
+
+def test_get_backend_follows_config(app):
+    """测试 get_backend 按配置选择后端，缓存实例并完成初始化"""
+    seed()
+    service = SearchService()
+    
+    app.config['SEARCH_BACKEND'] = 'sqlite_fts5'
+    backend = service.get_backend()
+    assert backend.name == 'sqlite_fts5' and backend.initialized
+    assert service.get_backend() is backend
+    
+    app.config['SEARCH_BACKEND'] = 'like'
+    assert service.get_backend().name == 'like'
+    assert service.get_backend('sqlite_fts5') is backend
+    with pytest.raises(ValueError):
+        service.get_backend('unknown')
+
+def fts_backend():
+    from app.services.search.backends import create_backend
+    backend = create_backend('sqlite_fts5')
+    backend.ensure_initialized()
+    return backend
+
+def titles(documents):
+    return {doc.title for doc in documents}
+
+def test_fts5_trigram_query_matches_substrings(app):
+    """测试 trigram MATCH 检索词内子串并按 bm25 打分"""
+    seed()
+    backend = fts_backend()
+    
+    documents, total, scores = backend.query(parse_query('edis'))
+    assert titles(documents) == {'Redis缓存设计'} and total == 1
+    assert scores and all(score > 0 for score in scores.values())
+    
+    documents, total, scores = backend.query(parse_query('ython'))
+    assert titles(documents) == {'Python装饰器原理', '机器学习入门笔记', 'Redis缓存设计'}
+    assert set(scores) == {doc.id for doc in documents}
+    
+    documents, _, _ = backend.query(parse_query('Redis ython', search_mode='and'))
+    assert titles(documents) == {'Redis缓存设计'}
+
+def test_fts5_short_keywords_fall_back_to_like(app):
+    """测试少于3个字符的关键词使用 LIKE 并且不计算 bm25 分数"""
+    seed()
+    backend = fts_backend()
+    
+    documents, total, scores = backend.query(parse_query('学'))
+    assert titles(documents) == {'Python装饰器原理', '机器学习入门笔记'} and total == 2
+    assert scores is None
+    
+    documents, _, _ = backend.query(parse_query('会议'))
+    assert titles(documents) == {'项目会议总结'}
+    assert backend.count(parse_query('缓存 会议')) == 2
+    assert backend.suggest('会议') == ['项目会议总结']
+
+def test_fts5_keyset_cursor_pages_without_gaps(app):
+    """测试游标分页在创建时间相同时按ID续页，不重复不遗漏"""
+    same_day = [(f'缓存笔记{i}', 'Redis缓存', []) for i in range(5)]
+    for title, content, tags in same_day:
+        db.session.add(Document(title=title, content=content, tags=tags, created_at=datetime(2025, 2, 1)))
+    seed()
+    backend = fts_backend()
+    search_query = parse_query('缓存')
+    
+    for sort_by in ('date_desc', 'date_asc'):
+        seen = []
+        after = None
+        while True:
+            documents, has_more = backend.query_after(search_query, after, per_page=2, sort_by=sort_by)
+            seen.extend(doc.id for doc in documents)
+            if not has_more:
+                break
+            last = documents[-1]
+            after = (last.created_at, last.id)
+        
+        expected = Document.query.filter(Document.content.contains('缓存')).all()
+        expected.sort(key=lambda doc: (doc.created_at, doc.id), reverse=sort_by == 'date_desc')
+        assert seen == [doc.id for doc in expected]
@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+"""
+倒排索引测试
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app import db
+from app.models import Document
+from app.services.search import InvertedIndex, InvertedIndexBackend, BM25FScorer, SuggestionTrie, parse_query
+from app.services.search import pinyin
+from app.services.search.postings import PostingList
+from app.services.search.segments import SegmentStore, SegmentStoreReadOnly, merge_candidates
+from app.utils.helpers import extract_search_keywords, highlight_text
+
+def make_doc(doc_id, title, content, tags=None, day=1, category_id=None):
+    return SimpleNamespace(
+        id=doc_id,
+        title=title,
+        content=content,
+        tags=tags or [],
+        category_id=category_id,
+        created_at=datetime(2025, 1, day)
+    )
+
+def build_index():
+    index = InvertedIndex()
+    index.build([
+        make_doc(1, 'Python装饰器原理', '今天学习了Python装饰器的使用方法', ['Python'], day=1),
+        make_doc(2, '机器学习入门笔记', '监督学习和无监督学习的区别', ['机器学习'], day=2),
+        make_doc(3, 'Redis缓存设计', 'Redis适合做缓存，介绍缓存穿透', ['Redis', '缓存'], day=3),
+    ])
+    return index
+
+def test_or_and_match():
+    """测试OR/AND模式分别对应并集和交集"""
+    index = build_index()
+    
+    assert index.match(['Python', 'Redis'], mode='or') == {1, 3}
+    assert index.match(['Python', '学习'], mode='and') == {1}
+    assert index.match(['不存在'], mode='or') == set()
+
+def test_subword_and_tag_match():
+    """测试长词子词和完整标签都能命中"""
+    index = build_index()
+    
+    # “机器学习”在索引时会额外输出子词“学习”
+    assert 2 in index.match(['学习'])
+    assert index.match(['redis']) == {3}
+
+def test_incremental_update_and_remove():
+    """测试单文档更新和删除后倒排表保持一致"""
+    index = build_index()
+    
+    index.add_document(make_doc(3, 'MySQL索引优化', '聚簇索引与覆盖索引', ['MySQL'], day=3))
+    assert index.match(['Redis']) == set()
+    assert index.match(['MySQL']) == {3}
+    
+    assert index.remove_document(3)
+    assert index.match(['MySQL']) == set()
+    assert index.doc_freq('mysql') == 0
+    assert index.stats()['documents'] == 2
+
+def test_top_ids_sorting():
+    """测试按时间和标题排序的堆选择"""
+    index = build_index()
+    ids = index.all_ids()
+    
+    assert index.top_ids(ids, 'date_desc', 2) == [3, 2]
+    assert index.top_ids(ids, 'date_asc', 1) == [1]
+
+def test_bm25f_ranks_title_matches_first():
+    """测试BM25F对全部候选打分，标题命中排在正文命中之前"""
+    index = build_index()
+    index.add_document(make_doc(4, '缓存与Python', '介绍Redis', day=4))
+    scorer = BM25FScorer(index)
+    
+    terms = index.query_terms(['Redis'])
+    candidates = index.match(['Redis'])
+    ranked = scorer.top_k(terms, candidates, 1)
+    
+    assert candidates == {3, 4}
+    assert [doc_id for doc_id, _ in ranked] == [3]
+    assert ranked[0][1] > scorer.score_candidates(terms, candidates)[4]
+
+def test_maxscore_top_k_matches_exhaustive_ranking():
+    """测试MaxScore剪枝的结果与全量打分一致，且只对部分文档打分"""
+    import random
+    rng = random.Random(7)
+    words = ['学习', '项目', '缓存', '数据库', '架构', '测试', '部署', '算法']
+    index = InvertedIndex()
+    index.build([
+        make_doc(i, ''.join(rng.sample(words, 2)), '，'.join(rng.choices(words[:3], k=20)) + rng.choice(words))
+        for i in range(1, 301)
+    ])
+    scorer = BM25FScorer(index)
+    
+    for keywords in (['学习', '数据库'], ['学习', '算法', '部署']):
+        terms = index.query_terms(keywords)
+        candidates = index.match(keywords)
+        scores = scorer.score_candidates(terms, candidates)
+        expected = sorted(scores.items(), key=lambda item: (item[1], item[0]), reverse=True)[:10]
+        trace = []
+        ranked = scorer.top_k(terms, candidates, 10, trace=trace)
+        assert [doc_id for doc_id, _ in ranked] == [doc_id for doc_id, _ in expected]
+        assert trace[0]['scored'] < len(candidates)
+    
+    # 新增文档后上界缓存失效，结果仍然正确
+    index.add_document(make_doc(301, '算法', '算法 算法 算法', day=2))
+    ranked = scorer.top_k(index.query_terms(['算法']), index.match(['算法']), 1)
+    assert ranked[0][0] == 301
+
+def test_compressed_postings_match_dict_semantics():
+    """测试压缩倒排表在增删、合并后与字典一致，游标和求交可以跳块"""
+    import random
+    rng = random.Random(1)
+    postings = PostingList(3)
+    expected = {}
+    for _ in range(5000):
+        doc_id = rng.randint(1, 2000)
+        if rng.random() < 0.7:
+            freqs = (rng.randint(0, 3), rng.randint(0, 1), rng.randint(0, 70000))
+            postings.add(doc_id, freqs)
+            expected[doc_id] = freqs
+        else:
+            assert postings.remove(doc_id) == (doc_id in expected)
+            expected.pop(doc_id, None)
+    
+    assert len(postings) == len(expected)
+    assert dict(postings.items()) == expected
+    cursor = postings.cursor()
+    probes = sorted(rng.sample(range(1, 2001), 200))
+    assert [cursor.advance(doc_id) for doc_id in probes] == [expected.get(doc_id) for doc_id in probes]
+    candidates = set(probes[:20])
+    assert postings.intersect(candidates) == candidates & expected.keys()
+    
+    postings.compact()
+    assert postings.pending_count() == 0
+    assert postings.doc_ids() == set(expected)
+    assert postings.nbytes() < 24 * len(expected)
+
+def test_segments_flush_merge_and_reload(tmp_path):
+    """测试内存段落盘、段内删除标记、合并以及重新映射加载后检索结果不变"""
+    store = SegmentStore(str(tmp_path))
+    index = build_index()
+    assert index.flush(store) is not None
+    for doc_id, title in ((4, 'Redis集群'), (5, 'Python爬虫'), (6, '缓存淘汰策略')):
+        index.add_document(make_doc(doc_id, title, f'{title}的学习笔记', day=doc_id))
+        index.flush(store)
+    
+    index.add_document(make_doc(3, 'MySQL索引优化', '聚簇索引与覆盖索引', ['MySQL'], day=3))
+    index.remove_document(5)
+    expected = {keyword: index.match([keyword]) for keyword in ('Redis', 'Python', '缓存', '索引', '学习')}
+    assert expected['Redis'] == {4}
+    assert index.match_phrase([('聚簇', 0), ('索引', 1)]) == {3}
+    assert index.term_offsets(1, ['使用']) == [(15, 17)]
+    
+    # 先单独清除只剩已删除文档的段，再逐层合并
+    assert merge_candidates(index.segments, 2) == index.segments[2:3]
+    while True:
+        candidates = merge_candidates(index.segments, 2)
+        if not candidates:
+            break
+        assert index.merge(candidates, store)
+    assert len(index.segments) == 1 and index.segments[0].doc_count == 4
+    assert {keyword: index.match([keyword]) for keyword in expected} == expected
+    
+    index.flush(store)
+    reloaded = InvertedIndex()
+    reloaded.attach_segments(store.open_segments())
+    assert reloaded.all_ids() == {1, 2, 3, 4, 6}
+    assert {keyword: reloaded.match([keyword]) for keyword in expected} == expected
+    assert reloaded.top_ids(reloaded.all_ids(), 'date_desc', 2) == [6, 4]
+    assert len([name for name in os.listdir(tmp_path) if name.endswith('.seg')]) == 2
+
+def test_segment_bloom_filters_skip_missing_terms(tmp_path):
+    """测试段和分类布隆过滤器：不存在的词不查词典，分类中没有的词直接判定不命中"""
+    backend = InvertedIndexBackend()
+    backend.index.build([
+        make_doc(1, 'Python装饰器原理', '今天学习了Python装饰器', ['Python'], category_id=1),
+        make_doc(2, 'Redis缓存设计', 'Redis适合做缓存', ['Redis'], category_id=2),
+    ])
+    backend.index.flush(SegmentStore(str(tmp_path)))
+    segment = backend.index.segments[0]
+    
+    assert backend.index.match(['Pythn']) == set()
+    assert segment.stats['bloom_rejections'] >= 1 and segment.stats['dictionary_lookups'] == 0
+    assert backend.index.match(['Python']) == {1}
+    assert segment.category_might_contain(2, 'redis') and not segment.category_might_contain(1, 'redis')
+    
+    search_query = parse_query('Redis category:技术')
+    search_query.category_id = 1
+    trace = backend.explain(search_query)
+    assert trace == [{'step': 'category:技术', 'strategy': 'bloom', 'matched': 0}]
+    search_query.category_id = 2
+    assert backend._match(search_query) == {2}
+
+def test_segment_store_readers_share_directory(tmp_path):
+    """测试同一目录只有一个写入者：两个只读 SegmentStore 映射清单中的段、恢复删除标记并发现清单变化"""
+    writer = SegmentStore(str(tmp_path))
+    readers = [SegmentStore(str(tmp_path)), SegmentStore(str(tmp_path))]
+    assert writer.writable and not any(store.writable for store in readers)
+    
+    index = build_index()
+    index.flush(writer)
+    index.add_document(make_doc(3, 'MySQL索引优化', '聚簇索引与覆盖索引', ['MySQL'], day=3))
+    index.remove_document(2)
+    index.flush(writer)
+    writer.save_deletes(index.deleted_documents())
+    (tmp_path / 'stray.seg.tmp').write_bytes(b'')
+    
+    for store in readers:
+        reader = InvertedIndex()
+        reader.attach_segments(store.open_segments())
+        # 删除标记来自清单，而不是持有段的写入者的内存
+        assert reader.segments[0].deleted == {2, 3}
+        assert reader.all_ids() == {1, 3} and reader.memory_size() == 0
+        assert reader.match(['MySQL']) == {3} and reader.match(['Redis']) == set()
+        assert not store.changed()
+        with pytest.raises(SegmentStoreReadOnly):
+            store.save_deletes(index.deleted_documents())
+        with pytest.raises(SegmentStoreReadOnly):
+            store.drop(reader.segments)
+    assert (tmp_path / 'stray.seg.tmp').exists()
+    
+    index.add_document(make_doc(4, 'Redis集群', '主从复制'))
+    index.flush(writer)
+    assert all(store.changed() for store in readers)
+    reader = InvertedIndex()
+    reader.attach_segments(readers[0].open_segments())
+    assert reader.all_ids() == {1, 3, 4} and not readers[0].changed()
+    
+    writer.close()
+    with pytest.raises(RuntimeError):
+        writer.open_segments()
+    assert readers[0].acquire() and not readers[1].acquire()
+    readers[0].open_segments()
+    assert not (tmp_path / 'stray.seg.tmp').exists()
+    for store in readers:
+        store.close()
+
+def test_backend_readers_follow_writer(app, tmp_path):
+    """测试共享段目录的后端：写入者落盘后只读进程重新载入，比段新的文档只留在只读进程的内存段中，
+    写入者退出后由只读进程接替"""
+    app.config.update(SEARCH_INDEX_DIR=str(tmp_path), SEARCH_INDEX_RELOAD_INTERVAL=0)
+    redis = Document(title='Redis缓存设计', content='缓存穿透', tags=[], created_at=datetime(2025, 1, 1))
+    python = Document(title='Python装饰器', content='闭包', tags=[], created_at=datetime(2025, 1, 2))
+    db.session.add_all([redis, python])
+    db.session.commit()
+    
+    writer = InvertedIndexBackend()
+    writer.ensure_initialized()
+    readers = [InvertedIndexBackend(), InvertedIndexBackend()]
+    try:
+        for reader in readers:
+            reader.ensure_initialized()
+            assert not reader.store.writable and reader.maintainer is None
+            assert reader.index.memory_size() == 0 and reader.index.all_ids() == {redis.id, python.id}
+        assert writer.store.writable and writer.maintainer is not None
+        
+        redis.content = '消息队列'
+        kafka = Document(title='Kafka入门', content='消息队列', tags=[], created_at=datetime(2025, 1, 3))
+        db.session.add(kafka)
+        db.session.commit()
+        # 清单没有变化时不重新载入
+        readers[0].ensure_initialized()
+        assert readers[0].reloads == 1 and readers[0].index.match(['穿透']) == {redis.id}
+        
+        # 写入者从数据库补齐其他进程的变更并落盘
+        writer.maintainer.run_once()
+        python.content = '生成器'
+        db.session.commit()
+        for reader in readers:
+            reader.ensure_initialized()
+            assert reader.reloads == 2
+            assert reader.index.match(['穿透']) == set()
+            assert reader.index.match(['队列']) == {redis.id, kafka.id}
+            # 旧版本的删除标记来自清单，本进程内存段中的新版本另行覆盖
+            assert reader.index.segments[0].deleted == {redis.id, python.id}
+            assert reader.index.memory_ids == {python.id}
+            assert reader.index.match(['生成器']) == {python.id}
+        
+        writer.maintainer.stop()
+        writer.store.close()
+        readers[0].ensure_initialized()
+        assert readers[0].store.writable and readers[0].maintainer is not None
+        assert readers[0].index.memory_size() == 0
+        readers[1].ensure_initialized()
+        assert not readers[1].store.writable and readers[1].index.memory_ids == set()
+        assert readers[1].index.match(['生成器']) == {python.id}
+    finally:
+        for backend in [writer] + readers:
+            if backend.maintainer is not None:
+                backend.maintainer.stop()
+            backend.store.close()
+
+def test_keyset_ids_pages_without_overlap():
+    """测试游标分页逐页取数不重复、不遗漏"""
+    index = build_index()
+    index.add_document(make_doc(4, '同一天的文档', '内容', day=3))
+    ids = index.all_ids()
+    
+    first = index.keyset_ids(ids, None, 2)
+    second = index.keyset_ids(ids, (datetime(2025, 1, 3), first[-1]), 2)
+    
+    assert first == [4, 3]
+    assert second == [2, 1]
+    assert index.keyset_ids(ids, (datetime(2025, 1, 1), 1), 2) == []
+
+def test_suggestion_trie_popularity_and_updates():
+    """测试前缀补全按热度排序，并随文档增删更新"""
+    trie = SuggestionTrie()
+    trie.build([
+        make_doc(1, 'Python装饰器原理', '', ['Python']),
+        make_doc(2, 'Python并发编程', '', ['Python']),
+        make_doc(3, 'PyTorch入门', '', ['深度学习']),
+    ])
+    
+    # 标签“Python”被两篇文档使用，排在单篇文档的标题之前
+    assert trie.complete('py', 10)[0] == 'Python'
+    assert trie.complete('pyto') == ['PyTorch', 'PyTorch入门']
+    
+    trie.remove_document(3)
+    assert trie.complete('pyto') == []
+    
+    trie.add_document(make_doc(4, 'PyTorch实战', '', []))
+    trie.record_hit('PyTorch实战')
+    assert trie.complete('pyto', 1) == ['PyTorch实战']
+
+def test_query_analysis_segments_chinese_phrases():
+    """测试查询分词：OR模式保留原短语，AND模式只保留词项，停用词被去除"""
+    assert extract_search_keywords('机器学习入门') == ['机器学习入门', '机器学习', '入门']
+    assert extract_search_keywords('机器学习入门', 'and') == ['机器学习', '入门']
+    assert extract_search_keywords('的 缓存') == ['缓存']
+
+def test_single_cjk_character_matches_longer_terms():
+    """测试单个汉字的查询词能命中包含它的词项"""
+    index = build_index()
+    
+    assert index.match(['穿'], mode='or') == {3}
+    index.remove_document(3)
+    assert index.match(['穿'], mode='or') == set()
+
+def test_highlight_uses_best_window():
+    """测试高亮只在命中最集中的窗口内进行"""
+    text = '无关内容' * 100 + 'Redis缓存穿透' + '结尾' * 100
+    
+    snippet = highlight_text(text, ['redis', '缓存'], max_length=60)
+    assert snippet.startswith('...') and snippet.endswith('...')
+    assert '<mark>Redis</mark><mark>缓存</mark>' in snippet
+    
+    start = text.index('Redis')
+    assert '<mark>Redis</mark>' in highlight_text(text, ['Redis'], 60, offsets=[(start, start + 5)])
+
+def test_phrase_and_proximity_match():
+    """测试短语要求相邻、邻近查询允许间隔"""
+    index = InvertedIndex()
+    index.build([
+        make_doc(1, '缓存设计', 'Redis 缓存 穿透 的 解决 方案'),
+        make_doc(2, '缓存设计', 'Redis 集群 部署 以及 缓存 配置'),
+    ])
+    
+    phrase = parse_query('"Redis 缓存"').phrases[0]
+    assert index.match_phrase(phrase.terms) == {1}
+    
+    near = parse_query('"Redis 缓存"~4').phrases[0]
+    assert index.match_phrase(near.terms, near.slop) == {1, 2}
+    
+    # 重复的词项需要各自的位置，一次出现不能同时满足两个
+    index.build([
+        make_doc(1, '笔记', '数据 清洗'),
+        make_doc(2, '笔记', '数据 清洗 之后 的 数据'),
+        make_doc(3, '笔记', '数据 清洗 以及 后续 的 建模 和 报表 里 的 数据'),
+    ])
+    repeated = parse_query('"数据 数据"~3').phrases[0]
+    assert index.match_phrase(repeated.terms, repeated.slop) == {2}
+    
+    index.build([make_doc(1, '缓存设计', 'Redis 缓存 穿透 的 解决 方案')])
+    start = 'Redis 缓存 穿透'.index('穿透')
+    assert index.term_offsets(1, ['穿透']) == [(start, start + 2)]
+
+def test_query_dsl_execution_plan():
+    """测试字段限定、标签、分类、时间和排除条件的执行计划"""
+    backend = InvertedIndexBackend()
+    backend.index.build([
+        make_doc(1, 'Python装饰器原理', '今天学习了Python装饰器', ['Python'], day=1, category_id=1),
+        make_doc(2, '机器学习笔记', '用Python做监督学习', ['机器学习', 'Python'], day=2, category_id=2),
+        make_doc(3, 'Python缓存草稿', 'Redis缓存', ['Redis'], day=3, category_id=1),
+    ])
+    
+    def match(text, category_id=None):
+        search_query = parse_query(text)
+        search_query.category_id = category_id
+        return backend._match(search_query)
+    
+    assert match('title:Python') == {1, 3}
+    assert match('tag:python') == {1, 2}
+    assert match('Python -草稿') == {1, 2}
+    assert match('Python category:技术', category_id=1) == {1, 3}
+    assert match('after:2025-01-02 before:2025-01-03') == {2}
+    
+    # 候选集小于分类命中集时逐文档检查，不再物化分类集合
+    search_query = parse_query('title:草稿 category:技术')
+    search_query.category_id = 1
+    plan = backend.explain(search_query)
+    assert [step['strategy'] for step in plan[:2]] == ['postings', 'check']
+    assert plan[1]['matched'] == 1
+    
+    backend.index.remove_document(3)
+    assert match('category:技术', category_id=1) == {1}
+    assert match('after:2025-01-03') == set()
+
+def test_facet_counts_follow_match_set():
+    """测试分面计数只统计匹配集合，并随增删更新"""
+    index = build_index()
+    index.add_document(make_doc(4, 'Redis集群', 'Redis主从复制', ['redis'], day=4, category_id=2))
+    
+    facets = index.facet_counts(index.match(['Redis']))
+    assert facets['tags'][0] == ('Redis', 2)
+    assert facets['category'] == {None: 1, 2: 1}
+    
+    index.remove_document(3)
+    facets = index.facet_counts(index.match(['Redis']))
+    assert [(tag.lower(), count) for tag, count in facets['tags']] == [('redis', 1)]
+    assert facets['category'] == {2: 1}
+
+def test_fuzzy_expansion_corrects_misspelled_terms():
+    """测试词表外的英文词按编辑距离扩展为最近的词表词项，并按词项缓存"""
+    backend = InvertedIndexBackend()
+    backend.index.build([
+        make_doc(1, 'Python装饰器原理', '今天学习了Python装饰器', ['Python'], day=1),
+        make_doc(2, 'Redis缓存设计', 'Redis适合做缓存', ['Redis'], day=2),
+    ])
+    index = backend.index
+    
+    assert index.fuzzy_alternatives(['Pyhton', 'Reddis', 'Python']) == {
+        'Pyhton': ['python'], 'Reddis': ['redis']
+    }
+    assert index.fuzzy_alternatives(['kubernetes']) == {}
+    
+    search_query = parse_query('Pyhton')
+    assert backend._match(search_query) == set()
+    backend.expand(search_query)
+    assert backend._match(search_query) == {1}
+    
+    index.fuzzy_alternatives(['Pyhton'])
+    assert index.fuzzy.get_stats()['cache_hits'] >= 2
+
+def test_pinyin_and_initials_resolve_to_chinese_terms():
+    """测试全拼和首字母输入解析为标题/标签中的中文词项，前缀补全同样支持拼音"""
+    pytest.importorskip('pypinyin')
+    backend = InvertedIndexBackend()
+    backend.index.build([
+        make_doc(1, '机器学习入门笔记', '监督学习和无监督学习', ['机器学习'], day=1),
+        make_doc(2, 'Redis缓存设计', '介绍缓存穿透', ['Redis'], day=2),
+    ])
+    
+    assert backend.index.fuzzy_alternatives(['jqxx', 'jiqixuexi', 'huancun']) == {
+        'jqxx': ['机器学习'], 'jiqixuexi': ['机器学习'], 'huancun': ['缓存']
+    }
+    search_query = parse_query('jqxx')
+    backend.expand(search_query)
+    assert backend._match(search_query) == {1}
+    
+    trie = SuggestionTrie()
+    trie.build([make_doc(1, '机器学习入门笔记', '', ['机器学习']), make_doc(2, '机械设计', '', [])])
+    assert trie.complete('jqxx') == ['机器学习', '机器学习入门笔记']
+    assert trie.complete('jixie') == ['机械设计']
+    assert '机器学习入门笔记' in trie.complete('jiqi', 10)
+
+def test_suggestion_trie_handles_long_titles():
+    """测试标题长度上限（255字）的中文标题：构建不触发递归深度限制，拼音只转写开头几个字"""
+    title = '机器学习' + '深度神经网络模型训练' * 25 + '笔'
+    trie = SuggestionTrie()
+    trie.build([make_doc(1, title, '', []), make_doc(2, '机器人', '', [])])
+    
+    assert trie.built_at is not None
+    assert trie.complete('机器学习深度', 1) == [title]
+    if pinyin.available():
+        assert title in trie.complete('jiqixuexi', 10)
+        assert trie.complete('jiqixuexishendushenjingwangluomoxingxunlian') == []
+        assert max(len(key) for key in trie.doc_counts) < len(title) + 50
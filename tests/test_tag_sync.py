@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+标签同步测试
+Document.tags 的新增、修改、删除同步到 tags / document_tags 表，以及 tag: 过滤
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+
+from sqlalchemy import event, insert, select
+
+from app import db
+from app.models import Document, Tag, document_tags
+from app.services.search.backends.base import filter_conditions
+from app.services.search.query import parse_query
+from app.services.tag_sync import tag_sync
+
+def add_document(title, tags):
+    document = Document(title=title, content='', tags=tags, created_at=datetime(2025, 1, 1))
+    db.session.add(document)
+    return document
+
+def linked_tags(document_id):
+    """关联表中该文档的规范化标签"""
+    rows = db.session.execute(
+        select(Tag.normalized).join(document_tags, document_tags.c.tag_id == Tag.id)
+        .where(document_tags.c.document_id == document_id)
+    ).all()
+    return {row.normalized for row in rows}
+
+def all_tags():
+    return {tag.normalized: tag.name for tag in Tag.query.all()}
+
+def test_create_update_delete_sync_associations(app):
+    """测试新增、修改、删除文档时关联随 tags 列同步，大小写不同的标签复用同一行"""
+    first = add_document('Python装饰器', ['Python', ' python ', 'Redis'])
+    second = add_document('缓存设计', ['REDIS', '缓存'])
+    db.session.commit()
+    
+    assert linked_tags(first.id) == {'python', 'redis'}
+    assert linked_tags(second.id) == {'redis', '缓存'}
+    assert all_tags() == {'python': 'Python', 'redis': 'Redis', '缓存': '缓存'}
+    
+    first.tags = ['Redis', 'Kafka']
+    db.session.commit()
+    assert linked_tags(first.id) == {'redis', 'kafka'}
+    assert set(all_tags()) == {'python', 'redis', '缓存', 'kafka'}
+    
+    first.title = '只改标题'
+    db.session.commit()
+    assert linked_tags(first.id) == {'redis', 'kafka'}
+    
+    first_id = first.id
+    db.session.delete(first)
+    db.session.commit()
+    assert linked_tags(first_id) == set()
+    assert linked_tags(second.id) == {'redis', '缓存'}
+
+def test_tag_inserted_concurrently_is_reused(app, monkeypatch):
+    """测试查询标签之后、插入之前另一个事务写入了同一个新标签时复用该行"""
+    original = tag_sync._insert_ignoring_duplicates
+    
+    def insert_after_concurrent_writer(session, rows):
+        # 模拟并发请求在本次查询之后插入了同一个规范化标签
+        session.execute(insert(Tag).values(name='Kafka', normalized='kafka'))
+        return original(session, rows)
+    
+    monkeypatch.setattr(tag_sync, '_insert_ignoring_duplicates', insert_after_concurrent_writer)
+    document = add_document('消息队列', ['kafka', 'RabbitMQ'])
+    db.session.commit()
+    
+    assert linked_tags(document.id) == {'kafka', 'rabbitmq'}
+    assert all_tags() == {'kafka': 'Kafka', 'rabbitmq': 'RabbitMQ'}
+
+def test_backfill_restores_missing_associations(app):
+    """测试 backfill 补建缺失的关联，并且批量加载关联而不是逐个文档查询"""
+    for i in range(20):
+        add_document(f'文档{i}', ['Python', f'标签{i % 3}'])
+    db.session.commit()
+    db.session.execute(document_tags.delete())
+    db.session.commit()
+    db.session.expire_all()
+    
+    statements = []
+    
+    def count_select(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+    
+    event.listen(db.engine, 'before_cursor_execute', count_select)
+    try:
+        assert tag_sync.backfill(db.session, batch_size=8) == 20
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count_select)
+    
+    # 每批：文档、关联预加载、标签查询，与批内文档数无关；最后一次查询没有文档
+    assert len(statements) == 3 * 3 + 1
+    for document in Document.query.all():
+        assert linked_tags(document.id) == {tag.lower() for tag in document.tags}
+    assert tag_sync.backfill(db.session) == 0
+
+def test_tag_filter_uses_associations(app):
+    """测试 tag: 过滤按关联表匹配完整标签（不区分大小写），排除关键词时也排除带该标签的文档"""
+    add_document('Python装饰器', ['Python'])
+    add_document('缓存设计', ['Redis', '缓存'])
+    add_document('Redis源码', [])
+    db.session.commit()
+    
+    def titles(text):
+        query = Document.query.filter(*filter_conditions(parse_query(text)))
+        return {document.title for document in query}
+    
+    assert titles('tag:redis') == {'缓存设计'}
+    assert titles('tag:PYTHON') == {'Python装饰器'}
+    assert titles('tag:Redis tag:缓存') == {'缓存设计'}
+    assert titles('tag:Red') == set()
+    assert titles('-Redis') == {'Python装饰器'}
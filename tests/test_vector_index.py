@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+语料向量索引测试
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.services.ai.ann_index import LSHIndex, recall_report
+from app.services.ai.vector_index import COMPACT_RATIO, CorpusVectors, max_similarity, nearest_neighbors, top_k_indices
+
+DOCUMENTS = [
+    (1, 'Python装饰器原理 Python装饰器的使用方法和闭包'),
+    (2, '机器学习入门笔记 监督学习和无监督学习的区别'),
+    (3, 'Redis缓存设计 Redis适合做缓存，介绍缓存穿透和缓存雪崩'),
+    (4, '深度学习框架对比 PyTorch和TensorFlow的机器学习实践'),
+]
+
+def test_top_k_indices_matches_full_sort():
+    """测试 argpartition 选出的top-k与完整排序一致"""
+    scores = np.random.RandomState(0).rand(1000)
+    assert list(top_k_indices(scores, 10)) == list(np.argsort(-scores)[:10])
+    assert list(top_k_indices(scores[:5], 10)) == list(np.argsort(-scores[:5]))
+
+def test_search_ranks_by_cosine_and_tracks_updates():
+    """测试查询按余弦相似度排序，文档增删改不重新拟合词表"""
+    corpus = CorpusVectors()
+    corpus.fit(DOCUMENTS)
+    vocabulary = dict(corpus.vectorizer.vocabulary_)
+    
+    results = corpus.search('Redis缓存', top_k=2)
+    assert results[0][0] == 3
+    assert 0 < results[0][1] <= 1
+    assert [doc_id for doc_id, _ in corpus.search('机器学习', top_k=5)][:2] in ([2, 4], [4, 2])
+    assert corpus.search('kubernetes') == []
+    
+    corpus.upsert(5, 'Redis集群 Redis主从复制和缓存')
+    corpus.upsert(3, '已改写的文档 与存储无关')
+    corpus.remove(1)
+    assert corpus.search('Redis缓存', top_k=1)[0][0] == 5
+    assert 1 not in [doc_id for doc_id, _ in corpus.search('Python装饰器')]
+    assert corpus.vectorizer.vocabulary_ == vocabulary
+    assert len(corpus) == 4
+    
+    # 失效行过多时压缩，行号重新对应
+    for doc_id in (2, 4):
+        corpus.remove(doc_id)
+    assert corpus.search('Redis', top_k=3)[0][0] == 5
+    assert corpus.stats()['dead_rows'] == 0
+    assert sorted(corpus.rows) == [3, 5]
+
+def test_document_vectors_and_similarity_matrix():
+    """测试按文档ID取向量（缺失文档为零行）和N×M相似度矩阵"""
+    corpus = CorpusVectors()
+    corpus.fit(DOCUMENTS)
+    
+    vectors, missing = corpus.document_vectors([3, 99, 1])
+    assert missing == [99]
+    assert vectors[1].nnz == 0
+    
+    queries = corpus.transform(['Redis缓存穿透', 'Python装饰器'])
+    matrix = corpus.similarity(queries, vectors)
+    assert matrix.shape == (2, 3)
+    assert matrix[0].argmax() == 0 and matrix[1].argmax() == 2
+    assert matrix[:, 1].tolist() == [0, 0]
+    assert np.isclose(corpus.similarity(vectors[:1], vectors[:1])[0, 0], 1.0)
+
+def test_nearest_neighbors_chunked_matches_brute_force():
+    """测试分块计算的近邻与整体计算一致，且不包含文档自身"""
+    corpus = CorpusVectors()
+    corpus.fit(DOCUMENTS + [(5, 'Redis集群 Redis主从复制和缓存'), (6, 'Python闭包 闭包与装饰器')])
+    matrix, doc_ids = corpus.snapshot()
+    
+    # 内存上限很小时每块只有一行
+    chunks = list(nearest_neighbors(matrix, doc_ids, matrix, doc_ids, 2, memory_budget=1))
+    assert len(chunks) == len(doc_ids)
+    
+    dense = corpus.similarity(matrix, matrix)
+    for query_id, neighbors in (item for chunk in chunks for item in chunk):
+        row = list(doc_ids).index(query_id)
+        expected = [
+            (int(doc_ids[column]), dense[row, column])
+            for column in np.argsort(-dense[row], kind='stable')
+            if doc_ids[column] != query_id and dense[row, column] > 0
+        ][:2]
+        assert [doc_id for doc_id, _ in neighbors] == [doc_id for doc_id, _ in expected]
+        assert np.allclose([score for _, score in neighbors], [score for _, score in expected])
+    
+    assert dict(item for chunk in chunks for item in chunk)[3][0][0] == 5
+
+def test_max_similarity_chunked_matches_brute_force():
+    """测试分块计算的最大相似度与整体计算一致，且不计文档与自身的相似度"""
+    corpus = CorpusVectors()
+    corpus.fit(DOCUMENTS + [(5, 'Redis集群 Redis主从复制和缓存'), (6, 'Python闭包 闭包与装饰器')])
+    matrix, doc_ids = corpus.snapshot()
+    queries = [1, 3]
+    rows = [list(doc_ids).index(doc_id) for doc_id in queries]
+    
+    best = max_similarity(matrix[rows], queries, matrix, doc_ids, memory_budget=1)
+    assert best.shape == (len(doc_ids),)
+    
+    dense = corpus.similarity(matrix[rows], matrix)
+    for i, row in enumerate(rows):
+        dense[i, row] = 0.0
+    assert np.allclose(best, dense.max(axis=0))
+
+def _topic_documents(count, seed=0):
+    """按主题生成的文档：同主题的文档共享词汇"""
+    rng = np.random.RandomState(seed)
+    topics = [[f'topic{topic}word{word}' for word in range(20)] for topic in range(30)]
+    return [
+        (doc_id, ' '.join(rng.choice(topics[rng.randint(len(topics))], 12)))
+        for doc_id in range(1, count + 1)
+    ]
+
+def test_lsh_index_approximates_exact_search():
+    """测试近似查询的召回率随 probes 提高，小语料不建索引，增删文档同步到索引"""
+    documents = _topic_documents(600)
+    corpus = CorpusVectors(ann=LSHIndex(dimensions=16, tables=6, min_documents=100))
+    corpus.fit(documents)
+    assert corpus.ann.built
+    
+    matrix, doc_ids = corpus.snapshot()
+    queries = [(int(doc_ids[row]), matrix[row]) for row in range(0, 600, 30)]
+    report = recall_report(corpus, queries, top_k=5, probes=(0, 4))
+    low, high = report['settings']
+    assert low['candidates'] <= high['candidates'] < len(documents)
+    assert high['recall'] >= low['recall'] and high['recall'] >= 0.9
+    
+    corpus.upsert(1000, documents[0][1])
+    assert 1000 in corpus.ann.candidates(matrix[0])
+    assert 1000 in [doc_id for doc_id, _ in corpus.search_vector(matrix[0], 3, probes=4)]
+    corpus.remove(1000)
+    assert 1000 not in corpus.ann.candidates(matrix[0])
+    
+    small = CorpusVectors(ann=LSHIndex(min_documents=100))
+    small.fit(documents[:50])
+    assert not small.ann.built
+    query = small.transform([documents[0][1]])
+    assert small.search_vector(query, 3) == small.search_vector(query, 3, exact=True)
+    assert small.search_vector(query, 3)[0][0] == 1
+
+def test_lsh_index_compacts_dead_rows():
+    """测试反复更新同一批文档时失效行被压缩，行数有上限且候选结果不受影响"""
+    documents = _topic_documents(200)
+    corpus = CorpusVectors(ann=LSHIndex(dimensions=16, tables=4, min_documents=100))
+    corpus.fit(documents)
+    ann = corpus.ann
+    
+    for _ in range(5):
+        for doc_id, text in documents[:60]:
+            corpus.upsert(doc_id, text)
+        rows = len(ann.doc_ids) + len(ann.pending_ids)
+        assert rows <= len(documents) / (1 - COMPACT_RATIO) + 1
+        assert ann.dead <= COMPACT_RATIO * rows
+    
+    assert len(ann) == len(documents)
+    assert sorted(ann.rows) == [doc_id for doc_id, _ in documents]
+    matrix, doc_ids = corpus.snapshot()
+    for row in range(0, 200, 25):
+        assert int(doc_ids[row]) in ann.candidates(matrix[row])
+    
+    corpus.remove(documents[0][0])
+    assert documents[0][0] not in ann.candidates(matrix[0])